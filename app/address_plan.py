@@ -0,0 +1,202 @@
+# app/address_plan.py
+"""Tách địa chỉ AU thành các phần + lập thứ tự biến thể query cho search.
+
+- `parse_address`: unit, số nhà, tên + loại đường (chuẩn hoá "Street" -> "St"), suburb, bang, postcode.
+- `plan_queries`: biến thể theo "shape", từ cụ thể nhất tới rộng nhất; thứ tự chỉnh dần theo tỉ lệ
+  có kết quả của từng shape (ShapeStats), nên shape hay trượt tự tụt xuống cuối.
+"""
+import json, os, re, threading, time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from app import config
+
+# ---- Config ------------------------------------------------------------------
+SEARCH_SHAPE_STATS_PATH = getattr(config, "SEARCH_SHAPE_STATS_PATH", "")  # "" -> chỉ học trong RAM
+# -----------------------------------------------------------------------------
+
+STREET_TYPES = {
+    "street": "St", "st": "St", "road": "Rd", "rd": "Rd", "avenue": "Ave", "ave": "Ave", "av": "Ave",
+    "drive": "Dr", "dr": "Dr", "court": "Ct", "ct": "Ct", "place": "Pl", "pl": "Pl",
+    "crescent": "Cres", "cres": "Cres", "cr": "Cres", "lane": "Ln", "ln": "Ln", "parade": "Pde", "pde": "Pde",
+    "terrace": "Tce", "tce": "Tce", "highway": "Hwy", "hwy": "Hwy", "boulevard": "Blvd", "blvd": "Blvd",
+    "boulevarde": "Blvd", "close": "Cl", "cl": "Cl", "circuit": "Cct", "cct": "Cct", "way": "Way",
+    "grove": "Gr", "gr": "Gr", "square": "Sq", "sq": "Sq", "esplanade": "Esp", "esp": "Esp",
+    "parkway": "Pkwy", "pkwy": "Pkwy", "rise": "Rise", "walk": "Walk", "mews": "Mews", "row": "Row",
+    "circle": "Cir", "cir": "Cir", "quay": "Qy", "qy": "Qy", "promenade": "Prom", "prom": "Prom",
+    "boardwalk": "Bwk", "loop": "Loop", "glade": "Gld", "gardens": "Gdns", "gdns": "Gdns",
+    "heights": "Hts", "hts": "Hts", "view": "Vw", "vw": "Vw", "track": "Trk", "trail": "Trl",
+}
+STATES = {
+    "nsw": "NSW", "new south wales": "NSW", "vic": "VIC", "victoria": "VIC", "qld": "QLD",
+    "queensland": "QLD", "sa": "SA", "south australia": "SA", "wa": "WA", "western australia": "WA",
+    "tas": "TAS", "tasmania": "TAS", "nt": "NT", "northern territory": "NT", "act": "ACT",
+    "australian capital territory": "ACT",
+}
+_UNIT_WORD = re.compile(r"^\s*(?:unit|u|apartment|apt|flat|suite|shop|villa|townhouse)\s*(\w+)\s*[,/]?\s*", re.I)
+_UNIT_SLASH = re.compile(r"^\s*(\w+)\s*/\s*(?=\d)")
+_NUMBER = re.compile(r"^\s*(\d+[a-z]?(?:\s*-\s*\d+[a-z]?)?)\b\s*,?\s*", re.I)
+_POSTCODE = re.compile(r"\b(\d{4})\s*$")
+_STATE = re.compile(r"\b(" + "|".join(sorted(map(re.escape, STATES), key=len, reverse=True)) + r")\s*$", re.I)
+
+
+@dataclass
+class ParsedAddress:
+    raw: str
+    unit: Optional[str] = None
+    number: Optional[str] = None
+    street: Optional[str] = None       # tên đường, không kèm loại ("George")
+    street_type: Optional[str] = None  # dạng viết tắt chuẩn ("St")
+    suburb: Optional[str] = None
+    state: Optional[str] = None
+    postcode: Optional[str] = None
+
+    @property
+    def street_line(self) -> Optional[str]:
+        if not self.street:
+            return None
+        return " ".join(p for p in (self.street, self.street_type) if p)
+
+    @property
+    def canonical(self) -> str:
+        """Dạng chuẩn để làm key cache: '107/131 George St Brisbane City QLD 4000'."""
+        return _join(_number(self, unit=True), self.street_line, self.suburb, self.state, self.postcode) or self.raw
+
+
+def _join(*parts: Optional[str]) -> str:
+    return " ".join(p for p in parts if p)
+
+
+def _number(a: ParsedAddress, unit: bool) -> Optional[str]:
+    if a.number and a.unit and unit:
+        return f"{a.unit}/{a.number}"
+    return a.number
+
+
+def _title(s: str) -> str:
+    return " ".join(w if w.isupper() and len(w) > 1 else w.capitalize() for w in s.split())
+
+
+def _type_follows(words: List[str], i: int) -> bool:
+    """Từ sau words[i] cũng là loại đường. "St" + tên phía sau là "Saint" của suburb ("Esplanade St Kilda")."""
+    if i + 1 >= len(words):
+        return False
+    nxt = words[i + 1].lower().rstrip(".")
+    return nxt in STREET_TYPES and not (nxt == "st" and i + 2 < len(words))
+
+
+def parse_address(text: str) -> ParsedAddress:
+    """Tách best-effort; phần nào không nhận ra thì để None (planner vẫn còn shape "raw")."""
+    a = ParsedAddress(raw=" ".join((text or "").split()))
+    s = a.raw.replace(" ,", ",")
+    m = _UNIT_WORD.match(s)
+    if m:
+        a.unit, s = m.group(1), s[m.end():]
+    else:
+        m = _UNIT_SLASH.match(s)
+        if m:
+            a.unit, s = m.group(1), s[m.end():]
+    m = _NUMBER.match(s)
+    if m:
+        a.number, s = re.sub(r"\s+", "", m.group(1)), s[m.end():]
+
+    s = re.sub(r",?\s*australia\s*$", "", s.strip(" ,"), flags=re.I).strip(" ,")
+    m = _POSTCODE.search(s)
+    if m:
+        a.postcode, s = m.group(1), s[:m.start()].strip(" ,")
+    m = _STATE.search(s)
+    if m:
+        a.state, s = STATES[m.group(1).lower()], s[:m.start()].strip(" ,")
+
+    # loại đường: có dấu phẩy -> từ khớp STREET_TYPES cuối cùng trước dấu phẩy ("The Esplanade, St Kilda");
+    # không có -> từ khớp đầu tiên ("Foo St Fairfield Heights"), nhưng nếu ngay sau nó lại là 1 loại đường
+    # thì nó thuộc tên đường ("Bay View Tce Claremont"); không xét từ đầu tiên ("Grove St")
+    head, sep, tail = s.partition(",")
+    words = head.split()
+    for i in (range(len(words) - 1, 0, -1) if sep else range(1, len(words))):
+        t = STREET_TYPES.get(words[i].lower().rstrip("."))
+        if t and not sep and _type_follows(words, i):
+            continue
+        if t:
+            a.street, a.street_type = _title(" ".join(words[:i])), t
+            rest = " ".join(words[i + 1:]) + (" " + tail if sep else "")
+            a.suburb = _title(rest.replace(",", " ").strip()) or None
+            break
+    else:
+        if sep:  # "12 Foo, Sydney": không có loại đường nhưng có dấu phẩy
+            a.street, a.suburb = _title(head.strip()) or None, _title(tail.replace(",", " ").strip()) or None
+        elif words:
+            a.street = _title(head.strip())
+    return a
+
+
+# shape -> (hàm dựng query, tỉ lệ trúng giả định ban đầu); thứ tự khai báo = cụ thể nhất trước
+SHAPES: Dict[str, Tuple] = {
+    "full":           (lambda a: _join(_number(a, True), a.street_line, a.suburb, a.state, a.postcode), 0.60),
+    "no_unit":        (lambda a: _join(a.number, a.street_line, a.suburb, a.state, a.postcode) if a.unit else "", 0.55),
+    "no_postcode":    (lambda a: _join(_number(a, True), a.street_line, a.suburb, a.state) if a.postcode else "", 0.45),
+    "street_suburb":  (lambda a: _join(a.number, a.street_line, a.suburb) if a.suburb else "", 0.40),
+    "raw":            (lambda a: a.raw, 0.30),
+    "street_no_number": (lambda a: _join(a.street_line, a.suburb, a.state, a.postcode)
+                         if a.number and a.street and a.suburb else "", 0.15),
+}
+_PRIOR_WEIGHT = 10.0  # prior tương đương 10 lần thử: vài lần trượt đầu không đảo thứ tự ngay
+
+
+class ShapeStats:
+    """Số lần thử / có kết quả theo shape; điểm = trung bình hậu nghiệm với prior của SHAPES."""
+
+    def __init__(self, path: str = SEARCH_SHAPE_STATS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.tries: Dict[str, int] = {k: 0 for k in SHAPES}
+        self.hits: Dict[str, int] = {k: 0 for k in SHAPES}
+        self._saved_at = 0.0
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+                for k in SHAPES:
+                    self.tries[k] = int(data.get("tries", {}).get(k, 0))
+                    self.hits[k] = int(data.get("hits", {}).get(k, 0))
+            except (OSError, ValueError):
+                pass
+
+    def score(self, shape: str) -> float:
+        prior = SHAPES[shape][1]
+        return (self.hits[shape] + prior * _PRIOR_WEIGHT) / (self.tries[shape] + _PRIOR_WEIGHT)
+
+    def record(self, shape: str, hit: bool):
+        with self._lock:
+            self.tries[shape] += 1
+            self.hits[shape] += int(hit)
+            if self.path and time.time() - self._saved_at > 30:
+                self._saved_at = time.time()
+                self._save()
+
+    def _save(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"tries": self.tries, "hits": self.hits}, f)
+        os.replace(tmp, self.path)
+
+    def stats(self) -> dict:
+        return {k: {"tries": self.tries[k], "hits": self.hits[k], "score": round(self.score(k), 3)} for k in SHAPES}
+
+
+shape_stats = ShapeStats()
+
+
+def plan_queries(address: str, stats: ShapeStats = shape_stats) -> List[Tuple[str, str]]:
+    """[(shape, query)] đã bỏ trùng, shape điểm cao trước (hoà thì cụ thể hơn trước)."""
+    a = parse_address(address)
+    order = sorted(SHAPES, key=lambda k: -stats.score(k))  # sort ổn định: giữ thứ tự khai báo khi hoà
+    seen, out = set(), []
+    for shape in order:
+        q = SHAPES[shape][0](a)
+        norm = q.lower()
+        if q and norm not in seen:
+            seen.add(norm)
+            out.append((shape, q))
+    return out
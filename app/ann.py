@@ -0,0 +1,170 @@
+# app/ann.py
+"""IVF-PQ thuần NumPy cho vector CLIP (inner product trên vector đã chuẩn hoá).
+
+- Coarse quantizer: k-means `nlist` tâm; mỗi vector vào list của tâm gần nhất.
+- Product quantization: phần dư (x - tâm) chia `m` đoạn, mỗi đoạn mã hoá 1 byte.
+- Truy vấn: chấm điểm q·tâm, duyệt `nprobe` list tốt nhất, cộng bảng tra LUT
+  theo mã PQ (ADC), tuỳ chọn chấm lại `rerank` ứng viên đầu bằng vector gốc.
+"""
+from typing import Callable, Optional
+import numpy as np
+
+SOURCES = {"realestate": 1, "domain": 2}  # mã nguồn lưu dạng int8 cho lọc nhanh
+_CHUNK = 65536
+
+
+def _assign(x: np.ndarray, c: np.ndarray) -> np.ndarray:
+    """Tâm gần nhất (L2) cho từng dòng, chia khúc để giới hạn RAM."""
+    c2 = (c * c).sum(axis=1)
+    out = np.empty(len(x), dtype=np.int64)
+    for i in range(0, len(x), _CHUNK):
+        block = np.asarray(x[i:i + _CHUNK], dtype=np.float32)
+        out[i:i + len(block)] = np.argmax(2 * block @ c.T - c2, axis=1)
+    return out
+
+
+def kmeans(x: np.ndarray, k: int, iters: int = 20, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    x = np.asarray(x, dtype=np.float32)
+    k = min(k, len(x))
+    c = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iters):
+        a = _assign(x, c)
+        counts = np.bincount(a, minlength=k)
+        # cộng theo cụm bằng reduceat trên mảng đã xếp theo cụm (nhanh hơn np.add.at nhiều lần)
+        order = np.argsort(a, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        empty = counts == 0
+        sums = np.zeros_like(c)
+        sums[~empty] = np.add.reduceat(x[order], starts[~empty], axis=0)
+        c[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():  # tâm rỗng -> lấy lại điểm ngẫu nhiên
+            c[empty] = x[rng.choice(len(x), int(empty.sum()), replace=False)]
+    return c
+
+
+class IVFPQIndex:
+    def __init__(self, dim: int, nlist: int = 1024, m: int = 16, ksub: int = 256):
+        if dim % m:
+            raise ValueError(f"dim {dim} không chia hết cho m={m}")
+        self.dim, self.nlist, self.m, self.ksub = dim, nlist, m, ksub
+        self.dsub = dim // m
+        self.centroids: Optional[np.ndarray] = None  # (nlist, dim)
+        self.pq: Optional[np.ndarray] = None         # (m, ksub, dsub)
+        # dữ liệu xếp theo list: offsets[l]:offsets[l+1] là list l
+        self.offsets = np.zeros(nlist + 1, dtype=np.int64)
+        self.codes = np.zeros((0, m), dtype=np.uint8)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.source = np.zeros(0, dtype=np.int8)
+        self.bedrooms = np.zeros(0, dtype=np.float32)
+
+    @property
+    def ntotal(self) -> int:
+        return len(self.ids)
+
+    # ---- train / add ---------------------------------------------------------
+    def train(self, sample: np.ndarray, iters: int = 20, seed: int = 0):
+        sample = np.asarray(sample, dtype=np.float32)
+        self.centroids = kmeans(sample, self.nlist, iters, seed)
+        self.nlist = len(self.centroids)
+        self.offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+        res = sample - self.centroids[_assign(sample, self.centroids)]
+        ksub = min(self.ksub, len(sample))
+        self.pq = np.stack([
+            kmeans(res[:, j * self.dsub:(j + 1) * self.dsub], ksub, iters, seed + j) for j in range(self.m)
+        ])
+
+    def _encode(self, x: np.ndarray, lists: np.ndarray) -> np.ndarray:
+        res = x - self.centroids[lists]
+        codes = np.empty((len(x), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = _assign(res[:, j * self.dsub:(j + 1) * self.dsub], self.pq[j])
+        return codes
+
+    def add(self, x: np.ndarray, ids: np.ndarray, source: Optional[np.ndarray] = None,
+            bedrooms: Optional[np.ndarray] = None):
+        """Thêm vector (đã train). `source` là mã trong SOURCES, `bedrooms` NaN nếu không rõ."""
+        n = len(ids)
+        if source is None:
+            source = np.zeros(n, dtype=np.int8)
+        if bedrooms is None:
+            bedrooms = np.full(n, np.nan, dtype=np.float32)
+        lists = np.empty(n, dtype=np.int64)
+        codes = np.empty((n, self.m), dtype=np.uint8)
+        for i in range(0, n, _CHUNK):
+            block = np.asarray(x[i:i + _CHUNK], dtype=np.float32)
+            lists[i:i + len(block)] = _assign(block, self.centroids)
+            codes[i:i + len(block)] = self._encode(block, lists[i:i + len(block)])
+        old_lists = np.repeat(np.arange(self.nlist), np.diff(self.offsets))
+        all_lists = np.concatenate([old_lists, lists])
+        order = np.argsort(all_lists, kind="stable")
+        self.codes = np.concatenate([self.codes, codes])[order]
+        self.ids = np.concatenate([self.ids, np.asarray(ids, dtype=np.int64)])[order]
+        self.source = np.concatenate([self.source, np.asarray(source, dtype=np.int8)])[order]
+        self.bedrooms = np.concatenate([self.bedrooms, np.asarray(bedrooms, dtype=np.float32)])[order]
+        self.offsets[1:] = np.cumsum(np.bincount(all_lists, minlength=self.nlist))
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, *, ids: Optional[np.ndarray] = None, source=None, bedrooms=None,
+              nlist: int = 0, m: int = 16, train_size: int = 65536, seed: int = 0) -> "IVFPQIndex":
+        """Train trên mẫu ngẫu nhiên rồi add toàn bộ (vectors có thể là memmap)."""
+        n, dim = vectors.shape
+        nlist = nlist or max(1, min(4096, int(4 * np.sqrt(n))))
+        rng = np.random.default_rng(seed)
+        sample_idx = np.sort(rng.choice(n, min(n, max(train_size, nlist * 39)), replace=False))
+        idx = cls(dim, nlist, m)
+        idx.train(np.asarray(vectors[sample_idx], dtype=np.float32), seed=seed)
+        idx.add(vectors, np.arange(n) if ids is None else ids, source, bedrooms)
+        return idx
+
+    # ---- search --------------------------------------------------------------
+    def search(self, q: np.ndarray, k: int = 10, *, nprobe: int = 8, rerank: int = 0,
+               vectors: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+               source: Optional[str] = None, min_bedrooms: Optional[float] = None,
+               max_bedrooms: Optional[float] = None, valid: Optional[np.ndarray] = None,
+               keep: Optional[Callable[[np.ndarray], np.ndarray]] = None) -> tuple[np.ndarray, np.ndarray]:
+        """-> (ids, scores) giảm dần. `nprobe`/`rerank` lớn hơn = recall cao hơn, chậm hơn.
+
+        `vectors(ids)` trả vector gốc float32 để rerank; `valid` là mask theo id (vd. dòng chưa bị xoá).
+        `source`/`*_bedrooms` lọc theo metadata chụp lúc add; metadata còn đổi sau đó thì truyền `keep(ids)`
+        -> mask, tính từ dữ liệu hiện tại, thay cho chúng.
+        """
+        q = np.asarray(q, dtype=np.float32).reshape(-1)
+        qc = self.centroids @ q
+        nprobe = min(nprobe, self.nlist)
+        probe = np.argpartition(-qc, nprobe - 1)[:nprobe]
+        starts, ends = self.offsets[probe], self.offsets[probe + 1]
+        if not (ends - starts).sum():
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        rows = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])
+        base = np.repeat(qc[probe], ends - starts)
+
+        mask = np.ones(len(rows), dtype=bool)
+        if source:
+            mask &= self.source[rows] == SOURCES.get(source, -1)
+        if min_bedrooms is not None:
+            mask &= self.bedrooms[rows] >= min_bedrooms
+        if max_bedrooms is not None:
+            mask &= self.bedrooms[rows] <= max_bedrooms
+        if valid is not None:
+            mask &= valid[self.ids[rows]]
+        if keep is not None:
+            mask &= keep(self.ids[rows])
+        rows, base = rows[mask], base[mask]
+        if not len(rows):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        lut = np.einsum("mkd,md->mk", self.pq, q.reshape(self.m, self.dsub))  # (m, ksub)
+        scores = base + lut[np.arange(self.m), self.codes[rows]].sum(axis=1)
+
+        n_keep = min(len(rows), max(k, rerank))
+        top = np.argpartition(-scores, n_keep - 1)[:n_keep]
+        ids, scores = self.ids[rows[top]], scores[top]
+        if rerank and vectors is not None:
+            scores = vectors(ids) @ q
+        order = np.argsort(-scores)[:k]
+        return ids[order], scores[order].astype(np.float32)
+
+    def stats(self) -> dict:
+        return {"ntotal": self.ntotal, "nlist": self.nlist, "m": self.m, "dim": self.dim,
+                "code_bytes": int(self.codes.nbytes)}
@@ -0,0 +1,269 @@
+# app/batch_jobs.py
+import asyncio, csv, io, json, os, sqlite3, threading, time, uuid
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+from app import config
+from app.schemas import PropertyItem
+from app.utils.metrics import trace_id
+
+# ---- Config ------------------------------------------------------------------
+BATCH_DB_PATH           = getattr(config, "BATCH_DB_PATH", ".cache/batch.sqlite3")
+BATCH_WORKERS           = int(getattr(config, "BATCH_WORKERS", 4))
+BATCH_MAX_PENDING       = int(getattr(config, "BATCH_MAX_PENDING", 20000))    # địa chỉ chờ, cộng mọi job
+BATCH_ADDRESS_TIMEOUT_S = float(getattr(config, "BATCH_ADDRESS_TIMEOUT_S", 120))
+# -----------------------------------------------------------------------------
+
+Lookup = Callable[[str], Awaitable[List[PropertyItem]]]
+
+
+class QueueFull(Exception):
+    """Hàng đợi batch đã đủ BATCH_MAX_PENDING địa chỉ."""
+
+
+def parse_csv(text: str) -> List[str]:
+    """Cột "address" (không phân biệt hoa thường) nếu có header đó, không thì cột đầu tiên."""
+    rows = [r for r in csv.reader(io.StringIO(text)) if r and any(c.strip() for c in r)]
+    if not rows:
+        return []
+    header = [c.strip().lower() for c in rows[0]]
+    col = header.index("address") if "address" in header else 0
+    body = rows[1:] if "address" in header else rows
+    return [r[col].strip() for r in body if len(r) > col and r[col].strip()]
+
+
+class JobStore:
+    """Job + từng địa chỉ trong SQLite: job chưa xong chạy tiếp sau restart, job xong vẫn đọc lại được."""
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, total INTEGER NOT NULL,"
+            " created REAL NOT NULL, finished REAL);"
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            " job_id TEXT NOT NULL, idx INTEGER NOT NULL, address TEXT NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'pending', result TEXT, error TEXT, elapsed_ms REAL,"
+            " PRIMARY KEY (job_id, idx));"
+        )
+        self._db.commit()
+
+    def create(self, addresses: List[str]) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute("INSERT INTO jobs (id, status, total, created) VALUES (?, 'queued', ?, ?)",
+                             (job_id, len(addresses), time.time()))
+            self._db.executemany("INSERT INTO tasks (job_id, idx, address) VALUES (?, ?, ?)",
+                                 [(job_id, i, a) for i, a in enumerate(addresses)])
+            self._db.commit()
+        return job_id
+
+    def set_status(self, job_id: str, status: str):
+        finished = time.time() if status in ("done", "cancelled") else None
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = ?, finished = ? WHERE id = ?", (status, finished, job_id))
+            self._db.commit()
+
+    def finish_task(self, job_id: str, idx: int, status: str, result: Optional[list], error: Optional[str],
+                    elapsed_ms: float):
+        with self._lock:
+            self._db.execute(
+                "UPDATE tasks SET status = ?, result = ?, error = ?, elapsed_ms = ? WHERE job_id = ? AND idx = ?",
+                (status, json.dumps(result) if result is not None else None, error, elapsed_ms, job_id, idx),
+            )
+            self._db.commit()
+
+    def job(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT id, status, total, created, finished FROM jobs WHERE id = ?",
+                                   (job_id,)).fetchone()
+            if row is None:
+                return None
+            counts = dict(self._db.execute(
+                "SELECT status, COUNT(*) FROM tasks WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+        return {"id": row[0], "status": row[1], "total": row[2], "created": row[3], "finished": row[4],
+                "done": counts.get("done", 0), "failed": counts.get("failed", 0), "pending": counts.get("pending", 0)}
+
+    def results(self, job_id: str, finished_only: bool = True) -> List[dict]:
+        sql = "SELECT idx, address, status, result, error, elapsed_ms FROM tasks WHERE job_id = ?"
+        if finished_only:
+            sql += " AND status != 'pending'"
+        with self._lock:
+            rows = self._db.execute(sql + " ORDER BY idx", (job_id,)).fetchall()
+        return [_task_row(*r) for r in rows]
+
+    def new_results(self, job_id: str, known: Set[int]) -> List[dict]:
+        """Kết quả đã xong nhưng chưa có trong `known` (stream đọc bù từ DB chung khi job chạy ở worker khác)."""
+        with self._lock:
+            done = [r[0] for r in self._db.execute(
+                "SELECT idx FROM tasks WHERE job_id = ? AND status != 'pending'", (job_id,))]
+            todo = sorted(set(done) - known)
+            rows = [self._db.execute(
+                "SELECT idx, address, status, result, error, elapsed_ms FROM tasks WHERE job_id = ? AND idx = ?",
+                (job_id, i)).fetchone() for i in todo]
+        return [_task_row(*r) for r in rows if r]
+
+    def unfinished(self) -> List[Tuple[str, List[Tuple[int, str]]]]:
+        """Job queued/running + các địa chỉ còn pending, theo thứ tự tạo."""
+        with self._lock:
+            jobs = [r[0] for r in self._db.execute(
+                "SELECT id FROM jobs WHERE status IN ('queued', 'running') ORDER BY created")]
+            return [(j, self._db.execute(
+                "SELECT idx, address FROM tasks WHERE job_id = ? AND status = 'pending' ORDER BY idx", (j,)
+            ).fetchall()) for j in jobs]
+
+
+def _task_row(idx, address, status, result, error, elapsed_ms) -> dict:
+    return {"index": idx, "address": address, "status": status,
+            "listings": json.loads(result) if result else [], "error": error, "elapsed_ms": elapsed_ms}
+
+
+class BatchRunner:
+    """Pool `workers` coroutine chạy lookup cho địa chỉ của mọi job, xoay vòng giữa các job
+    (job lớn không chặn job nhỏ). Mọi lookup dùng chung search cache + limiter theo host."""
+
+    def __init__(self, store: JobStore, lookup: Lookup, workers: int = BATCH_WORKERS,
+                 max_pending: int = BATCH_MAX_PENDING, timeout: float = BATCH_ADDRESS_TIMEOUT_S):
+        self.store = store
+        self.lookup = lookup
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._queues: "OrderedDict[str, Deque[Tuple[int, str]]]" = OrderedDict()
+        self._running: Dict[str, int] = {}  # job -> số địa chỉ đang chạy
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self.completed = self.failed = 0
+
+    @property
+    def pending(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    async def start(self, resume: bool = True):
+        """`resume=False`: không nhận job dở từ lần chạy trước (nhiều worker: chỉ worker 0 chạy tiếp)."""
+        if self._tasks:
+            return
+        self._wake = asyncio.Event()
+        self._queues.clear()
+        self._running.clear()
+        for job_id, todo in (await asyncio.to_thread(self.store.unfinished) if resume else []):
+            if todo:
+                self._queues[job_id] = deque(todo)
+            else:  # tắt máy đúng lúc địa chỉ cuối vừa xong
+                await asyncio.to_thread(self.store.set_status, job_id, "done")
+        if self._queues:
+            self._wake.set()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, addresses: List[str]) -> str:
+        if self.pending + len(addresses) > self.max_pending:
+            raise QueueFull(f"batch queue full ({self.pending} pending, max {self.max_pending})")
+        await self.start()
+        job_id = await asyncio.to_thread(self.store.create, addresses)
+        self._queues[job_id] = deque(enumerate(addresses))
+        self._wake.set()
+        return job_id
+
+    async def cancel(self, job_id: str) -> bool:
+        job = await asyncio.to_thread(self.store.job, job_id)
+        if job is None or job["status"] in ("done", "cancelled"):
+            return False
+        self._queues.pop(job_id, None)  # địa chỉ đang chạy dở vẫn chạy nốt
+        await asyncio.to_thread(self.store.set_status, job_id, "cancelled")
+        self._publish(job_id, {"type": "job", "status": "cancelled"})
+        self._publish(job_id, None)
+        return True
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        q: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(q)
+        return q
+
+    def unsubscribe(self, job_id: str, q: asyncio.Queue):
+        subs = self._subscribers.get(job_id)
+        if subs is not None:
+            subs.discard(q)
+            if not subs:
+                self._subscribers.pop(job_id, None)
+
+    def _publish(self, job_id: str, event: Optional[dict]):
+        for q in self._subscribers.get(job_id, ()):
+            q.put_nowait(event)
+
+    async def _next(self) -> Tuple[str, int, str]:
+        while True:
+            while self._queues:
+                job_id, q = next(iter(self._queues.items()))
+                self._queues.move_to_end(job_id)  # round-robin giữa các job
+                if q:
+                    idx, address = q.popleft()
+                    if not q:
+                        self._queues.pop(job_id)
+                    return job_id, idx, address
+                self._queues.pop(job_id)
+            self._wake.clear()
+            await self._wake.wait()
+
+    async def _worker(self):
+        while True:
+            job_id, idx, address = await self._next()
+            trace_id.set(f"batch-{job_id[:8]}-{idx}")  # log của lookup này gắn theo job + dòng
+            if job_id not in self._running:
+                await asyncio.to_thread(self.store.set_status, job_id, "running")
+            self._running[job_id] = self._running.get(job_id, 0) + 1
+            t0 = time.perf_counter()
+            result = error = None
+            try:
+                items = await asyncio.wait_for(self.lookup(address), self.timeout)
+                result = [it.model_dump() for it in items]
+                status = "done"
+                self.completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                status, error = "failed", f"{type(e).__name__}: {(str(e).splitlines() or [''])[0]}"
+                self.failed += 1
+            finally:
+                self._running[job_id] -= 1
+            elapsed = round(1000 * (time.perf_counter() - t0), 1)
+            await asyncio.to_thread(self.store.finish_task, job_id, idx, status, result, error, elapsed)
+            self._publish(job_id, {"type": "result", **_task_row(idx, address, status, None, error, elapsed),
+                                   "listings": result or []})
+            if not self._running[job_id] and job_id not in self._queues:
+                del self._running[job_id]
+                job = await asyncio.to_thread(self.store.job, job_id)
+                if job and job["status"] == "running" and not job["pending"]:
+                    await asyncio.to_thread(self.store.set_status, job_id, "done")
+                    self._publish(job_id, {"type": "job", "status": "done"})
+                    self._publish(job_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "jobs_active": len(set(self._queues) | set(self._running)),
+            "pending": self.pending,
+            "running": sum(self._running.values()),
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+def _lookup(address: str) -> Awaitable[List[PropertyItem]]:
+    from app.listings import fetch_listings  # import muộn: listings kéo theo search/http
+    return fetch_listings(address)
+
+
+# "" -> SQLite trong RAM: vẫn chạy được nhưng mất job khi restart
+batch_runner = BatchRunner(JobStore(BATCH_DB_PATH or ":memory:"), _lookup)
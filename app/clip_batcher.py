@@ -0,0 +1,133 @@
+# app/clip_batcher.py
+import asyncio, time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+import torch
+from app import config
+from app.utils.metrics import CLIP_BATCH_SIZE, CLIP_FORWARD_SECONDS, CLIP_QUEUE_SECONDS
+
+# ---- Config ------------------------------------------------------------------
+CLIP_MAX_BATCH   = int(getattr(config, "CLIP_MAX_BATCH", 32))
+CLIP_MAX_WAIT_MS = float(getattr(config, "CLIP_MAX_WAIT_MS", 10))
+# -----------------------------------------------------------------------------
+
+_Item = Tuple[torch.Tensor, asyncio.Future, float]  # (tensor C×H×W, future, thời điểm vào hàng)
+
+
+class BatchInferer:
+    """Gom tensor ảnh từ nhiều request đồng thời thành batch rồi forward ở 1 thread riêng.
+
+    Batch được đẩy đi khi đủ `max_batch` ảnh hoặc ảnh đầu tiên đã chờ `max_wait_ms`.
+    Mỗi `submit()` nhận lại vector (đã chuẩn hoá L2, float32) của đúng ảnh đó.
+    """
+
+    def __init__(self, encode: Callable[[torch.Tensor], torch.Tensor],
+                 max_batch: int = CLIP_MAX_BATCH, max_wait_ms: float = CLIP_MAX_WAIT_MS):
+        self.encode = encode
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "asyncio.Queue[_Item]" = asyncio.Queue()
+        # 1 thread duy nhất: torch tự song song bên trong, và forward không chiếm event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clip-infer")
+        self._task: Optional[asyncio.Task] = None
+        # metrics
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes: Counter = Counter()
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+        self.total_forward = 0.0
+        self.max_forward = 0.0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        while not self._queue.empty():
+            _, fut, _ = self._queue.get_nowait()
+            if not fut.done():
+                fut.cancel()
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, tensor: torch.Tensor) -> torch.Tensor:
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((tensor, fut, time.perf_counter()))
+        return await fut
+
+    async def _collect(self) -> List[_Item]:
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                # hết giờ chờ: vẫn vét nốt những gì đã nằm sẵn trong hàng
+                while len(batch) < self.max_batch and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                continue
+        return batch
+
+    def _forward(self, batch: torch.Tensor) -> torch.Tensor:
+        with torch.inference_mode():
+            feats = self.encode(batch)
+            feats = feats / feats.norm(dim=-1, keepdim=True)
+            return feats.float().cpu()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = await self._collect()
+            # request đã huỷ (client ngắt) thì không forward ảnh của nó
+            items = [it for it in items if not it[1].done()]
+            if not items:
+                continue
+            t0 = time.perf_counter()
+            for _, _, t_enq in items:
+                w = t0 - t_enq
+                CLIP_QUEUE_SECONDS.observe(w)
+                self.total_wait += w
+                self.max_wait_seen = max(self.max_wait_seen, w)
+            try:
+                feats = await loop.run_in_executor(
+                    self._executor, self._forward, torch.stack([t for t, _, _ in items])
+                )
+            except Exception as e:
+                for _, fut, _ in items:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            dt = time.perf_counter() - t0
+            CLIP_FORWARD_SECONDS.observe(dt)
+            CLIP_BATCH_SIZE.observe(len(items))
+            self.batches += 1
+            self.items += len(items)
+            self.batch_sizes[len(items)] += 1
+            self.total_forward += dt
+            self.max_forward = max(self.max_forward, dt)
+            for j, (_, fut, _) in enumerate(items):
+                if not fut.done():
+                    fut.set_result(feats[j])
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "batches": self.batches,
+            "images": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "batch_size_hist": dict(sorted(self.batch_sizes.items())),
+            "avg_queue_wait_ms": round(1000 * self.total_wait / self.items, 2) if self.items else 0.0,
+            "max_queue_wait_ms": round(1000 * self.max_wait_seen, 2),
+            "avg_forward_ms": round(1000 * self.total_forward / self.batches, 2) if self.batches else 0.0,
+            "max_forward_ms": round(1000 * self.max_forward, 2),
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+        }
@@ -1,50 +1,193 @@
-from typing import List, Tuple
+from typing import Dict, List, Optional
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import numpy as np
 import torch
 import clip  # from openai/CLIP
 from PIL import Image
-import io
+import contextvars, io, logging, time
 from app.utils.http import Http
+from app.embed_cache import cache_for, content_hash
+from app.clip_batcher import BatchInferer
+from app.clip_runtime import build_encoder, configure_threads, input_resolution, take_preloaded, CLIP_RUNTIME
 from app import config
+from app.utils.metrics import CLIP_PREPROCESS_SECONDS, log
+
+EMBED_FETCH_CONCURRENCY = int(getattr(config, "EMBED_FETCH_CONCURRENCY", 8))
+CLIP_DECODE_WORKERS     = int(getattr(config, "CLIP_DECODE_WORKERS", 4))
 
 _model = None
 _preprocess = None
+_encoder = None
+_batcher: BatchInferer | None = None
+_load_lock: asyncio.Lock | None = None
+_state = "idle"  # idle | loading | ready | failed
+_load_error: str | None = None
+# decode + resize ảnh: PIL và transforms nhả GIL trong phần nặng nên thread pool là đủ
+_decode_pool = ThreadPoolExecutor(max_workers=CLIP_DECODE_WORKERS, thread_name_prefix="clip-decode")
+
+
+@dataclass
+class ImageEmbedding:
+    """Kết quả cho 1 URL: `vector` (float32, L2-normalized) hoặc `error` nói rõ hỏng ở bước nào."""
+    url: str
+    vector: Optional[np.ndarray] = None
+    error: Optional[str] = None
+    cached: Optional[str] = None  # "url" | "hash" | None
+
+
+def _load_sync():
+    """clip.load + dựng encoder theo CLIP_RUNTIME – blocking, chạy trong thread.
+
+    Chạy dưới serve.py thì dùng weights master đã load trước khi fork (chung trang nhớ giữa các worker).
+    """
+    global _model, _preprocess, _encoder
+    configure_threads()
+    preloaded = take_preloaded(config.CLIP_MODEL)
+    if preloaded is not None:
+        model, preprocess, encoder = preloaded
+    else:
+        model, preprocess = clip.load(config.CLIP_MODEL, device="cpu")
+        model.eval()
+        encoder = None
+    if encoder is None:
+        encoder = build_encoder(model, config.CLIP_MODEL, CLIP_RUNTIME)
+    _model, _preprocess, _encoder = model, preprocess, encoder
 
 async def _load_model():
-    global _model, _preprocess
+    global _batcher, _load_lock, _state, _load_error
     if _model is None:
-        _model, _preprocess = clip.load(config.CLIP_MODEL)  # CPU by default
-        _model.eval()
+        if _load_lock is None:
+            _load_lock = asyncio.Lock()
+        async with _load_lock:  # nhiều request đầu tiên cùng lúc -> chỉ load 1 lần
+            if _model is None:
+                _state = "loading"
+                try:
+                    await asyncio.to_thread(_load_sync)
+                except Exception as e:
+                    _state, _load_error = "failed", _reason("load", e)
+                    raise
+    if _batcher is None:
+        _batcher = BatchInferer(_encoder)
+    _batcher.start()
+    _state = "ready"
 
-async def embed_image_urls(urls: List[str]) -> List[List[float]]:
-    await _load_model()
-    http = Http()
+async def warmup():
+    """Load model lúc khởi động và chạy 1 batch giả để torch cấp phát/khởi tạo kernel trước."""
     try:
-        imgs = []
-        tensors = []
-        for url in urls:
-            try:
-                raw = await http.get_bytes(url)
-                img = Image.open(io.BytesIO(raw)).convert("RGB")
-                t = _preprocess(img).unsqueeze(0)
-                tensors.append(t)
-            except Exception:
-                tensors.append(None)
-        valid = [t for t in tensors if t is not None]
-        if not valid:
-            return []
-        batch = torch.cat(valid, dim=0)
-        with torch.no_grad():
-            feats = _model.encode_image(batch)
-            feats = feats / feats.norm(dim=-1, keepdim=True)
-        # Map features back to original order (None -> empty list)
-        out: List[List[float]] = []
-        i = 0
-        for t in tensors:
-            if t is None:
-                out.append([])
-            else:
-                out.append(feats[i].cpu().tolist())
-                i += 1
+        await _load_model()
+        side = input_resolution(_model)
+        await _batcher.submit(torch.zeros(3, side, side))
+        log("clip_ready", model=config.CLIP_MODEL, runtime=CLIP_RUNTIME)
+    except Exception as e:
+        # request /embed sau sẽ thử load lại; /health báo lỗi qua state()
+        log("clip_warmup_failed", logging.ERROR, model=config.CLIP_MODEL, error=str(e))
+
+def state() -> dict:
+    return {"state": _state, "model": config.CLIP_MODEL, "runtime": CLIP_RUNTIME, "error": _load_error}
+
+async def shutdown():
+    global _batcher
+    if _batcher is not None:
+        await _batcher.stop()
+        _batcher = None
+
+def stats() -> dict:
+    return {**state(), "batcher": _batcher.stats() if _batcher else None}
+
+def _decode(raw: bytes) -> torch.Tensor:
+    t0 = time.perf_counter()
+    img = Image.open(io.BytesIO(raw))
+    if img.format == "JPEG":
+        # JPEG decode thẳng ở 1/2, 1/4, 1/8 kích thước – vẫn >= input của model
+        side = input_resolution(_model)
+        img.draft("RGB", (side, side))
+    tensor = _preprocess(img.convert("RGB"))
+    CLIP_PREPROCESS_SECONDS.observe(time.perf_counter() - t0)
+    return tensor
+
+def _reason(stage: str, e: BaseException) -> str:
+    msg = (str(e).splitlines() or [""])[0]
+    return f"{stage}: {type(e).__name__}: {msg}" if msg else f"{stage}: {type(e).__name__}"
+
+async def embed_images(urls: List[str], prefetched: Optional[Dict[str, bytes]] = None) -> List[ImageEmbedding]:
+    """Pipeline theo từng ảnh: tải (song song, có giới hạn) -> decode/preprocess (thread pool)
+    -> micro-batcher. Ảnh nào xong bước trước thì vào batch trước, không chờ cả danh sách.
+
+    `prefetched`: URL -> bytes đã tải sẵn (vd. lúc dedup hash ảnh), khỏi tải lại."""
+    out = [ImageEmbedding(url=u) for u in urls]
+    cache = cache_for(config.CLIP_MODEL)
+    # URL đã có vector -> bỏ qua cả tải ảnh lẫn forward pass
+    cached = (await asyncio.to_thread(cache.get_urls, urls)) if cache else {}
+    for r in out:
+        if r.url in cached:
+            r.vector, r.cached = cached[r.url], "url"
+    todo = [r for r in out if r.vector is None]
+    if not todo:
         return out
+
+    await _load_model()
+    loop = asyncio.get_running_loop()
+    fetch_slots = asyncio.Semaphore(EMBED_FETCH_CONCURRENCY)
+    by_sha: Dict[str, asyncio.Future] = {}  # cùng bytes ảnh trong 1 request -> chỉ encode 1 lần
+    http = Http()  # dùng client chung của process nếu đã mở trong lifespan
+
+    async def _one(r: ImageEmbedding):
+        try:
+            raw = prefetched.get(r.url) if prefetched else None
+            if raw is None:
+                async with fetch_slots:
+                    raw = await http.get_bytes(r.url)
+        except Exception as e:
+            r.error = _reason("fetch", e)
+            return
+        sha = content_hash(raw)
+        if sha in by_sha:
+            r.vector, r.error = await by_sha[sha]
+            return
+        by_sha[sha] = done = loop.create_future()
+        try:
+            if cache:
+                # cùng bytes ảnh dưới URL khác (biến thể CDN)
+                vec = await asyncio.to_thread(cache.get_hash, r.url, sha)
+                if vec is not None:
+                    r.vector, r.cached = vec, "hash"
+                    return
+            try:
+                # copy_context: CLIP_PREPROCESS_SECONDS cộng được vào stage của request
+                tensor = await loop.run_in_executor(_decode_pool, contextvars.copy_context().run, _decode, raw)
+            except Exception as e:
+                r.error = _reason("decode", e)
+                return
+            try:
+                # batcher gộp ảnh của request này với các request /embed đang chạy song song
+                r.vector = (await _batcher.submit(tensor)).numpy()
+            except Exception as e:
+                r.error = _reason("inference", e)
+                return
+            if cache:
+                await asyncio.to_thread(cache.put, r.url, sha, r.vector)
+        finally:
+            done.set_result((r.vector, r.error))
+
+    try:
+        await asyncio.gather(*(_one(r) for r in todo))
     finally:
-        await http.close()
\ No newline at end of file
+        await http.close()
+    return out
+
+async def embed_image_urls(urls: List[str]) -> List[List[float]]:
+    """Giữ API cũ: list vector theo thứ tự URL, ảnh lỗi -> []."""
+    return [r.vector.tolist() if r.vector is not None else [] for r in await embed_images(urls)]
+
+async def embed_texts(texts: List[str]) -> np.ndarray:
+    """Vector text (float32, L2-normalized) cho truy vấn text -> ảnh."""
+    await _load_model()
+
+    def _encode() -> np.ndarray:
+        with torch.inference_mode():
+            feats = _model.encode_text(clip.tokenize(texts, truncate=True))
+            feats = feats / feats.norm(dim=-1, keepdim=True)
+        return feats.float().cpu().numpy()
+    return await asyncio.to_thread(_encode)
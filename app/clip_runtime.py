@@ -0,0 +1,155 @@
+# app/clip_runtime.py
+import os, re
+from typing import Callable, Optional
+import torch
+import torch.nn as nn
+from app import config
+from app.utils.workers import worker_count
+
+# ---- Config ------------------------------------------------------------------
+TORCH_NUM_THREADS     = int(getattr(config, "TORCH_NUM_THREADS", 0))      # 0 -> mặc định của torch
+TORCH_INTEROP_THREADS = int(getattr(config, "TORCH_INTEROP_THREADS", 0))
+CLIP_RUNTIME          = getattr(config, "CLIP_RUNTIME", "fp32")
+CLIP_EXPORT_DIR       = getattr(config, "CLIP_EXPORT_DIR", ".cache/clip")
+# -----------------------------------------------------------------------------
+
+RUNTIMES = ("fp32", "int8", "torchscript", "onnx", "bf16")
+
+Encoder = Callable[[torch.Tensor], torch.Tensor]
+
+_DEFAULT_THREADS = torch.get_num_threads()
+# (tên model, model, preprocess, encoder | None): serve.py load trong master trước khi fork
+_preloaded: Optional[tuple] = None
+
+
+def configure_threads():
+    # nhiều worker: chia đều số core cho các worker thay vì mỗi worker giành hết
+    n = TORCH_NUM_THREADS if TORCH_NUM_THREADS > 0 else max(1, _DEFAULT_THREADS // worker_count())
+    if n != torch.get_num_threads():
+        torch.set_num_threads(n)
+    if TORCH_INTEROP_THREADS > 0:
+        try:
+            torch.set_num_interop_threads(TORCH_INTEROP_THREADS)
+        except RuntimeError:
+            pass  # chỉ set được trước khi torch chạy op song song đầu tiên
+
+
+def input_resolution(model) -> int:
+    return int(getattr(getattr(model, "visual", None), "input_resolution", 224))
+
+
+class _Visual(nn.Module):
+    """Bọc model.encode_image thành module 1 input để trace/export."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.visual = model.visual
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.visual(x)
+
+
+def _export_path(model_name: str, suffix: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", model_name).strip("-").lower()
+    os.makedirs(CLIP_EXPORT_DIR, exist_ok=True)
+    return os.path.join(CLIP_EXPORT_DIR, f"{slug}.{suffix}")
+
+
+def _example(model) -> torch.Tensor:
+    side = input_resolution(model)
+    return torch.zeros(1, 3, side, side, dtype=model.dtype)
+
+
+def _int8(model) -> Encoder:
+    # dynamic quantization: Linear (attention + MLP) sang int8, activation vẫn float
+    visual = torch.ao.quantization.quantize_dynamic(_Visual(model), {nn.Linear}, dtype=torch.qint8)
+    return lambda x: visual(x.type(model.dtype))
+
+
+def _torchscript(model, model_name: str) -> Encoder:
+    path = _export_path(model_name, "ts")
+    if os.path.exists(path):
+        traced = torch.jit.load(path)
+    else:
+        with torch.inference_mode(False), torch.no_grad():
+            traced = torch.jit.trace(_Visual(model).eval(), _example(model))
+        traced.save(path)
+    traced = torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+    return lambda x: traced(x.type(model.dtype))
+
+
+def _onnx(model, model_name: str) -> Encoder:
+    try:
+        import onnxruntime as ort
+    except ImportError as e:
+        raise RuntimeError("CLIP_RUNTIME=onnx cần cài onnxruntime") from e
+    path = _export_path(model_name, "onnx")
+    if not os.path.exists(path):
+        with torch.no_grad():
+            torch.onnx.export(
+                _Visual(model).eval(), _example(model), path,
+                input_names=["image"], output_names=["embedding"],
+                dynamic_axes={"image": {0: "batch"}, "embedding": {0: "batch"}},
+                opset_version=17,
+            )
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if TORCH_NUM_THREADS > 0:
+        opts.intra_op_num_threads = TORCH_NUM_THREADS
+    sess = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+    return lambda x: torch.from_numpy(sess.run(None, {"image": x.float().numpy()})[0])
+
+
+def _bf16(model) -> Encoder:
+    model.visual.to(memory_format=torch.channels_last)
+    try:
+        bf16_ok = torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except Exception:
+        bf16_ok = False
+
+    def encode(x: torch.Tensor) -> torch.Tensor:
+        x = x.type(model.dtype).contiguous(memory_format=torch.channels_last)
+        if not bf16_ok:  # CPU không có AVX512-BF16/AMX: chỉ giữ channels_last
+            return model.encode_image(x)
+        with torch.autocast("cpu", dtype=torch.bfloat16):
+            return model.encode_image(x).float()
+    return encode
+
+
+def build_encoder(model, model_name: str, runtime: str = CLIP_RUNTIME) -> Encoder:
+    """Hàm batch ảnh (N×3×H×W) -> vector chưa chuẩn hoá, theo runtime đã chọn."""
+    runtime = (runtime or "fp32").lower()
+    if runtime == "fp32":
+        return model.encode_image
+    if runtime == "int8":
+        return _int8(model)
+    if runtime == "torchscript":
+        return _torchscript(model, model_name)
+    if runtime == "onnx":
+        return _onnx(model, model_name)
+    if runtime == "bf16":
+        return _bf16(model)
+    raise ValueError(f"CLIP_RUNTIME không hỗ trợ: {runtime} (chọn 1 trong {', '.join(RUNTIMES)})")
+
+
+def preload(model_name: str, runtime: str = CLIP_RUNTIME):
+    """Load weights (+ encoder) trong master của serve.py, trước khi fork.
+
+    Các worker dùng chung trang nhớ của weights (copy-on-write, weights không bị ghi khi suy luận).
+    Chạy 1 thread để không có thread pool OpenMP nào tồn tại lúc fork. ONNX Runtime tạo thread pool
+    ngay khi mở session nên encoder onnx vẫn dựng trong từng worker.
+    """
+    global _preloaded
+    import clip
+    torch.set_num_threads(1)
+    model, preprocess = clip.load(model_name, device="cpu")
+    model.eval()
+    encoder = None if (runtime or "").lower() == "onnx" else build_encoder(model, model_name, runtime)
+    _preloaded = (model_name, model, preprocess, encoder)
+
+
+def take_preloaded(model_name: str) -> Optional[tuple]:
+    """(model, preprocess, encoder | None) nếu master đã preload đúng model này."""
+    if _preloaded is None or _preloaded[0] != model_name:
+        return None
+    return _preloaded[1:]
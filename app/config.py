@@ -12,4 +12,127 @@ PROXY_URL = os.getenv("PROXY_URL", "")
 
 # NEW: chống rate-limit
 SEARCH_RETRIES = int(os.getenv("SEARCH_RETRIES", "4"))
-SEARCH_BACKOFF_BASE = float(os.getenv("SEARCH_BACKOFF_BASE", "1.6"))
\ No newline at end of file
+SEARCH_BACKOFF_BASE = float(os.getenv("SEARCH_BACKOFF_BASE", "1.6"))
+# số biến thể query chạy cùng lúc; 1 = tuần tự theo thứ tự planner (ít call nhất, chậm hơn)
+SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", "3"))
+SEARCH_MIN_GAP = float(os.getenv("SEARCH_MIN_GAP", "0.6"))
+
+# HTTP connection pool dùng chung
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "6"))
+HTTP_HTTP2 = os.getenv("HTTP_HTTP2", "1").lower() not in ("0", "false", "no")
+
+# Token bucket theo host (app/utils/ratelimit.py)
+HTTP_RATE_DEFAULT = float(os.getenv("HTTP_RATE_DEFAULT", "0.66"))
+HTTP_RATE_BURST = float(os.getenv("HTTP_RATE_BURST", "2"))
+HTTP_RATE_MIN_FACTOR = float(os.getenv("HTTP_RATE_MIN_FACTOR", "0.1"))
+# ghi đè theo host: "realestate.com.au=0.4:2,domain.com.au=0.4:2" (token/giây:burst)
+HTTP_RATE_BY_HOST = {
+    h.strip(): tuple(float(x) for x in (v.split(":", 1) if ":" in v else (v, os.getenv("HTTP_RATE_BURST", "2"))))
+    for h, _, v in (p.partition("=") for p in os.getenv("HTTP_RATE_BY_HOST", "").split(","))
+    if h.strip() and v.strip()
+}
+
+# Cache kết quả search (app/search_cache.py)
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", str(6 * 3600)))
+SEARCH_CACHE_NEG_TTL = float(os.getenv("SEARCH_CACHE_NEG_TTL", "900"))
+SEARCH_CACHE_MAX = int(os.getenv("SEARCH_CACHE_MAX", "2048"))
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", "")
+
+# Planner biến thể địa chỉ (app/address_plan.py)
+SEARCH_COMBINED_SITES = os.getenv("SEARCH_COMBINED_SITES", "1").lower() not in ("0", "false", "no")
+SEARCH_MAX_CALLS = int(os.getenv("SEARCH_MAX_CALLS", "0"))     # 0 = không giới hạn call upstream / địa chỉ
+SEARCH_SHAPE_STATS_PATH = os.getenv("SEARCH_SHAPE_STATS_PATH", "")  # "" -> chỉ học trong RAM
+
+# Cache HTML trang listing trên đĩa (app/utils/page_cache.py); PAGE_CACHE_DIR="" để tắt
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", ".cache/pages")
+PAGE_CACHE_FRESH_S = float(os.getenv("PAGE_CACHE_FRESH_S", "3600"))
+PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# "realestate.com.au=1800,domain.com.au=3600"
+PAGE_CACHE_FRESH_BY_HOST = {
+    h.strip(): float(s)
+    for h, _, s in (p.partition("=") for p in os.getenv("PAGE_CACHE_FRESH_BY_HOST", "").split(","))
+    if h.strip() and s.strip()
+}
+
+# Cache vector CLIP (app/embed_cache.py); EMBED_CACHE_DIR="" để tắt
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", ".cache/embeddings")
+
+# Micro-batching CLIP (app/clip_batcher.py)
+CLIP_MAX_BATCH = int(os.getenv("CLIP_MAX_BATCH", "32"))
+CLIP_MAX_WAIT_MS = float(os.getenv("CLIP_MAX_WAIT_MS", "10"))
+EMBED_FETCH_CONCURRENCY = int(os.getenv("EMBED_FETCH_CONCURRENCY", "8"))
+CLIP_DECODE_WORKERS = int(os.getenv("CLIP_DECODE_WORKERS", "4"))
+
+# Khởi động CLIP + runtime CPU (app/clip_runtime.py)
+CLIP_WARMUP = os.getenv("CLIP_WARMUP", "1").lower() not in ("0", "false", "no")
+CLIP_RUNTIME = os.getenv("CLIP_RUNTIME", "fp32")  # fp32 | int8 | torchscript | onnx | bf16
+CLIP_EXPORT_DIR = os.getenv("CLIP_EXPORT_DIR", ".cache/clip")
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", "0"))
+TORCH_INTEROP_THREADS = int(os.getenv("TORCH_INTEROP_THREADS", "0"))
+
+# Gắn tag zero-shot cho ảnh (app/photo_tags.py, /scrape|/listings?tags=true): nhãn cách nhau dấu phẩy
+# (trống = bộ mặc định), mẫu câu cho encode_text, xác suất tối thiểu, số ảnh đầu mỗi listing (0 = mọi ảnh),
+# thư mục cache vector text của bộ nhãn theo model ("" = chỉ RAM)
+TAG_LABELS = os.getenv("TAG_LABELS", "")
+TAG_PROMPT = os.getenv("TAG_PROMPT", "a real estate photo of {}")
+TAG_MIN_SCORE = float(os.getenv("TAG_MIN_SCORE", "0.3"))
+TAG_MAX_PHOTOS = int(os.getenv("TAG_MAX_PHOTOS", "0"))
+TAG_CACHE_DIR = os.getenv("TAG_CACHE_DIR", ".cache/tags")
+
+# Photo index (app/photo_index.py); PHOTO_INDEX_DIR="" -> chỉ giữ trong RAM
+PHOTO_INDEX_DIR = os.getenv("PHOTO_INDEX_DIR", ".cache/photo-index")
+PHOTO_INDEX_DTYPE = os.getenv("PHOTO_INDEX_DTYPE", "float16")  # float16 | int8
+# ANN (IVF-PQ, app/ann.py) cho photo index: mặc định mỗi truy vấn
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "16"))
+ANN_RERANK = int(os.getenv("ANN_RERANK", "100"))
+ANN_M = int(os.getenv("ANN_M", "32"))
+# JSON-LD: "fast" (quét byte, không dựng DOM) | "bs4" (BeautifulSoup như cũ)
+JSONLD_PARSER = os.getenv("JSONLD_PARSER", "fast")
+# Parse HTML -> PropertyItem: process | thread | inline; 0 -> số CPU / 4 × workers
+PARSE_EXECUTOR = os.getenv("PARSE_EXECUTOR", "process")
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0"))
+PARSE_MAX_INFLIGHT = int(os.getenv("PARSE_MAX_INFLIGHT", "0"))
+# /listings/stream: deadline mặc định (giây), hết hạn thì trả phần đã có
+LISTINGS_STREAM_DEADLINE_S = float(os.getenv("LISTINGS_STREAM_DEADLINE_S", "30"))
+# Batch job (/batch/listings): SQLite job store ("" -> RAM), số worker, tổng địa chỉ chờ tối đa
+BATCH_DB_PATH = os.getenv("BATCH_DB_PATH", ".cache/batch.sqlite3")
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+BATCH_MAX_PENDING = int(os.getenv("BATCH_MAX_PENDING", "20000"))
+BATCH_ADDRESS_TIMEOUT_S = float(os.getenv("BATCH_ADDRESS_TIMEOUT_S", "120"))
+# Listing store (app/listing_store.py): SQLite ("" -> RAM), số trang tải song song khi refresh
+LISTING_STORE_PATH = os.getenv("LISTING_STORE_PATH", ".cache/listings.sqlite3")
+LISTING_REFRESH_CONCURRENCY = int(os.getenv("LISTING_REFRESH_CONCURRENCY", "8"))
+# Geo index (/nearby): cạnh ô lưới tính bằng độ (0.01 ≈ 1.1 km)
+GEO_CELL_DEG = float(os.getenv("GEO_CELL_DEG", "0.01"))
+# Gộp listing trùng giữa các site (app/dedup.py): ngưỡng Hamming pHash/dHash, số ảnh giống tối thiểu,
+# khoảng cách toạ độ tối đa (m) để so ảnh, số ảnh đầu mỗi listing được hash, cỡ LRU hash theo URL
+DEDUP_HAMMING_MAX = int(os.getenv("DEDUP_HAMMING_MAX", "6"))
+DEDUP_MIN_PHOTO_MATCHES = int(os.getenv("DEDUP_MIN_PHOTO_MATCHES", "2"))
+DEDUP_GEO_M = float(os.getenv("DEDUP_GEO_M", "75"))
+DEDUP_MAX_PHOTOS = int(os.getenv("DEDUP_MAX_PHOTOS", "16"))
+DEDUP_HASH_CACHE = int(os.getenv("DEDUP_HASH_CACHE", "20000"))
+# Nhiều worker (serve.py): số worker, thư mục SQLite dùng chung giữa các worker (rate limit, cache mặc định);
+# RATELIMIT_BACKEND=sqlite -> token bucket theo host chung mọi worker (serve.py tự bật khi WORKERS > 1);
+# GEO_SYNC_S: chu kỳ mỗi worker nạp listing mới/đổi từ listing store vào geo index của mình
+WORKERS = int(os.getenv("WORKERS", "1"))
+SHARED_STATE_DIR = os.getenv("SHARED_STATE_DIR", ".cache/shared")
+RATELIMIT_BACKEND = os.getenv("RATELIMIT_BACKEND") or "memory"
+GEO_SYNC_S = float(os.getenv("GEO_SYNC_S", "5"))
+# Nén response (app/utils/compress.py): encoding theo thứ tự ưu tiên ("" = tắt; br cần cài brotli),
+# chỉ nén body >= COMPRESS_MIN_BYTES; mức nén gzip / quality brotli (thấp = nhanh hơn, nén kém hơn)
+COMPRESS_ENCODINGS = os.getenv("COMPRESS_ENCODINGS", "br,gzip")
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "5"))
+COMPRESS_BR_QUALITY = int(os.getenv("COMPRESS_BR_QUALITY", "4"))
+# Metrics (/metrics, Prometheus) + log: LOG_FORMAT=text|json; LOG_REQUESTS=1 -> 1 dòng log/request kèm thời gian từng stage
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_REQUESTS = os.getenv("LOG_REQUESTS", "0").lower() not in ("0", "false", "no")
+# Bench/offline: chuyển mọi request upstream tới 1 server thay thế (bench/fake_upstream.py);
+# SEARCH_BACKEND=html -> search qua trang HTML của DDG (đi qua Http, nên theo override ở trên)
+HTTP_UPSTREAM_OVERRIDE = os.getenv("HTTP_UPSTREAM_OVERRIDE", "")
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "ddg")
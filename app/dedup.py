@@ -0,0 +1,352 @@
+# app/dedup.py
+"""Gộp listing trùng giữa realestate.com.au và domain.com.au (cùng 1 căn, 2 trang).
+
+- Cùng địa chỉ chuẩn hoá (address_plan.parse_address) -> cùng căn; 2 listing cùng site chỉ gộp khi cùng
+  listing_id (cùng site, khác id = đăng lại / căn khác chuẩn hoá ra cùng key).
+- Khác site, 1 bên thiếu địa chỉ / thiếu unit, toạ độ gần nhau (hoặc thiếu toạ độ) -> so ảnh: pHash +
+  dHash 64 bit, tra bằng HammingIndex; đủ DEDUP_MIN_PHOTO_MATCHES ảnh giống nhau -> cùng căn. 2 địa chỉ
+  rõ ràng khác nhau (khác unit / số nhà / đường) không bao giờ gộp theo ảnh, kể cả bắc cầu qua 1 listing
+  giấu địa chỉ khớp ảnh với cả 2.
+- Mỗi nhóm ra 1 PropertyItem: trường thiếu lấy từ bản kia, `source_urls` gồm mọi URL, ảnh trùng URL chỉ
+  giữ 1; ảnh giống nhau (khác URL) chỉ bỏ được giữa các listing đã so ảnh.
+
+Chỉ tải ảnh của các cặp cần so ảnh (nhóm đã gộp theo địa chỉ không tải gì); bytes đã tải được để lại
+trong `prefetched` cho embed dùng tiếp.
+"""
+import asyncio, io, logging
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+from app import config
+from app.address_plan import ParsedAddress, parse_address
+from app.geo_index import _haversine_km
+from app.schemas import PropertyItem
+from app.utils.http import Http
+from app.utils.metrics import log
+
+# ---- Config ------------------------------------------------------------------
+DEDUP_HAMMING_MAX       = int(getattr(config, "DEDUP_HAMMING_MAX", 6))        # bit khác tối đa (cả pHash và dHash)
+DEDUP_MIN_PHOTO_MATCHES = int(getattr(config, "DEDUP_MIN_PHOTO_MATCHES", 2))  # số ảnh giống để coi là cùng căn
+DEDUP_GEO_M             = float(getattr(config, "DEDUP_GEO_M", 75))           # toạ độ cách hơn -> không so ảnh
+DEDUP_MAX_PHOTOS        = int(getattr(config, "DEDUP_MAX_PHOTOS", 16))        # số ảnh đầu mỗi listing được hash
+DEDUP_HASH_CACHE        = int(getattr(config, "DEDUP_HASH_CACHE", 20000))     # URL ảnh -> hash, LRU trong RAM
+DEDUP_FETCH_CONCURRENCY = int(getattr(config, "EMBED_FETCH_CONCURRENCY", 8))
+# -----------------------------------------------------------------------------
+
+ImageHash = Tuple[int, int]  # (pHash, dHash)
+
+_DCT = np.cos(np.pi * np.outer(np.arange(32), 2 * np.arange(32) + 1) / 64)  # ma trận DCT-II 32x32 (chưa chuẩn hoá)
+
+
+def _bits(mask: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(mask.ravel()).tobytes(), "big")
+
+
+def image_hashes(raw: bytes) -> ImageHash:
+    """(pHash, dHash) 64 bit của 1 ảnh. JPEG decode thẳng ở kích thước nhỏ (draft) nên rất rẻ."""
+    img = Image.open(io.BytesIO(raw))
+    if img.format == "JPEG":
+        img.draft("L", (64, 64))
+    img = img.convert("L")
+    px = np.asarray(img.resize((32, 32), Image.Resampling.LANCZOS), dtype=np.float64)
+    low = (_DCT @ px @ _DCT.T)[:8, :8]
+    ph = _bits(low > np.median(low))
+    dx = np.asarray(img.resize((9, 8), Image.Resampling.LANCZOS), dtype=np.int16)
+    dh = _bits(dx[:, 1:] > dx[:, :-1])
+    return ph, dh
+
+
+class HammingIndex:
+    """Multi-index hashing cho hash 64 bit, tìm mọi hash cách <= max_dist bit.
+
+    Hash được chia thành max_dist + 1 đoạn, mỗi đoạn 1 bảng băm. Hai hash cách nhau <= max_dist bit
+    thì trùng khít ít nhất 1 đoạn, nên chỉ cần popcount với ứng viên cùng bucket thay vì so tất cả.
+    """
+
+    def __init__(self, max_dist: int = DEDUP_HAMMING_MAX, bits: int = 64):
+        self.max_dist = max_dist
+        m = max_dist + 1
+        edges = [round(i * bits / m) for i in range(m + 1)]
+        self._bands = [(lo, (1 << (hi - lo)) - 1) for lo, hi in zip(edges, edges[1:])]
+        self._tables: List[Dict[int, List[int]]] = [defaultdict(list) for _ in self._bands]
+        self._hashes: List[int] = []
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def add(self, h: int) -> int:
+        i = len(self._hashes)
+        self._hashes.append(h)
+        for table, (shift, mask) in zip(self._tables, self._bands):
+            table[(h >> shift) & mask].append(i)
+        return i
+
+    def query(self, h: int) -> List[Tuple[int, int]]:
+        """[(id, khoảng cách)] của mọi hash đã add cách h <= max_dist bit (gồm cả chính nó nếu có)."""
+        seen, out = set(), []
+        for table, (shift, mask) in zip(self._tables, self._bands):
+            for i in table.get((h >> shift) & mask, ()):
+                if i not in seen:
+                    seen.add(i)
+                    d = (h ^ self._hashes[i]).bit_count()
+                    if d <= self.max_dist:
+                        out.append((i, d))
+        return out
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a: int, b: int) -> bool:
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return False
+        self.parent[max(ra, rb)] = min(ra, rb)
+        return True
+
+
+def address_key(item: PropertyItem, a: Optional[ParsedAddress] = None) -> Optional[str]:
+    """Địa chỉ chuẩn hoá; thiếu số nhà hoặc tên đường (vd. "Address available on request") -> None."""
+    a = a or parse_address(item.address or "")
+    if not a.number or not a.street:
+        return None
+    return a.canonical.lower()
+
+
+def _geo_close(a: PropertyItem, b: PropertyItem) -> Optional[bool]:
+    if None in (a.latitude, a.longitude, b.latitude, b.longitude):
+        return None
+    d = _haversine_km(a.latitude, a.longitude, np.array([b.latitude]), np.array([b.longitude]))[0]
+    return bool(d * 1000 <= DEDUP_GEO_M)
+
+
+def _same_place(pa: ParsedAddress, pb: ParsedAddress) -> bool:
+    """2 địa chỉ đều có số nhà: chỉ có thể cùng căn khi cùng số + đường và unit không mâu thuẫn.
+
+    "3/5 George St" vs "5 George St" (1 bên thiếu unit) -> có thể; "3/5" vs "4/5" -> không: 2 căn cùng toà
+    nhà thường dùng chung ảnh sảnh / hồ bơi / mặt tiền.
+    """
+    if pa.number.lower() != pb.number.lower() or (pa.street or "").lower() != (pb.street or "").lower():
+        return False
+    if pa.street_type and pb.street_type and pa.street_type != pb.street_type:
+        return False
+    return pa.unit is None or pb.unit is None or pa.unit.lower() == pb.unit.lower()
+
+
+def _same_listing(a: PropertyItem, b: PropertyItem) -> bool:
+    return a.source == b.source and (a.url == b.url or bool(a.listing_id) and a.listing_id == b.listing_id)
+
+
+def _maybe_same(a: PropertyItem, b: PropertyItem, pa: ParsedAddress, pb: ParsedAddress,
+                ka: Optional[str], kb: Optional[str]) -> bool:
+    """Cặp chưa khớp địa chỉ có đáng tải ảnh ra so không (chỉ cặp khác site: realestate vs domain)."""
+    if a.source == b.source:
+        return False
+    if ka is not None and kb is not None and not _same_place(pa, pb):
+        return False
+    close = _geo_close(a, b)
+    if close is not None:
+        return close                   # "3/5 George St" vs "5 George St" cùng toạ độ -> so ảnh
+    return ka is None or kb is None    # không toạ độ: chỉ so khi 1 bên thiếu địa chỉ
+
+
+class _HashCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, ImageHash]" = OrderedDict()
+
+    def get(self, url: str) -> Optional[ImageHash]:
+        h = self._data.get(url)
+        if h is not None:
+            self._data.move_to_end(url)
+        return h
+
+    def set(self, url: str, h: ImageHash):
+        self._data[url] = h
+        self._data.move_to_end(url)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+_hash_cache = _HashCache(DEDUP_HASH_CACHE)
+_stats = {"runs": 0, "listings_in": 0, "listings_out": 0, "merged_by_address": 0, "merged_by_photos": 0,
+          "photos_hashed": 0, "photos_dropped": 0, "hash_errors": 0}
+
+
+async def _hash_images(http: Http, urls: List[str], prefetched: Optional[Dict[str, bytes]]) -> Dict[str, ImageHash]:
+    out: Dict[str, ImageHash] = {}
+    slots = asyncio.Semaphore(DEDUP_FETCH_CONCURRENCY)
+
+    async def _one(url: str):
+        h = _hash_cache.get(url)
+        if h is None:
+            try:
+                raw = prefetched.get(url) if prefetched is not None else None
+                if raw is None:
+                    async with slots:
+                        raw = await http.get_bytes(url)
+                    if prefetched is not None:
+                        prefetched[url] = raw
+                h = await asyncio.to_thread(image_hashes, raw)
+            except Exception as e:
+                _stats["hash_errors"] += 1
+                log("dedup_hash_error", logging.DEBUG, url=url, error=str(e))
+                return
+            _hash_cache.set(url, h)
+            _stats["photos_hashed"] += 1
+        out[url] = h
+    await asyncio.gather(*(_one(u) for u in dict.fromkeys(urls)))
+    return out
+
+
+_EMPTY = (None, "", [], {})
+_SKIP = {"source", "url", "listing_id", "images", "raw", "cache", "change", "source_urls"}
+
+
+def _richness(item: PropertyItem) -> Tuple[int, int]:
+    return sum(v not in _EMPTY for k, v in item.model_dump().items() if k not in _SKIP), len(item.images)
+
+
+def merge_items(group: List[PropertyItem], photo_of: Dict[Tuple[int, str], int],
+                members: List[int]) -> Tuple[PropertyItem, int]:
+    """Gộp 1 nhóm thành 1 item; `photo_of[(listing, url)]` = id nhóm ảnh (ảnh giống nhau cùng id).
+
+    Bản "đầy đủ" nhất làm gốc (giữ source/url/listing_id); trả (item, số ảnh trùng đã bỏ).
+    """
+    order = sorted(range(len(group)), key=lambda i: _richness(group[i]), reverse=True)  # sort ổn định
+    primary = group[order[0]]
+    data = primary.model_dump()
+    for i in order[1:]:
+        for k, v in group[i].model_dump().items():
+            if k not in _SKIP and data.get(k) in _EMPTY and v not in _EMPTY:
+                data[k] = v
+        for fk, fv in group[i].features.items():
+            data["features"].setdefault(fk, fv)
+    images, seen_urls, seen_photos, dropped = [], set(), set(), 0
+    for i in order:
+        for url in group[i].images:
+            photo = photo_of.get((members[i], url))
+            if url in seen_urls or (photo is not None and photo in seen_photos):
+                dropped += 1
+                continue
+            seen_urls.add(url)
+            if photo is not None:
+                seen_photos.add(photo)
+            images.append(url)
+    data["images"] = images
+    data["source_urls"] = [group[i].url for i in order]
+    return PropertyItem(**data), dropped
+
+
+async def dedupe_listings(items: List[PropertyItem], http: Http,
+                          prefetched: Optional[Dict[str, bytes]] = None) -> List[PropertyItem]:
+    """Gộp listing trùng, giữ thứ tự xuất hiện đầu tiên của mỗi nhóm.
+
+    `prefetched` (nếu có): URL ảnh -> bytes đã tải; ảnh tải thêm để hash cũng được ghi vào đây.
+    """
+    n = len(items)
+    _stats["runs"] += 1
+    _stats["listings_in"] += n
+    parsed = [parse_address(x.address or "") for x in items]
+    keys = [address_key(x, a) for x, a in zip(items, parsed)]
+    uf = _UnionFind(n)
+    members: Dict[int, List[int]] = {i: [i] for i in range(n)}  # gốc -> các listing trong nhóm
+
+    def _conflict(a: int, b: int) -> bool:
+        """Gộp 2 nhóm có sinh ra 2 listing khác nhau cùng site, hoặc 2 địa chỉ rõ ràng khác nhau không."""
+        for x in members[a]:
+            for y in members[b]:
+                if items[x].source == items[y].source and not _same_listing(items[x], items[y]):
+                    return True
+                if keys[x] is not None and keys[y] is not None and not _same_place(parsed[x], parsed[y]):
+                    return True
+        return False
+
+    def _join(i: int, j: int) -> bool:
+        a, b = uf.find(i), uf.find(j)
+        if a == b or _conflict(a, b):
+            return False
+        uf.union(a, b)
+        root = uf.find(a)
+        members[root] += members.pop(b if root == a else a)
+        return True
+
+    by_key: Dict[str, List[int]] = defaultdict(list)
+    for i, k in enumerate(keys):
+        if k is not None:
+            for j in by_key[k]:
+                if _join(j, i):
+                    _stats["merged_by_address"] += 1
+                    break
+            by_key[k].append(i)
+
+    cands = [(i, j) for i in range(n) for j in range(i + 1, n)
+             if uf.find(i) != uf.find(j)
+             and _maybe_same(items[i], items[j], parsed[i], parsed[j], keys[i], keys[j])]
+    # chỉ hash ảnh của listing đang nghi trùng: nhóm đã gộp theo địa chỉ không tải ảnh chỉ để bỏ ảnh trùng
+    need = {i for pair in cands for i in pair}
+
+    photo_of: Dict[Tuple[int, str], int] = {}
+    if need:
+        hashes = await _hash_images(http, [u for i in sorted(need) for u in items[i].images[:DEDUP_MAX_PHOTOS]],
+                                    prefetched)
+        entries: List[Tuple[int, str, ImageHash]] = [
+            (i, u, hashes[u]) for i in sorted(need) for u in dict.fromkeys(items[i].images[:DEDUP_MAX_PHOTOS])
+            if u in hashes
+        ]
+        index = HammingIndex(DEDUP_HAMMING_MAX)
+        for _, _, (ph, _) in entries:
+            index.add(ph)
+        photos = _UnionFind(len(entries))
+        shared: Dict[Tuple[int, int], set] = defaultdict(set)  # cặp listing -> ảnh của listing đầu khớp ảnh bên kia
+        for e, (i, _, (ph, dh)) in enumerate(entries):
+            for f, _ in index.query(ph):
+                j, _, (_, dh2) = entries[f]
+                if f != e and (dh ^ dh2).bit_count() <= DEDUP_HAMMING_MAX:
+                    photos.union(e, f)
+                    if i < j:
+                        shared[(i, j)].add(e)
+        counts = defaultdict(int)
+        for i, _, _ in entries:
+            counts[i] += 1
+        for i, j in cands:
+            # 2 địa chỉ rõ ràng khác nhau (vd. 2 căn cạnh nhau chung ảnh toà nhà) -> đòi đủ số ảnh;
+            # 1 bên giấu địa chỉ và ít ảnh thì chấp nhận ít hơn
+            want = DEDUP_MIN_PHOTO_MATCHES if keys[i] and keys[j] else \
+                max(1, min(DEDUP_MIN_PHOTO_MATCHES, counts[i], counts[j]))
+            if len(shared.get((i, j), ())) >= want:
+                _stats["merged_by_photos"] += _join(i, j)
+        photo_of = {(i, u): photos.find(e) for e, (i, u, _) in enumerate(entries)}
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(n):
+        groups.setdefault(uf.find(i), []).append(i)
+    out, dropped = [], 0
+    for members in groups.values():
+        if len(members) == 1:
+            item = items[members[0]].model_copy(update={"source_urls": [items[members[0]].url]})
+        else:
+            item, d = merge_items([items[i] for i in members], photo_of, members)
+            dropped += d
+        out.append(item)
+    _stats["listings_out"] += len(out)
+    _stats["photos_dropped"] += dropped
+    if len(out) < n:
+        log("dedup", listings=n, unique=len(out), photos_dropped=dropped, compared_pairs=len(cands))
+    return out
+
+
+def stats() -> dict:
+    return {**_stats, "hash_cache": len(_hash_cache), "hamming_max": DEDUP_HAMMING_MAX,
+            "min_photo_matches": DEDUP_MIN_PHOTO_MATCHES, "geo_m": DEDUP_GEO_M}
@@ -0,0 +1,178 @@
+# app/embed_cache.py
+import hashlib, os, re, sqlite3, threading
+from typing import Dict, List, Optional
+import numpy as np
+from app import config
+
+# ---- Config ------------------------------------------------------------------
+EMBED_CACHE_DIR     = getattr(config, "EMBED_CACHE_DIR", "")  # "" -> tắt cache
+EMBED_CACHE_INITIAL = 1024                                     # số dòng cấp phát ban đầu
+# -----------------------------------------------------------------------------
+
+
+def content_hash(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+
+class EmbeddingCache:
+    """Cache vector CLIP trên đĩa cho 1 model.
+
+    Vector lưu float16 trong 1 file memmap (mỗi dòng 1 ảnh); index SQLite map
+    key -> dòng. Key gồm tên model + URL ảnh, hoặc tên model + sha256 bytes ảnh
+    (để các biến thể URL của CDN trỏ về cùng 1 dòng). Method đều blocking.
+
+    Nhiều worker (serve.py) dùng chung được: cấp dòng mới trong transaction IMMEDIATE (số dòng lấy
+    từ SQLite, không tin bản trong RAM), file memmap chỉ nới ra, ai thấy file lớn hơn mapping của
+    mình thì map lại. Vector ghi xong trước khi commit key nên bên đọc thấy key là có vector.
+    """
+
+    def __init__(self, root: str, model_name: str):
+        self.model = model_name
+        slug = re.sub(r"[^A-Za-z0-9]+", "-", model_name).strip("-").lower()
+        os.makedirs(root, exist_ok=True)
+        self.vec_path = os.path.join(root, f"{slug}.f16")
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, f"{slug}.sqlite3"), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS keys (key TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT NOT NULL)")
+        self._db.commit()
+        meta = dict(self._db.execute("SELECT k, v FROM meta").fetchall())
+        self.dim: Optional[int] = int(meta["dim"]) if "dim" in meta else None
+        self.rows = int(meta.get("rows", 0))
+        self._vecs: Optional[np.memmap] = None
+        if self.dim is not None and os.path.exists(self.vec_path):
+            self._open()
+        self.hits = self.hash_hits = self.misses = 0
+
+    # ---- keys ------------------------------------------------------------------
+    def url_key(self, url: str) -> str:
+        return f"{self.model}|url|{url}"
+
+    def hash_key(self, sha: str) -> str:
+        return f"{self.model}|sha256|{sha}"
+
+    # ---- memmap ----------------------------------------------------------------
+    def _open(self):
+        capacity = os.path.getsize(self.vec_path) // (2 * self.dim)
+        self._vecs = np.memmap(self.vec_path, dtype=np.float16, mode="r+", shape=(capacity, self.dim))
+
+    def _capacity_on_disk(self) -> int:
+        return os.path.getsize(self.vec_path) // (2 * self.dim) if os.path.exists(self.vec_path) else 0
+
+    def _ensure_capacity(self, rows: int):
+        capacity = 0 if self._vecs is None else self._vecs.shape[0]
+        if rows <= capacity:
+            return
+        on_disk = self._capacity_on_disk()  # worker khác có thể đã nới file
+        if rows > on_disk:
+            with open(self.vec_path, "ab") as f:
+                f.truncate(max(EMBED_CACHE_INITIAL, on_disk * 2, rows) * self.dim * 2)
+        if self._vecs is not None:
+            self._vecs.flush()
+            self._vecs = None
+        self._open()
+
+    def _sync(self, need_rows: int = 0) -> bool:
+        """Đọc lại dim / map lại file khi worker khác đã ghi; False nếu cache vẫn rỗng."""
+        if self.dim is None:
+            row = self._db.execute("SELECT v FROM meta WHERE k = 'dim'").fetchone()
+            if row is None:
+                return False
+            self.dim = int(row[0])
+        if self._vecs is None or need_rows > self._vecs.shape[0]:
+            if self._capacity_on_disk() == 0:
+                return False
+            self._vecs = None
+            self._open()
+        return True
+
+    # ---- API -------------------------------------------------------------------
+    def _rows_for(self, keys: List[str]) -> Dict[str, int]:
+        if not keys:
+            return {}
+        out: Dict[str, int] = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            q = "SELECT key, row FROM keys WHERE key IN (%s)" % ",".join("?" * len(chunk))
+            out.update(self._db.execute(q, chunk).fetchall())
+        return out
+
+    def get_urls(self, urls: List[str]) -> Dict[str, np.ndarray]:
+        """URL -> vector float32 cho các URL đã có trong cache."""
+        with self._lock:
+            rows = self._rows_for([self.url_key(u) for u in urls])
+            if not rows or not self._sync(max(rows.values()) + 1):
+                return {}
+            out = {u: np.asarray(self._vecs[rows[self.url_key(u)]], dtype=np.float32)
+                   for u in urls if self.url_key(u) in rows}
+        self.hits += len(out)
+        return out
+
+    def get_hash(self, url: str, sha: str) -> Optional[np.ndarray]:
+        """Ảnh đã thấy dưới URL khác -> gắn thêm key URL này vào cùng dòng và trả vector."""
+        with self._lock:
+            row = self._rows_for([self.hash_key(sha)]).get(self.hash_key(sha))
+            if row is None or not self._sync(row + 1):
+                self.misses += 1
+                return None
+            self._db.execute("INSERT OR REPLACE INTO keys (key, row) VALUES (?, ?)", (self.url_key(url), row))
+            self._db.commit()
+            vec = np.asarray(self._vecs[row], dtype=np.float32)
+        self.hash_hits += 1
+        return vec
+
+    def put(self, url: str, sha: str, vec: np.ndarray):
+        vec = np.asarray(vec, dtype=np.float16).reshape(-1)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")  # giữ quyền ghi tới commit: 1 worker cấp dòng tại 1 thời điểm
+            try:
+                meta = dict(self._db.execute("SELECT k, v FROM meta").fetchall())
+                if "dim" not in meta:
+                    self.dim = int(vec.shape[0])
+                    self._db.execute("INSERT OR REPLACE INTO meta (k, v) VALUES ('dim', ?)", (str(self.dim),))
+                else:
+                    self.dim = int(meta["dim"])
+                    if vec.shape[0] != self.dim:
+                        raise ValueError(f"embedding dim {vec.shape[0]} != cache dim {self.dim}")
+                row = int(meta.get("rows", 0))
+                self._ensure_capacity(row + 1)
+                self._vecs[row] = vec
+                self.rows = row + 1
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO keys (key, row) VALUES (?, ?)",
+                    [(self.url_key(url), row), (self.hash_key(sha), row)],
+                )
+                self._db.execute("INSERT OR REPLACE INTO meta (k, v) VALUES ('rows', ?)", (str(self.rows),))
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+
+    def flush(self):
+        with self._lock:
+            if self._vecs is not None:
+                self._vecs.flush()
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model,
+            "rows": self.rows,
+            "dim": self.dim,
+            "url_hits": self.hits,
+            "hash_hits": self.hash_hits,
+            "misses": self.misses,
+        }
+
+
+_caches: Dict[str, EmbeddingCache] = {}
+
+
+def cache_for(model_name: str) -> Optional[EmbeddingCache]:
+    """1 cache (file vector + index riêng) cho mỗi model; None nếu tắt cache."""
+    if not EMBED_CACHE_DIR:
+        return None
+    c = _caches.get(model_name)
+    if c is None:
+        c = _caches[model_name] = EmbeddingCache(EMBED_CACHE_DIR, model_name)
+    return c
@@ -0,0 +1,196 @@
+# app/geo_index.py
+import math, re, threading
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from app import config
+
+# ---- Config ------------------------------------------------------------------
+GEO_CELL_DEG = float(getattr(config, "GEO_CELL_DEG", 0.01))   # cạnh ô lưới (độ), ~1.1 km
+# -----------------------------------------------------------------------------
+
+EARTH_KM = 6371.0088
+KM_PER_DEG = math.pi * EARTH_KM / 180
+
+_PRICE_NUM = re.compile(r"(\d[\d,]*(?:\.\d+)?)\s*(m|mil|million|k)?\b", re.I)
+_META = ("source", "listing_id", "url", "address", "price", "bedrooms", "bathrooms", "parking")
+
+
+def parse_price(price: Optional[str]) -> Tuple[float, float]:
+    """"$1,250,000" / "$1.2m" / "$900k - $950k" -> (thấp, cao); không đọc được -> (nan, nan).
+
+    Số < 1000 không kèm k/m (vd. "3 bed", "Auction 15 March") bị bỏ qua.
+    """
+    vals = []
+    for num, unit in _PRICE_NUM.findall(price or ""):
+        v = float(num.replace(",", ""))
+        unit = unit.lower()
+        if unit.startswith("m"):
+            v *= 1e6
+        elif unit == "k":
+            v *= 1e3
+        if v >= 1000:
+            vals.append(v)
+    if not vals:
+        return math.nan, math.nan
+    return min(vals), max(vals)
+
+
+def _haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    p1, p2 = math.radians(lat), np.radians(lats)
+    a = (np.sin((p2 - p1) / 2) ** 2
+         + math.cos(p1) * np.cos(p2) * np.sin(np.radians(lons - lon) / 2) ** 2)
+    return 2 * EARTH_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class GeoIndex:
+    """Lưới ô vuông GEO_CELL_DEG độ trên mảng numpy toạ độ + thuộc tính, cho /nearby và bbox.
+
+    Mỗi ô giữ danh sách dòng; truy vấn chỉ lấy các ô giao với vùng tìm rồi lọc vector hoá
+    (khoảng cách, phòng ngủ, giá...). Vùng phủ nhiều ô hơn số ô đang có dữ liệu thì quét thẳng
+    toàn bộ mảng. Thêm/cập nhật là O(1), gọi ngay khi scrape xong 1 trang.
+    """
+
+    def __init__(self, cell_deg: float = GEO_CELL_DEG):
+        self.cell = cell_deg
+        self.n = 0
+        self._lat = np.zeros(0, dtype=np.float64)
+        self._lon = np.zeros(0, dtype=np.float64)
+        self._attrs = np.zeros((0, 5), dtype=np.float32)  # bedrooms, bathrooms, parking, giá thấp, giá cao
+        self._meta: List[dict] = []
+        self._rows: Dict[str, int] = {}                   # "source:listing_id" -> dòng
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+        self._cell_arrays: Dict[Tuple[int, int], np.ndarray] = {}  # bản np của ô, bỏ đi khi ô đổi
+        self._lock = threading.Lock()
+
+    def _cell_of(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell), math.floor(lon / self.cell)
+
+    def _grow(self, need: int):
+        cap = len(self._lat)
+        if need <= cap:
+            return
+        new_cap = max(1024, cap * 2, need)
+        for name in ("_lat", "_lon", "_attrs"):
+            old = getattr(self, name)
+            new = np.zeros((new_cap,) + old.shape[1:], dtype=old.dtype)
+            new[:self.n] = old[:self.n]
+            setattr(self, name, new)
+
+    # ---- mutate --------------------------------------------------------------
+    def upsert(self, listing: dict) -> bool:
+        """Thêm/cập nhật 1 listing (dict PropertyItem hoặc dòng của listing store); không có toạ độ -> False."""
+        lat, lon = listing.get("latitude"), listing.get("longitude")
+        if lat is None or lon is None:
+            return False
+        lat, lon = float(lat), float(lon)
+        key = f"{listing.get('source')}:{listing.get('listing_id') or listing.get('url')}"
+        lo, hi = parse_price(listing.get("price"))
+        attrs = [listing.get(k) for k in ("bedrooms", "bathrooms", "parking")]
+        attrs = [math.nan if v is None else float(v) for v in attrs] + [lo, hi]
+        cell = self._cell_of(lat, lon)
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                self._grow(self.n + 1)
+                row = self._rows[key] = self.n
+                self.n += 1
+                self._meta.append({})
+                moved = True
+            else:
+                old = self._cell_of(self._lat[row], self._lon[row])
+                moved = old != cell
+                if moved:  # listing đổi toạ độ sang ô khác
+                    self._cells[old].remove(row)
+                    self._cell_arrays.pop(old, None)
+                    if not self._cells[old]:
+                        del self._cells[old]
+            if moved:
+                self._cells.setdefault(cell, []).append(row)
+                self._cell_arrays.pop(cell, None)
+            self._lat[row], self._lon[row] = lat, lon
+            self._attrs[row] = attrs
+            self._meta[row] = {k: listing.get(k) for k in _META}
+        return True
+
+    def extend(self, listings: Iterable[dict]) -> int:
+        return sum(self.upsert(x) for x in listings)
+
+    # ---- query ---------------------------------------------------------------
+    def _rows_in(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> np.ndarray:
+        (i0, j0), (i1, j1) = self._cell_of(min_lat, min_lon), self._cell_of(max_lat, max_lon)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self._cells):
+            return np.arange(self.n)  # vùng rộng: quét thẳng rẻ hơn duyệt ô
+        parts = []
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                arr = self._cell_arrays.get((i, j))
+                if arr is None:
+                    rows = self._cells.get((i, j))
+                    if not rows:
+                        continue
+                    arr = self._cell_arrays[(i, j)] = np.array(rows, dtype=np.int64)
+                parts.append(arr)
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def _filter(self, rows: np.ndarray, filters: dict) -> np.ndarray:
+        if not len(rows):
+            return rows
+        a = self._attrs[rows]
+        mask = np.ones(len(rows), dtype=bool)
+        for col, name in enumerate(("bedrooms", "bathrooms", "parking")):
+            lo, hi = filters.get(f"min_{name}"), filters.get(f"max_{name}")
+            if lo is not None:
+                mask &= a[:, col] >= lo       # NaN (không rõ) luôn bị loại khi có lọc
+            if hi is not None:
+                mask &= a[:, col] <= hi
+        # khoảng giá của listing phải giao với [min_price, max_price]
+        if filters.get("min_price") is not None:
+            mask &= a[:, 4] >= filters["min_price"]
+        if filters.get("max_price") is not None:
+            mask &= a[:, 3] <= filters["max_price"]
+        return rows[mask]
+
+    def _hits(self, rows: np.ndarray, dist: Optional[np.ndarray]) -> List[dict]:
+        out = []
+        for i, row in enumerate(rows):
+            hit = {**self._meta[row], "latitude": float(self._lat[row]), "longitude": float(self._lon[row])}
+            if dist is not None:
+                hit["distance_km"] = round(float(dist[i]), 3)
+            out.append(hit)
+        return out
+
+    def nearby(self, lat: float, lon: float, radius_km: float, limit: int = 100, **filters) -> List[dict]:
+        """Listing trong bán kính `radius_km`, gần nhất trước."""
+        dlat = radius_km / KM_PER_DEG
+        dlon = radius_km / (KM_PER_DEG * max(math.cos(math.radians(lat)), 1e-6))
+        with self._lock:
+            rows = self._rows_in(lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+            rows = self._filter(rows, filters)
+            dist = _haversine_km(lat, lon, self._lat[rows], self._lon[rows])
+            keep = dist <= radius_km
+            rows, dist = rows[keep], dist[keep]
+            if len(rows) > limit:
+                top = np.argpartition(dist, limit - 1)[:limit]
+                rows, dist = rows[top], dist[top]
+            order = np.argsort(dist, kind="stable")
+            return self._hits(rows[order], dist[order])
+
+    def bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float, limit: int = 100,
+             **filters) -> List[dict]:
+        """Listing trong khung (min_lat, min_lon) - (max_lat, max_lon)."""
+        with self._lock:
+            rows = self._rows_in(min_lat, min_lon, max_lat, max_lon)
+            lat, lon = self._lat[rows], self._lon[rows]
+            rows = rows[(lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)]
+            rows = self._filter(rows, filters)
+            return self._hits(np.sort(rows)[:limit], None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            sizes = [len(r) for r in self._cells.values()]
+        return {"listings": self.n, "cell_deg": self.cell, "cells": len(sizes),
+                "max_per_cell": max(sizes, default=0),
+                "avg_per_cell": round(sum(sizes) / len(sizes), 1) if sizes else 0}
+
+
+geo_index = GeoIndex()
@@ -0,0 +1,244 @@
+# app/listing_store.py
+import hashlib, json, os, re, sqlite3, threading, time
+from typing import Any, Dict, List, Optional, Tuple
+from app import config
+from app.scrapers import domain_au, realestate_au
+
+# ---- Config ------------------------------------------------------------------
+LISTING_STORE_PATH = getattr(config, "LISTING_STORE_PATH", ".cache/listings.sqlite3")
+# -----------------------------------------------------------------------------
+
+# trường so sánh để phát hiện thay đổi (raw JSON-LD và trạng thái cache thì không)
+TRACKED_FIELDS = ("title", "address", "price", "bedrooms", "bathrooms", "parking",
+                  "latitude", "longitude", "description", "images", "features")
+
+_LISTING_IDS = {"realestate": realestate_au.parse_listing_id, "domain": domain_au.parse_listing_id}
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def listing_id_for(source: str, url: str) -> str:
+    """listing_id lấy từ URL (không cần parse trang); URL không có id thì dùng chính URL."""
+    fn = _LISTING_IDS.get(source)
+    return (fn(url) if fn else None) or url
+
+
+def normalize_address(address: Optional[str]) -> Optional[str]:
+    if not address:
+        return None
+    return _NON_ALNUM.sub(" ", address.lower()).strip() or None
+
+
+def page_hash(content: bytes) -> str:
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+def content_hash(item: dict) -> str:
+    tracked = {k: item.get(k) for k in TRACKED_FIELDS}
+    return hashlib.blake2b(json.dumps(tracked, sort_keys=True, ensure_ascii=False).encode("utf-8"),
+                           digest_size=16).hexdigest()
+
+
+_COLUMNS = ("source, listing_id, url, address, latitude, longitude, price, bedrooms, bathrooms, parking,"
+            " data, first_seen, last_checked, last_changed")
+
+
+def _row(r: Tuple) -> dict:
+    (source, listing_id, url, address, lat, lng, price, beds, baths, parking,
+     data, first_seen, last_checked, last_changed) = r
+    return {**json.loads(data), "source": source, "listing_id": listing_id, "url": url,
+            "first_seen": first_seen, "last_checked": last_checked, "last_changed": last_changed}
+
+
+class ListingStore:
+    """Listing đã scrape, khoá (source, listing_id), kèm hash trang + hash nội dung và lịch sử thay đổi.
+
+    - hash trang (bytes HTML) trùng lần trước -> khỏi parse lại;
+    - hash nội dung (TRACKED_FIELDS) khác -> ghi từng trường đổi vào bảng changes.
+    Mọi method đều blocking -> gọi qua asyncio.to_thread.
+    """
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS listings ("
+            " source TEXT NOT NULL, listing_id TEXT NOT NULL, url TEXT NOT NULL,"
+            " address TEXT, address_norm TEXT, latitude REAL, longitude REAL, price TEXT,"
+            " bedrooms REAL, bathrooms REAL, parking REAL, data TEXT NOT NULL,"
+            " content_hash TEXT NOT NULL, page_hash TEXT,"
+            " first_seen REAL NOT NULL, last_checked REAL NOT NULL, last_changed REAL NOT NULL,"
+            " PRIMARY KEY (source, listing_id));"
+            "CREATE INDEX IF NOT EXISTS listings_address ON listings(address_norm);"
+            "CREATE INDEX IF NOT EXISTS listings_geo ON listings(latitude, longitude);"
+            "CREATE INDEX IF NOT EXISTS listings_checked ON listings(last_checked);"
+            "CREATE INDEX IF NOT EXISTS listings_changed ON listings(last_changed);"
+            "CREATE TABLE IF NOT EXISTS changes ("
+            " source TEXT NOT NULL, listing_id TEXT NOT NULL, at REAL NOT NULL,"
+            " field TEXT NOT NULL, old TEXT, new TEXT);"
+            "CREATE INDEX IF NOT EXISTS changes_listing ON changes(source, listing_id, at);"
+            "CREATE INDEX IF NOT EXISTS changes_at ON changes(at);"
+        )
+        self._db.commit()
+        self.unchanged_pages = self.unchanged = self.changed = self.new = 0
+
+    # ---- ghi ------------------------------------------------------------------
+    def known_page(self, source: str, listing_id: str, phash: str) -> Optional[dict]:
+        """Trang y hệt lần trước -> dict đã lưu (và đánh dấu vừa kiểm tra); khác/chưa có -> None."""
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {_COLUMNS} FROM listings WHERE source = ? AND listing_id = ? AND page_hash = ?",
+                (source, listing_id, phash),
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            self._db.execute("UPDATE listings SET last_checked = ? WHERE source = ? AND listing_id = ?",
+                             (now, source, listing_id))
+            self._db.commit()
+            self.unchanged_pages += 1
+        out = _row(row)
+        out["last_checked"] = now
+        return out
+
+    def upsert(self, item: dict, phash: Optional[str] = None) -> dict:
+        """Ghi 1 listing vừa parse -> {"status": new|changed|unchanged, "changes": [trường đổi]}.
+
+        `phash` None (ghi lại sau khi gắn tag, không có bytes trang) -> giữ page_hash đã lưu.
+        """
+        source = item["source"]
+        listing_id = item.get("listing_id") or item["url"]
+        chash = content_hash(item)
+        data = json.dumps({k: v for k, v in item.items() if k not in ("cache", "change")}, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            prev = self._db.execute(
+                "SELECT data, content_hash FROM listings WHERE source = ? AND listing_id = ?", (source, listing_id)
+            ).fetchone()
+            if prev is not None and prev[1] == chash:
+                # HTML đổi (quảng cáo, token...) nhưng nội dung listing thì không
+                self._db.execute(
+                    "UPDATE listings SET url = ?, data = ?, page_hash = COALESCE(?, page_hash), last_checked = ?"
+                    " WHERE source = ? AND listing_id = ?", (item["url"], data, phash, now, source, listing_id))
+                self._db.commit()
+                self.unchanged += 1
+                return {"status": "unchanged", "changes": []}
+
+            changes: List[str] = []
+            if prev is not None:
+                old = json.loads(prev[0])
+                rows = []
+                for field in TRACKED_FIELDS:
+                    if old.get(field) != item.get(field):
+                        changes.append(field)
+                        rows.append((source, listing_id, now, field,
+                                     json.dumps(old.get(field), ensure_ascii=False),
+                                     json.dumps(item.get(field), ensure_ascii=False)))
+                self._db.executemany("INSERT INTO changes VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._db.execute(
+                "INSERT INTO listings (source, listing_id, url, address, address_norm, latitude, longitude, price,"
+                " bedrooms, bathrooms, parking, data, content_hash, page_hash, first_seen, last_checked, last_changed)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (source, listing_id) DO UPDATE SET url = excluded.url, address = excluded.address,"
+                " address_norm = excluded.address_norm, latitude = excluded.latitude, longitude = excluded.longitude,"
+                " price = excluded.price, bedrooms = excluded.bedrooms, bathrooms = excluded.bathrooms,"
+                " parking = excluded.parking, data = excluded.data, content_hash = excluded.content_hash,"
+                " page_hash = COALESCE(excluded.page_hash, page_hash), last_checked = excluded.last_checked,"
+                " last_changed = excluded.last_changed",
+                (source, listing_id, item["url"], item.get("address"), normalize_address(item.get("address")),
+                 item.get("latitude"), item.get("longitude"), item.get("price"), item.get("bedrooms"),
+                 item.get("bathrooms"), item.get("parking"), data, chash, phash, now, now, now),
+            )
+            self._db.commit()
+        if prev is None:
+            self.new += 1
+            return {"status": "new", "changes": []}
+        self.changed += 1
+        return {"status": "changed", "changes": changes}
+
+    # ---- đọc ------------------------------------------------------------------
+    def get(self, source: str, listing_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute(f"SELECT {_COLUMNS} FROM listings WHERE source = ? AND listing_id = ?",
+                                   (source, listing_id)).fetchone()
+        return _row(row) if row else None
+
+    def find(self, *, address: Optional[str] = None, bbox: Optional[Tuple[float, float, float, float]] = None,
+             changed_since: Optional[float] = None, limit: int = 100) -> List[dict]:
+        """Lọc theo địa chỉ (khớp tiền tố sau chuẩn hoá), bbox (min_lat, min_lon, max_lat, max_lon)
+        và/hoặc thời điểm thay đổi gần nhất; đều đi qua index."""
+        where: List[str] = []
+        args: List[Any] = []
+        norm = normalize_address(address)
+        if norm:
+            where.append("address_norm >= ? AND address_norm < ?")
+            args += [norm, norm + "\uffff"]
+        if bbox is not None:
+            where.append("latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?")
+            args += [bbox[0], bbox[2], bbox[1], bbox[3]]
+        if changed_since is not None:
+            where.append("last_changed >= ?")
+            args.append(changed_since)
+        sql = f"SELECT {_COLUMNS} FROM listings"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        with self._lock:
+            rows = self._db.execute(sql + " ORDER BY last_changed DESC LIMIT ?", (*args, limit)).fetchall()
+        return [_row(r) for r in rows]
+
+    def history(self, source: str, listing_id: str, field: Optional[str] = None, limit: int = 200) -> List[dict]:
+        sql = "SELECT at, field, old, new FROM changes WHERE source = ? AND listing_id = ?"
+        args: List[Any] = [source, listing_id]
+        if field:
+            sql += " AND field = ?"
+            args.append(field)
+        with self._lock:
+            rows = self._db.execute(sql + " ORDER BY at DESC LIMIT ?", (*args, limit)).fetchall()
+        return [{"at": at, "field": f, "old": json.loads(o), "new": json.loads(n)} for at, f, o, n in rows]
+
+    def changes_since(self, since: float, field: Optional[str] = None, limit: int = 500) -> List[dict]:
+        """Mọi thay đổi từ `since` (epoch giây), mới nhất trước: "đổi gì từ hôm qua"."""
+        sql = "SELECT source, listing_id, at, field, old, new FROM changes WHERE at >= ?"
+        args: List[Any] = [since]
+        if field:
+            sql += " AND field = ?"
+            args.append(field)
+        with self._lock:
+            rows = self._db.execute(sql + " ORDER BY at DESC LIMIT ?", (*args, limit)).fetchall()
+        return [{"source": s, "listing_id": lid, "at": at, "field": f, "old": json.loads(o), "new": json.loads(n)}
+                for s, lid, at, f, o, n in rows]
+
+    def geo_rows(self, since: Optional[float] = None) -> List[dict]:
+        """Listing có toạ độ (các cột geo index cần), để nạp app.geo_index lúc khởi động.
+
+        `since`: chỉ listing đổi từ thời điểm đó (worker khác ghi vào store, xem serve.py).
+        """
+        cols = ("source", "listing_id", "url", "address", "price", "bedrooms", "bathrooms", "parking",
+                "latitude", "longitude")
+        sql = f"SELECT {', '.join(cols)} FROM listings WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+        args: tuple = ()
+        if since is not None:
+            sql, args = sql + " AND last_changed >= ?", (since,)
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        return [dict(zip(cols, r)) for r in rows]
+
+    def stale(self, older_than_s: float, limit: int) -> List[str]:
+        """URL các listing chưa kiểm tra lại trong `older_than_s` giây, cũ nhất trước."""
+        with self._lock:
+            return [r[0] for r in self._db.execute(
+                "SELECT url FROM listings WHERE last_checked < ? ORDER BY last_checked LIMIT ?",
+                (time.time() - older_than_s, limit))]
+
+    def stats(self) -> dict:
+        with self._lock:
+            n = self._db.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+            n_changes = self._db.execute("SELECT COUNT(*) FROM changes").fetchone()[0]
+        return {"listings": n, "changes": n_changes, "new": self.new, "changed": self.changed,
+                "unchanged": self.unchanged, "unchanged_pages": self.unchanged_pages}
+
+
+# "" -> SQLite trong RAM: vẫn dedupe/so sánh trong phiên, mất khi restart
+listing_store = ListingStore(LISTING_STORE_PATH or ":memory:")
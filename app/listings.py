@@ -0,0 +1,117 @@
+# app/listings.py
+import asyncio
+from collections import Counter
+from typing import Dict, List, Optional
+import numpy as np
+from app import config
+from app.dedup import dedupe_listings
+from app.geo_index import geo_index
+from app.listing_store import listing_id_for, listing_store, page_hash
+from app.parse_pool import parse_executor, source_for
+from app.photo_tags import tag_items
+from app.schemas import PropertyItem
+from app.search import search_address
+from app.utils.http import Http
+
+# ---- Config ------------------------------------------------------------------
+LISTING_REFRESH_CONCURRENCY = max(1, int(getattr(config, "LISTING_REFRESH_CONCURRENCY", 8)))
+# -----------------------------------------------------------------------------
+
+
+async def fetch_listing(http: Http, url: str) -> Optional[PropertyItem]:
+    """Tải + parse 1 trang listing rồi ghi vào listing store; domain không hỗ trợ -> None.
+
+    Bytes trang trùng lần trước (thường là page cache hit/304) -> lấy bản trong store, khỏi parse.
+    """
+    source = source_for(url)
+    if source is None:
+        return None
+    page = await http.get_page(url)
+    phash = page_hash(page.content)
+    known = await asyncio.to_thread(listing_store.known_page, source, listing_id_for(source, url), phash)
+    if known is not None:
+        item = PropertyItem(**known)
+        item.cache, item.change = page.cache, "unchanged"
+        return item
+    item = await parse_executor.parse(url, page.content, page.encoding)
+    item.cache = page.cache
+    data = item.model_dump()
+    item.change = (await asyncio.to_thread(listing_store.upsert, data, phash))["status"]
+    if item.change != "unchanged":
+        geo_index.upsert(data)
+    return item
+
+
+async def tag_listings(items: List[PropertyItem], prefetched: Optional[Dict[str, bytes]] = None,
+                       embedded: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, np.ndarray]:
+    """Gắn tag ảnh vào `features` rồi ghi lại listing store (features là trường theo dõi).
+
+    Chỉ dùng cho listing đúng như trang nguồn, không cho item đã gộp (dedup). Trả URL -> vector ảnh.
+    """
+    vecs = await tag_items(items, prefetched, embedded)
+    for item in items:
+        if item.features:
+            status = (await asyncio.to_thread(listing_store.upsert, item.model_dump()))["status"]
+            if item.change == "unchanged":
+                item.change = status
+    return vecs
+
+
+async def fetch_listings(address: str, dedupe: bool = True, prefetched: Optional[Dict[str, bytes]] = None,
+                         embedded: Optional[Dict[str, np.ndarray]] = None) -> List[PropertyItem]:
+    """search_address + tải song song mọi URL tìm được; trang lỗi thì bỏ qua.
+
+    `dedupe`: gộp cùng 1 căn xuất hiện trên cả 2 site (app/dedup.py); ảnh tải ra để so được để lại
+    trong `prefetched` (nếu có) cho bước embed.
+    `embedded` (dict) -> gắn tag từng listing trước khi gộp và điền vector ảnh đã tính vào đó.
+    """
+    urls = await search_address(address)
+    http = Http()
+
+    async def _one(url: str) -> Optional[PropertyItem]:
+        try:
+            return await fetch_listing(http, url)
+        except Exception:
+            return None
+    try:
+        found = await asyncio.gather(*(_one(u) for u in urls.get("realestate", []) + urls.get("domain", [])))
+        items = [x for x in found if x is not None]
+        if embedded is not None:
+            embedded.update(await tag_listings(items, prefetched))
+        if dedupe:
+            items = await dedupe_listings(items, http, prefetched)
+    finally:
+        await http.close()
+    return items
+
+
+async def refresh_listings(older_than_s: float, limit: int) -> tuple[dict, List[PropertyItem]]:
+    """Kiểm tra lại các listing trong store chưa xem trong `older_than_s` giây, cũ nhất trước.
+
+    Trả (thống kê, listing mới/đổi). Trang không đổi thì không parse lại, và chỉ listing đổi
+    mới cần embed lại (index_items cũng chỉ embed ảnh chưa có trong photo index).
+    """
+    urls = await asyncio.to_thread(listing_store.stale, older_than_s, limit)
+    slots = asyncio.Semaphore(LISTING_REFRESH_CONCURRENCY)
+    counts: Counter = Counter()
+    changed: List[PropertyItem] = []
+    http = Http()
+
+    async def _one(url: str):
+        async with slots:
+            try:
+                item = await fetch_listing(http, url)
+            except Exception:
+                counts["failed"] += 1
+                return
+        if item is None:
+            counts["skipped"] += 1
+            return
+        counts[item.change] += 1
+        if item.change != "unchanged":
+            changed.append(item)
+    try:
+        await asyncio.gather(*(_one(u) for u in urls))
+    finally:
+        await http.close()
+    return {"checked": len(urls), **counts}, changed
@@ -0,0 +1,162 @@
+# app/parse_pool.py
+import asyncio, contextvars, functools, multiprocessing, os, time
+from collections import Counter, deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+from app import config
+from app.schemas import PropertyItem
+from app.scrapers import realestate_au, domain_au
+from app.utils.metrics import PARSE_QUEUE_SECONDS, PARSE_SECONDS
+
+# ---- Config ------------------------------------------------------------------
+PARSE_EXECUTOR     = getattr(config, "PARSE_EXECUTOR", "process")   # process | thread | inline
+PARSE_WORKERS      = int(getattr(config, "PARSE_WORKERS", 0))        # 0 -> số CPU
+PARSE_MAX_INFLIGHT = int(getattr(config, "PARSE_MAX_INFLIGHT", 0))   # 0 -> 4 × workers
+# -----------------------------------------------------------------------------
+
+EXECUTORS = ("process", "thread", "inline")
+
+_TRANSFORMS = {"realestate": realestate_au.transform, "domain": domain_au.transform}
+
+
+def source_for(url: str) -> Optional[str]:
+    if "realestate.com.au" in url:
+        return "realestate"
+    if "domain.com.au" in url:
+        return "domain"
+    return None
+
+
+def _parse(source: str, url: str, content: bytes, encoding: Optional[str]) -> tuple[dict, float]:
+    """Chạy trong worker: HTML bytes -> dict PropertyItem (+ thời gian CPU parse)."""
+    t0 = time.perf_counter()
+    item = _TRANSFORMS[source](url, content, encoding)
+    return item.model_dump(), time.perf_counter() - t0
+
+
+class ParseExecutor:
+    """Đẩy phần parse/transform HTML ra process pool (mặc định), thread pool hoặc chạy inline.
+
+    `PARSE_MAX_INFLIGHT` giới hạn số trang đang chờ/đang parse: vượt quá thì `parse()` chờ
+    chỗ trống (backpressure) thay vì dồn cả MB HTML vào hàng đợi của pool.
+    """
+
+    def __init__(self, kind: str = PARSE_EXECUTOR, workers: int = PARSE_WORKERS,
+                 max_inflight: int = PARSE_MAX_INFLIGHT):
+        kind = (kind or "process").lower()
+        if kind not in EXECUTORS:
+            raise ValueError(f"PARSE_EXECUTOR không hỗ trợ: {kind} (chọn 1 trong {', '.join(EXECUTORS)})")
+        self.kind = kind
+        self.workers = 1 if kind == "inline" else max(1, workers or os.cpu_count() or 1)
+        self.max_inflight = max(1, max_inflight or 4 * self.workers)
+        self._pool: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.inflight = 0
+        self.waiting = 0
+        # metrics
+        self.tasks = 0
+        self.errors: Counter = Counter()
+        self.bytes = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+        self.total_parse = 0.0
+        self.max_parse = 0.0
+        self.total_roundtrip = 0.0
+        self._recent = deque(maxlen=1000)  # thời gian parse gần đây (s) cho p50/p95
+
+    def start(self):
+        if self._pool is not None or self.kind == "inline":
+            return
+        if self.kind == "process":
+            # spawn: không fork process đang giữ thread của torch/uvicorn
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="parse")
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _submit(self, *args) -> tuple[dict, float]:
+        if self.kind == "inline":
+            return _parse(*args)
+        self.start()
+        loop = asyncio.get_running_loop()
+        pool = self._pool
+        fn = _parse
+        if self.kind == "thread":  # mang contextvars (trace_id, stage của request) sang thread; process thì không
+            fn = functools.partial(contextvars.copy_context().run, _parse)
+        try:
+            return await loop.run_in_executor(pool, fn, *args)
+        except BrokenProcessPool:
+            # worker chết (OOM, segfault trong lxml...) -> dựng pool mới (1 lần cho cả đám task lỗi), thử lại
+            if self._pool is pool:
+                self.errors["broken_pool"] += 1
+                self.stop()
+                self.start()
+            return await loop.run_in_executor(self._pool, fn, *args)
+
+    async def parse(self, url: str, content: bytes, encoding: Optional[str] = None) -> PropertyItem:
+        source = source_for(url)
+        if source is None:
+            raise ValueError(f"Unsupported domain: {url}")
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_inflight)
+        t_enq = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            t0 = time.perf_counter()
+            wait = t0 - t_enq
+            self.inflight += 1
+            try:
+                data, dt = await self._submit(source, url, content, encoding)
+            except Exception as e:
+                self.errors[type(e).__name__] += 1
+                raise
+            finally:
+                self.inflight -= 1
+        finally:
+            self._slots.release()
+        PARSE_QUEUE_SECONDS.observe(wait)
+        PARSE_SECONDS.observe(dt, source=source)
+        self.tasks += 1
+        self.bytes += len(content)
+        self.total_wait += wait
+        self.max_wait_seen = max(self.max_wait_seen, wait)
+        self.total_parse += dt
+        self.max_parse = max(self.max_parse, dt)
+        self.total_roundtrip += time.perf_counter() - t0
+        self._recent.append(dt)
+        return PropertyItem(**data)
+
+    def stats(self) -> dict:
+        recent = sorted(self._recent)
+        pct = lambda p: round(1000 * recent[min(len(recent) - 1, int(p * len(recent)))], 2) if recent else 0.0
+        n = self.tasks
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "max_inflight": self.max_inflight,
+            "inflight": self.inflight,
+            "waiting": self.waiting,
+            "tasks": n,
+            "errors": dict(self.errors),
+            "avg_page_kb": round(self.bytes / n / 1024, 1) if n else 0.0,
+            "avg_queue_wait_ms": round(1000 * self.total_wait / n, 2) if n else 0.0,
+            "max_queue_wait_ms": round(1000 * self.max_wait_seen, 2),
+            "avg_parse_ms": round(1000 * self.total_parse / n, 2) if n else 0.0,
+            "p50_parse_ms": pct(0.5),
+            "p95_parse_ms": pct(0.95),
+            "max_parse_ms": round(1000 * self.max_parse, 2),
+            # roundtrip - parse = chi phí pickle/IPC của process pool
+            "avg_roundtrip_ms": round(1000 * self.total_roundtrip / n, 2) if n else 0.0,
+        }
+
+
+parse_executor = ParseExecutor()
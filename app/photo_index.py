@@ -0,0 +1,381 @@
+# app/photo_index.py
+import json, logging, os, threading, time
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from app import config
+from app.ann import IVFPQIndex, SOURCES
+from app.utils.metrics import log
+
+# ---- Config ------------------------------------------------------------------
+PHOTO_INDEX_DIR   = getattr(config, "PHOTO_INDEX_DIR", "")        # "" -> chỉ giữ trong RAM
+PHOTO_INDEX_DTYPE = getattr(config, "PHOTO_INDEX_DTYPE", "float16")  # float16 | int8
+ANN_NPROBE        = int(getattr(config, "ANN_NPROBE", 16))
+ANN_RERANK        = int(getattr(config, "ANN_RERANK", 100))
+ANN_M             = int(getattr(config, "ANN_M", 32))
+_CHUNK = 65536  # số dòng mỗi lần nhân ma trận (giới hạn RAM tạm khi đổi sang float32)
+# -----------------------------------------------------------------------------
+
+
+def listing_key(source: str, listing_id: Optional[str], url: str) -> str:
+    return f"{source}:{listing_id or url}"
+
+
+class PhotoIndex:
+    """Ma trận vector ảnh listing (đã chuẩn hoá L2) + metadata, tìm top-k bằng tích vô hướng.
+
+    Lưu float16, hoặc int8 kèm scale theo dòng. Xoá = đánh dấu, tự nén lại khi
+    số dòng chết vượt 1/4. Mọi method đồng bộ, khoá bằng threading.Lock để
+    chạy được trong asyncio.to_thread.
+    """
+
+    def __init__(self, model: str, dtype: str = PHOTO_INDEX_DTYPE):
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"PHOTO_INDEX_DTYPE không hỗ trợ: {dtype}")
+        self.model = model
+        self.dtype = dtype
+        self.dim: Optional[int] = None
+        self.n = 0
+        self._vecs: Optional[np.ndarray] = None
+        self._scale: Optional[np.ndarray] = None  # chỉ dùng với int8
+        self._alive = np.zeros(0, dtype=bool)
+        self._source = np.zeros(0, dtype=np.int8)     # mã SOURCES theo dòng, để lọc
+        self._beds = np.zeros(0, dtype=np.float32)    # số phòng ngủ theo dòng (NaN = không rõ)
+        self._ann: Optional[IVFPQIndex] = None
+        self._ann_n = 0                               # số dòng đã có trong ANN
+        self._building = False
+        self._images: List[str] = []
+        self._keys: List[str] = []
+        self.listings: Dict[str, dict] = {}        # key -> {source, listing_id, url, address, bedrooms}
+        self._by_image: Dict[str, int] = {}
+        self._by_listing: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self.dirty = False
+
+    # ---- storage -------------------------------------------------------------
+    def _grow(self, need: int):
+        cap = 0 if self._vecs is None else self._vecs.shape[0]
+        if need <= cap:
+            return
+        new_cap = max(1024, cap * 2, need)
+        vecs = np.zeros((new_cap, self.dim), dtype=np.int8 if self.dtype == "int8" else np.float16)
+        alive = np.zeros(new_cap, dtype=bool)
+        scale = np.zeros(new_cap, dtype=np.float32)
+        source = np.zeros(new_cap, dtype=np.int8)
+        beds = np.full(new_cap, np.nan, dtype=np.float32)
+        if self._vecs is not None:
+            vecs[:self.n] = self._vecs[:self.n]
+            alive[:self.n] = self._alive[:self.n]
+            scale[:self.n] = self._scale[:self.n]
+            source[:self.n] = self._source[:self.n]
+            beds[:self.n] = self._beds[:self.n]
+        self._vecs, self._alive, self._scale = vecs, alive, scale
+        self._source, self._beds = source, beds
+
+    def _encode_rows(self, vecs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        if self.dtype == "int8":
+            scale = np.abs(vecs).max(axis=1) / 127.0
+            scale[scale == 0] = 1.0
+            return np.round(vecs / scale[:, None]).astype(np.int8), scale.astype(np.float32)
+        return vecs.astype(np.float16), np.ones(len(vecs), dtype=np.float32)
+
+    def vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Giải nén các dòng về float32."""
+        v = self._vecs[rows].astype(np.float32)
+        return v * self._scale[rows, None] if self.dtype == "int8" else v
+
+    # ---- mutate --------------------------------------------------------------
+    def indexed_images(self, listing: dict) -> set:
+        """Ảnh của listing đã có vector trong index (để chỉ embed ảnh mới)."""
+        key = listing_key(listing.get("source", ""), listing.get("listing_id"), listing.get("url", ""))
+        with self._lock:
+            return {self._images[row] for row in self._by_listing.get(key, ())}
+
+    def add(self, listing: dict, images: List[str], vecs: np.ndarray, keep: Iterable[str] = ()) -> int:
+        """Thêm/ghi đè vector ảnh của 1 listing; `listing` cần source, listing_id, url.
+
+        `keep`: ảnh đã có trong index, giữ nguyên vector (chỉ cập nhật metadata); ảnh cũ không nằm
+        trong `images` lẫn `keep` bị xoá.
+        """
+        keep = set(keep)
+        if not len(images) and not keep:
+            return 0
+        key = listing_key(listing.get("source", ""), listing.get("listing_id"), listing.get("url", ""))
+        with self._lock:
+            if len(images):
+                vecs = np.asarray(vecs, dtype=np.float32).reshape(len(images), -1)
+                vecs = vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+                if self.dim is None:
+                    self.dim = vecs.shape[1]
+                elif vecs.shape[1] != self.dim:
+                    raise ValueError(f"vector dim {vecs.shape[1]} != index dim {self.dim}")
+                enc, scale = self._encode_rows(vecs)
+            else:
+                enc = scale = ()
+            self.listings[key] = {k: listing.get(k) for k in ("source", "listing_id", "url", "address", "bedrooms")}
+            src_code = SOURCES.get(listing.get("source") or "", 0)
+            beds = listing.get("bedrooms")
+            beds = np.nan if beds is None else float(beds)
+            stale = set(self._by_listing.get(key, ()))
+            for row in list(stale):
+                if self._images[row] in keep:
+                    self._source[row] = src_code
+                    self._beds[row] = beds
+                    stale.discard(row)
+            added = 0
+            for img, row_vec, row_scale in zip(images, enc, scale):
+                row = self._by_image.get(img)
+                if row is not None and self._alive[row] and (row < self._ann_n or self._building):
+                    # dòng đã (hoặc sắp) nằm trong ANN: mã PQ cũ không khớp vector mới -> bỏ dòng cũ,
+                    # ghi dòng mới ở cuối (quét thẳng tới lần build sau)
+                    self._alive[row] = False
+                    self._by_listing.get(self._keys[row], set()).discard(row)
+                    stale.discard(row)
+                    row = None
+                if row is None or not self._alive[row]:
+                    self._grow(self.n + 1)
+                    row = self.n
+                    self.n += 1
+                    self._images.append(img)
+                    self._keys.append(key)
+                    added += 1
+                else:
+                    self._by_listing.get(self._keys[row], set()).discard(row)
+                    self._keys[row] = key
+                self._vecs[row] = row_vec
+                self._scale[row] = row_scale
+                self._alive[row] = True
+                self._source[row] = src_code
+                self._beds[row] = beds
+                self._by_image[img] = row
+                self._by_listing.setdefault(key, set()).add(row)
+                stale.discard(row)
+            # ảnh không còn trong listing (đã gỡ khỏi trang) -> xoá
+            for row in stale:
+                self._alive[row] = False
+                self._by_listing[key].discard(row)
+                self._by_image.pop(self._images[row], None)
+            self.dirty = True
+            return added
+
+    def delete_listing(self, key: str) -> int:
+        with self._lock:
+            rows = self._by_listing.pop(key, set())
+            for row in rows:
+                self._alive[row] = False
+                self._by_image.pop(self._images[row], None)
+            self.listings.pop(key, None)
+            if rows:
+                self.dirty = True
+            if not self._building and self.n and (self.n - int(self._alive[:self.n].sum())) > self.n // 4:
+                self._compact()
+            return len(rows)
+
+    def _compact(self):
+        keep = np.flatnonzero(self._alive[:self.n])
+        self._vecs[:len(keep)] = self._vecs[keep]
+        self._scale[:len(keep)] = self._scale[keep]
+        self._source[:len(keep)] = self._source[keep]
+        self._beds[:len(keep)] = self._beds[keep]
+        self._alive[:] = False
+        self._alive[:len(keep)] = True
+        self._images = [self._images[i] for i in keep]
+        self._keys = [self._keys[i] for i in keep]
+        self.n = len(keep)
+        self._by_image = {img: i for i, img in enumerate(self._images)}
+        self._by_listing = {}
+        for i, k in enumerate(self._keys):
+            self._by_listing.setdefault(k, set()).add(i)
+        # số dòng đã đổi -> ANN cũ không còn khớp; quét thẳng tới khi build lại
+        self._ann, self._ann_n = None, 0
+
+    # ---- query ---------------------------------------------------------------
+    def _scores(self, q: np.ndarray) -> np.ndarray:
+        scores = np.empty(self.n, dtype=np.float32)
+        for i in range(0, self.n, _CHUNK):
+            j = min(i + _CHUNK, self.n)
+            block = self._vecs[i:j].astype(np.float32) @ q
+            if self.dtype == "int8":
+                block *= self._scale[i:j]
+            scores[i:j] = block
+        return scores
+
+    def _mask(self, rows: np.ndarray, source: Optional[str], min_bedrooms: Optional[float],
+              max_bedrooms: Optional[float]) -> np.ndarray:
+        mask = self._alive[rows].copy()
+        if source:
+            mask &= self._source[rows] == SOURCES.get(source, -1)
+        if min_bedrooms is not None:
+            mask &= self._beds[rows] >= min_bedrooms
+        if max_bedrooms is not None:
+            mask &= self._beds[rows] <= max_bedrooms
+        return mask
+
+    def _candidates(self, q: np.ndarray, m: int, *, exclude: set, source, min_bedrooms, max_bedrooms,
+                    exact: bool, nprobe: int, rerank: int) -> tuple[np.ndarray, np.ndarray]:
+        """Top-m dòng (đã lọc) theo điểm giảm dần – qua ANN nếu đã build, không thì quét toàn bộ."""
+        if self._ann is not None and not exact:
+            # lọc theo metadata hiện tại của từng dòng, không theo bản chụp trong ANN lúc build
+            # (add() cập nhật source/bedrooms của dòng cũ mà không build lại ANN)
+            rows, scores = self._ann.search(
+                q, m, nprobe=nprobe, rerank=rerank, vectors=self.vectors,
+                keep=lambda ids: self._mask(ids, source, min_bedrooms, max_bedrooms),
+            )
+            if self._ann_n < self.n:  # các dòng thêm sau khi build ANN: quét thẳng
+                tail = np.arange(self._ann_n, self.n)
+                rows = np.concatenate([rows, tail])
+                scores = np.concatenate([scores, self.vectors(tail) @ q])
+        else:
+            rows = np.arange(self.n)
+            scores = self._scores(q)
+        mask = self._mask(rows, source, min_bedrooms, max_bedrooms)
+        if exclude:
+            mask &= ~np.isin(rows, list(exclude))
+        rows, scores = rows[mask], scores[mask]
+        if not len(rows):
+            return rows, scores
+        m = min(m, len(rows))
+        top = np.argpartition(-scores, m - 1)[:m]
+        top = top[np.argsort(-scores[top])]
+        return rows[top], scores[top]
+
+    def search(self, query: np.ndarray, k: int = 10, *, by_listing: bool = True,
+               exclude_images: Iterable[str] = (), source: Optional[str] = None,
+               min_bedrooms: Optional[float] = None, max_bedrooms: Optional[float] = None,
+               exact: bool = False, nprobe: int = ANN_NPROBE, rerank: int = ANN_RERANK) -> List[dict]:
+        """Top-k ảnh (hoặc top-k listing, điểm = max điểm ảnh) theo cosine với vector truy vấn.
+
+        Có ANN thì `nprobe`/`rerank` chỉnh recall/độ trễ cho từng truy vấn; `exact=True` quét toàn bộ.
+        """
+        q = np.asarray(query, dtype=np.float32).reshape(-1)
+        q = q / max(float(np.linalg.norm(q)), 1e-12)
+        with self._lock:
+            if not self.n:
+                return []
+            exclude = {self._by_image[img] for img in exclude_images if img in self._by_image}
+            kw = dict(exclude=exclude, source=source, min_bedrooms=min_bedrooms, max_bedrooms=max_bedrooms,
+                      exact=exact, nprobe=nprobe, rerank=rerank)
+            if not by_listing:
+                rows, scores = self._candidates(q, k, **kw)
+                return [{"image": self._images[i], "score": float(sc), **self.listings[self._keys[i]]}
+                        for i, sc in zip(rows, scores)]
+            # gom theo listing: lấy dư ứng viên (k×16 ảnh) rồi giữ ảnh điểm cao nhất của mỗi listing;
+            # nếu chưa đủ k listing thì mới lấy toàn bộ
+            rows, scores = self._candidates(q, k * 16, **kw)
+            out = self._group(rows, scores, k)
+            if len(out) < k and len(rows) == k * 16:
+                rows, scores = self._candidates(q, self.n, **kw)
+                out = self._group(rows, scores, k)
+            return list(out.values())
+
+    def _group(self, rows: np.ndarray, scores: np.ndarray, k: int) -> Dict[str, dict]:
+        out: Dict[str, dict] = {}
+        for i, sc in zip(rows, scores):
+            key = self._keys[i]
+            hit = out.get(key)
+            if hit is None:
+                if len(out) >= k:
+                    continue
+                out[key] = {"score": float(sc), "image": self._images[i], "matches": 1, **self.listings[key]}
+            else:
+                hit["matches"] += 1
+        return out
+
+    # ---- ANN -----------------------------------------------------------------
+    def build_ann(self, nlist: int = 0, m: int = ANN_M, train_size: int = 65536) -> dict:
+        """Build IVF-PQ trên các dòng hiện có. Dòng thêm (hoặc ghi đè vector) sau đó được quét thẳng
+        tới lần build sau; metadata thì lọc theo giá trị hiện tại nên không cần build lại.
+        """
+        with self._lock:
+            n = self.n
+            if not n:
+                raise ValueError("index rỗng")
+            self._building = True
+        try:
+            rng = np.random.default_rng(0)
+            nlist = nlist or max(1, min(4096, int(4 * np.sqrt(n))))
+            sample = np.sort(rng.choice(n, min(n, max(train_size, nlist * 39)), replace=False))
+            ann = IVFPQIndex(self.dim, nlist, m)
+            ann.train(self.vectors(sample))
+            for i in range(0, n, _CHUNK):
+                rows = np.arange(i, min(i + _CHUNK, n))
+                ann.add(self.vectors(rows), rows, self._source[rows], self._beds[rows])
+        finally:
+            with self._lock:
+                self._building = False
+        with self._lock:
+            self._ann, self._ann_n = ann, n
+            self.dirty = True
+        return ann.stats()
+
+    # ---- persistence ---------------------------------------------------------
+    def save(self, root: str):
+        with self._lock:
+            os.makedirs(root, exist_ok=True)
+            n = self.n
+            if self._vecs is not None:
+                np.save(os.path.join(root, "vectors.npy"), self._vecs[:n])
+                np.save(os.path.join(root, "scale.npy"), self._scale[:n])
+                np.save(os.path.join(root, "alive.npy"), self._alive[:n])
+            ann_path = os.path.join(root, "ann.npz")
+            if self._ann is not None:
+                a = self._ann
+                np.savez(ann_path, centroids=a.centroids, pq=a.pq, offsets=a.offsets, codes=a.codes, ids=a.ids,
+                         source=a.source, bedrooms=a.bedrooms, ann_n=self._ann_n)
+            elif os.path.exists(ann_path):
+                os.remove(ann_path)
+            meta = {"model": self.model, "dtype": self.dtype, "dim": self.dim, "n": n,
+                    "images": self._images, "keys": self._keys, "listings": self.listings,
+                    "saved_at": time.time()}
+            tmp = os.path.join(root, "meta.json.tmp")
+            with open(tmp, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp, os.path.join(root, "meta.json"))
+            self.dirty = False
+
+    @classmethod
+    def load(cls, root: str, model: str) -> "PhotoIndex":
+        """Đọc index đã lưu; khác model hoặc chưa có thì trả index rỗng."""
+        path = os.path.join(root, "meta.json")
+        if not os.path.exists(path):
+            return cls(model)
+        with open(path) as f:
+            meta = json.load(f)
+        if meta.get("model") != model:
+            log("photo_index_model_mismatch", logging.WARNING, saved=meta.get("model"), model=model)
+            return cls(model)
+        idx = cls(model, meta.get("dtype", PHOTO_INDEX_DTYPE))
+        idx.dim, idx.n = meta["dim"], meta["n"]
+        if idx.n:
+            idx._vecs = np.load(os.path.join(root, "vectors.npy"))
+            idx._scale = np.load(os.path.join(root, "scale.npy"))
+            idx._alive = np.load(os.path.join(root, "alive.npy"))
+        idx._images, idx._keys, idx.listings = meta["images"], meta["keys"], meta["listings"]
+        idx._source = np.zeros(idx.n, dtype=np.int8)
+        idx._beds = np.full(idx.n, np.nan, dtype=np.float32)
+        for i, (img, key) in enumerate(zip(idx._images, idx._keys)):
+            if idx._alive[i]:
+                idx._by_image[img] = i
+                idx._by_listing.setdefault(key, set()).add(i)
+            info = idx.listings.get(key) or {}
+            idx._source[i] = SOURCES.get(info.get("source") or "", 0)
+            if info.get("bedrooms") is not None:
+                idx._beds[i] = float(info["bedrooms"])
+        ann_path = os.path.join(root, "ann.npz")
+        if os.path.exists(ann_path):
+            z = np.load(ann_path)
+            m, ksub, dsub = z["pq"].shape
+            ann = IVFPQIndex(idx.dim, len(z["centroids"]), m, ksub)
+            ann.centroids, ann.pq, ann.offsets, ann.codes = z["centroids"], z["pq"], z["offsets"], z["codes"]
+            ann.ids, ann.source, ann.bedrooms = z["ids"], z["source"], z["bedrooms"]
+            idx._ann, idx._ann_n = ann, int(z["ann_n"])
+        return idx
+
+    def stats(self) -> dict:
+        alive = int(self._alive[:self.n].sum()) if self.n else 0
+        nbytes = 0 if self._vecs is None else self._vecs[:self.n].nbytes
+        return {"model": self.model, "dtype": self.dtype, "dim": self.dim, "images": alive,
+                "deleted": self.n - alive, "listings": len(self.listings), "bytes": nbytes,
+                "ann": ({**self._ann.stats(), "unindexed_tail": self.n - self._ann_n} if self._ann else None)}
+
+
+photo_index = PhotoIndex.load(PHOTO_INDEX_DIR, config.CLIP_MODEL) if PHOTO_INDEX_DIR else PhotoIndex(config.CLIP_MODEL)
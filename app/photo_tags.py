@@ -0,0 +1,141 @@
+# app/photo_tags.py
+"""Gắn tag zero-shot cho ảnh listing (bếp, hồ bơi, view biển...) bằng CLIP -> PropertyItem.features.
+
+- Vector text của bộ nhãn (TAG_LABELS, qua TAG_PROMPT) encode 1 lần, cache theo model trong RAM + file .npy.
+- Vector ảnh lấy qua embed_images: cache vector + bytes đã tải ở bước dedup, nên không tải / forward lại.
+- Mọi ảnh của mọi listing trong request chấm với mọi nhãn bằng 1 phép nhân ma trận; xác suất = softmax
+  theo nhãn của cos·100 (như CLIP zero-shot). Tag của listing = xác suất lớn nhất trên các ảnh của nó.
+"""
+import asyncio, hashlib, os, threading, time
+from typing import Dict, List, Optional
+import numpy as np
+from app import config
+from app.schemas import PropertyItem
+
+_DEFAULT_LABELS = ("kitchen,bathroom,bedroom,living room,dining room,laundry,home office,garage,"
+                   "swimming pool,garden,balcony,deck,fireplace,ocean view,city view,"
+                   "building exterior,floor plan")
+
+# ---- Config ------------------------------------------------------------------
+TAG_LABELS = [s.strip() for s in (getattr(config, "TAG_LABELS", "") or _DEFAULT_LABELS).split(",") if s.strip()]
+TAG_PROMPT = getattr(config, "TAG_PROMPT", "a real estate photo of {}")
+TAG_MIN_SCORE = float(getattr(config, "TAG_MIN_SCORE", 0.3))
+TAG_MAX_PHOTOS = int(getattr(config, "TAG_MAX_PHOTOS", 0))  # 0 = mọi ảnh của listing
+TAG_CACHE_DIR = getattr(config, "TAG_CACHE_DIR", ".cache/tags")  # "" -> chỉ cache trong RAM
+# -----------------------------------------------------------------------------
+
+_LOGIT_SCALE = 100.0  # logit_scale của CLIP sau khi train
+
+_labels_cache: Dict[str, np.ndarray] = {}
+_labels_lock: Optional[asyncio.Lock] = None
+_stats_lock = threading.Lock()
+_stats = {"label_encodes": 0, "label_disk_hits": 0, "listings": 0, "images": 0, "tagged": 0, "score_ms": 0.0}
+
+
+def _key(model: str, labels: List[str], prompt: str) -> str:
+    return hashlib.sha1("\n".join([model, prompt, *labels]).encode()).hexdigest()[:16]
+
+
+def _load(path: str, n: int) -> Optional[np.ndarray]:
+    try:
+        m = np.load(path)
+    except (OSError, ValueError):
+        return None
+    return m if m.ndim == 2 and len(m) == n else None
+
+
+def _save(path: str, m: np.ndarray):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(tmp, m)
+    os.replace(tmp, path)
+
+
+async def label_matrix(labels: List[str] = TAG_LABELS, prompt: str = TAG_PROMPT,
+                       model: str = config.CLIP_MODEL) -> np.ndarray:
+    """(nhãn × dim) float32, L2-normalized; encode_text chỉ chạy lần đầu cho mỗi (model, prompt, bộ nhãn)."""
+    global _labels_lock
+    key = _key(model, labels, prompt)
+    m = _labels_cache.get(key)
+    if m is not None:
+        return m
+    if _labels_lock is None:
+        _labels_lock = asyncio.Lock()
+    async with _labels_lock:  # nhiều request đầu tiên cùng lúc -> chỉ encode 1 lần
+        m = _labels_cache.get(key)
+        if m is not None:
+            return m
+        path = os.path.join(TAG_CACHE_DIR, f"labels-{key}.npy") if TAG_CACHE_DIR else ""
+        m = await asyncio.to_thread(_load, path, len(labels)) if path and os.path.exists(path) else None
+        if m is not None:
+            _stats["label_disk_hits"] += 1
+        else:
+            from app.clip_embed import embed_texts  # import muộn: phần chấm điểm không cần torch
+            m = (await embed_texts([prompt.format(label) for label in labels])).astype(np.float32)
+            _stats["label_encodes"] += 1
+            if path:
+                await asyncio.to_thread(_save, path, m)
+        _labels_cache[key] = m
+    return m
+
+
+def score(image_vecs: np.ndarray, label_vecs: np.ndarray) -> np.ndarray:
+    """(ảnh × nhãn) xác suất: softmax theo nhãn của cos·100, cả lô trong 1 phép nhân ma trận."""
+    logits = _LOGIT_SCALE * (image_vecs @ label_vecs.T)
+    logits -= logits.max(axis=1, keepdims=True)
+    p = np.exp(logits)
+    p /= p.sum(axis=1, keepdims=True)
+    return p
+
+
+def listing_tags(probs: np.ndarray, labels: List[str], min_score: float = TAG_MIN_SCORE) -> Dict[str, float]:
+    """Xác suất các ảnh của 1 listing -> {nhãn: 0.87}, nhãn có điểm cao trước."""
+    best = probs.max(axis=0)
+    return {labels[j]: round(float(best[j]), 2) for j in np.argsort(-best) if best[j] >= min_score}
+
+
+def _photos(item: PropertyItem) -> List[str]:
+    return item.images[:TAG_MAX_PHOTOS] if TAG_MAX_PHOTOS > 0 else item.images
+
+
+async def tag_items(items: List[PropertyItem], prefetched: Optional[Dict[str, bytes]] = None,
+                    embedded: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, np.ndarray]:
+    """Điền `features` của các listing bằng tag; trả URL -> vector ảnh đã có để photo index dùng lại.
+
+    `prefetched`: bytes ảnh đã tải (bước dedup); `embedded`: vector đã có sẵn, khỏi embed lại.
+    """
+    from app.clip_embed import embed_images
+    vecs: Dict[str, np.ndarray] = dict(embedded or {})
+    urls = list(dict.fromkeys(u for item in items for u in _photos(item)))
+    todo = [u for u in urls if u not in vecs]
+    if todo:
+        vecs.update((r.url, r.vector) for r in await embed_images(todo, prefetched) if r.vector is not None)
+    urls = [u for u in urls if u in vecs]
+    if not urls:
+        return vecs
+    labels = TAG_LABELS
+    label_vecs = await label_matrix(labels)
+    t0 = time.perf_counter()
+    row = {u: i for i, u in enumerate(urls)}
+    probs = score(np.stack([vecs[u] for u in urls]).astype(np.float32, copy=False), label_vecs)
+    tagged = 0
+    for item in items:
+        rows = [row[u] for u in _photos(item) if u in row]
+        if rows:
+            tags = listing_tags(probs[rows], labels)
+            item.features.update(tags)
+            tagged += bool(tags)
+    with _stats_lock:
+        _stats["listings"] += len(items)
+        _stats["images"] += len(urls)
+        _stats["tagged"] += tagged
+        _stats["score_ms"] += (time.perf_counter() - t0) * 1000
+    return vecs
+
+
+def stats() -> dict:
+    with _stats_lock:
+        out = dict(_stats)
+    out["score_ms"] = round(out["score_ms"], 2)
+    return {"labels": TAG_LABELS, "prompt": TAG_PROMPT, "min_score": TAG_MIN_SCORE, "max_photos": TAG_MAX_PHOTOS,
+            "cached_label_sets": len(_labels_cache), **out}
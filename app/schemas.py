@@ -1,4 +1,4 @@
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Union
 from pydantic import BaseModel, Field
 
 class PropertyItem(BaseModel):
@@ -15,12 +15,19 @@ class PropertyItem(BaseModel):
     longitude: Optional[float] = None
     description: Optional[str] = None
     images: List[str] = []
-    features: Dict[str, str] = {}
+    features: Dict[str, Union[str, float]] = Field({}, description="Thuộc tính; tag ảnh (?tags=true) là điểm 0..1")
     raw: Dict = {}
+    cache: Optional[str] = Field(None, description="hit | revalidated | miss | bypass (page cache)")
+    change: Optional[str] = Field(None, description="new | changed | unchanged (so với listing store)")
+    source_urls: List[str] = Field([], description="Mọi trang của cùng căn này (sau khi gộp trùng giữa các site)")
 
 class EmbedRequest(BaseModel):
     image_urls: List[str]
 
 class SearchResponse(BaseModel):
     realestate: List[str] = []
-    domain: List[str] = []
\ No newline at end of file
+    domain: List[str] = []
+    # chỉ có khi explain=true
+    cached: Optional[bool] = None
+    upstream_calls: Optional[int] = None
+    plan: Optional[List[dict]] = None
\ No newline at end of file
@@ -1,12 +1,25 @@
 import json
 import re
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Union
 from bs4 import BeautifulSoup
+from app import config
+from app.scrapers.jsonld import parse_jsonld_blocks
 
 JSONLD_TYPE_CANDIDATES = {"RealEstateListing", "Residence", "Apartment", "House", "SingleFamilyResidence"}
+# "fast": quét byte tìm <script ld+json> (app/scrapers/jsonld.py); "bs4": dựng cây BeautifulSoup như cũ
+JSONLD_PARSER = getattr(config, "JSONLD_PARSER", "fast")
 
 
-def _parse_jsonld_blocks(html: str) -> List[Dict[str, Any]]:
+def _parse_jsonld_blocks(html: Union[str, bytes], encoding: Optional[str] = None) -> List[Dict[str, Any]]:
+    if JSONLD_PARSER == "bs4":
+        if isinstance(html, bytes):
+            html = html.decode(encoding or "utf-8", errors="replace")
+        return _parse_jsonld_blocks_bs4(html)
+    return parse_jsonld_blocks(html, encoding or "utf-8")
+
+
+def _parse_jsonld_blocks_bs4(html: str) -> List[Dict[str, Any]]:
+    """Bản cũ, giữ lại để đối chiếu (bench/jsonld_parity.py) và làm phương án dự phòng."""
     soup = BeautifulSoup(html, "lxml")
     out = []
     for s in soup.find_all("script"):
@@ -31,8 +44,8 @@ def _parse_jsonld_blocks(html: str) -> List[Dict[str, Any]]:
     return out
 
 
-def extract_from_jsonld(html: str) -> Dict[str, Any]:
-    blocks = _parse_jsonld_blocks(html)
+def extract_from_jsonld(html: Union[str, bytes], encoding: Optional[str] = None) -> Dict[str, Any]:
+    blocks = _parse_jsonld_blocks(html, encoding)
     best = None
     for b in blocks:
         types = {b.get("@type")} | set(b.get("@type", []) if isinstance(b.get("@type"), list) else [])
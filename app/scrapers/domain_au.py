@@ -1,5 +1,5 @@
 import re
-from typing import Optional
+from typing import Optional, Union
 from app.schemas import PropertyItem
 from app.scrapers.common import extract_from_jsonld
 
@@ -11,8 +11,8 @@ def parse_listing_id(url: str) -> Optional[str]:
     return m.group(1) if m else None
 
 
-def transform(url: str, html: str) -> PropertyItem:
-    data = extract_from_jsonld(html)
+def transform(url: str, html: Union[str, bytes], encoding: Optional[str] = None) -> PropertyItem:
+    data = extract_from_jsonld(html, encoding)
     item = PropertyItem(
         source="domain",
         url=url,
@@ -0,0 +1,199 @@
+# app/scrapers/jsonld.py
+"""Lấy các block <script type="application/ld+json"> bằng cách quét thẳng HTML,
+không dựng DOM. Quy tắc khớp với tokenizer HTML5 của libxml2 >= 2.14 (lxml, mà BeautifulSoup
+"lxml" dùng), nên ra đúng các block như bản bs4:
+
+- comment `<!-- ... -->` (cả `<!-->`, `--!>`), `<!...>` / `<?...>` (doctype, CDATA, bogus comment) bị bỏ qua;
+- thẻ mở/đóng được tách theo thuộc tính: `<` trong giá trị thuộc tính (kể cả không có dấu nháy) không
+  mở thẻ mới;
+- nội dung <script> là script data (có trạng thái escape `<!--<script>...`), <style> <xmp> <iframe>
+  <noembed> <noframes> là raw text, <title> <textarea> là RCDATA, <plaintext> kéo tới hết trang: thẻ
+  bên trong không được tính. Thẻ tự đóng (`<title/>`) thì libxml2 coi là rỗng;
+- thuộc tính `type` lặp lại thì lấy cái đầu tiên; entity trong giá trị được giải mã.
+"""
+import html as _html
+import json
+import re
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+try:
+    import orjson  # nhanh hơn json chuẩn vài lần trên block lớn
+except ImportError:  # pragma: no cover - tuỳ chọn
+    orjson = None
+
+_WS = rb"\t\n\f\r "  # khoảng trắng theo HTML5 (không có \v)
+# phần sau "<" hoặc "</": tên thẻ, các thuộc tính theo đúng các trạng thái tokenizer (mỗi token lấy tối đa,
+# nên không backtrack; dấu nháy không đóng -> không khớp = hết trang giữa thẻ), "/"? và ">"
+_ATTRS = rb"""(?:[%(ws)s]+(?![%(ws)s])
+      |/(?!>)
+      |[^%(ws)s/>][^%(ws)s/>=]*(?=[%(ws)s/>=])
+       (?:[%(ws)s]*=[%(ws)s]*(?:"[^"]*"|'[^']*'|[^%(ws)s>"'][^%(ws)s>]*(?=[%(ws)s>])|(?=>))
+         |(?![%(ws)s]*=))
+    )*""" % {b"ws": _WS}
+_TAG_RE = re.compile(rb"([A-Za-z][^%s/>]*)(?=[%s/>])(%s)(/?)>" % (_WS, _WS, _ATTRS), re.X)
+_ATTR_RE = re.compile(rb"""([^%(ws)s/>][^%(ws)s/>=]*)
+    (?:[%(ws)s]*=[%(ws)s]*(?:"([^"]*)"|'([^']*)'|([^%(ws)s>"'][^%(ws)s>]*)))?""" % {b"ws": _WS}, re.X)
+_COMMENT_END_RE = re.compile(rb"--!?>")
+
+_RAWTEXT = ("style", "xmp", "iframe", "noembed", "noframes", "title", "textarea")
+_END_RE = {name.encode(): re.compile(rb"</%s(?=[%s/>])" % (name.encode(), _WS), re.I) for name in _RAWTEXT}
+# script data: <!-- -> escaped; trong escaped gặp <script -> double escaped, </script khi đó không đóng thẻ
+_SCRIPT_DATA_RE = re.compile(rb"<!--|</script(?=[%s/>])" % _WS, re.I)
+_SCRIPT_ESCAPED_RE = re.compile(rb"-->|<(/?)script(?=[%s/>])" % _WS, re.I)
+_SCRIPT_DOUBLE_RE = re.compile(rb"-->|</script(?=[%s/>])" % _WS, re.I)
+
+# đoạn "thường" bỏ qua trong 1 lần match (C): text, "<" lẻ, thẻ đóng và thẻ mở tên thường (chữ thường, không
+# phải script / raw text) có thuộc tính dạng đơn giản (name hoặc name="..."/'...'). Thẻ dạng khác không khớp
+# -> vòng lặp Python tách bằng _TAG_RE; kết quả như nhau, chỉ chậm hơn.
+_PLAIN_RE = re.compile(rb"""[^<]*(?:<(?:(?![!?/A-Za-z])
+      |(?:/[A-Za-z]|(?!(?:script|style|xmp|iframe|noembed|noframes|title|textarea|plaintext)[%(ws)s/>])
+          [a-z][a-z0-9-]*(?=[%(ws)s/>]))
+       [^"'>=<]*(?:(?<=[^%(ws)s/"'=])=(?:"[^"]*"|'[^']*')[^"'>=<]*)*>
+    )[^<]*)*""" % {b"ws": _WS}, re.X)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_NOTHING = object()
+
+
+def _type_attr(attrs: bytes) -> bytes:
+    for m in _ATTR_RE.finditer(attrs):
+        if m.group(1).lower() == b"type":
+            value = m.group(2) or m.group(3) or m.group(4) or b""
+            if b"&" in value:
+                value = _html.unescape(value.decode("utf-8", "replace")).encode("utf-8")
+            return value.lower()
+    return b""
+
+
+def _script_end(html: bytes, pos: int) -> int:
+    """Vị trí `</script` đóng thẻ script có nội dung bắt đầu ở `pos` (len(html) nếu hết trang)."""
+    state = 0  # 0 = script data, 1 = escaped, 2 = double escaped
+    while True:
+        m = (_SCRIPT_DATA_RE, _SCRIPT_ESCAPED_RE, _SCRIPT_DOUBLE_RE)[state].search(html, pos)
+        if m is None:
+            return len(html)
+        tok, pos = m.group(), m.end()
+        if state == 0:
+            if tok[1:2] == b"/":
+                return m.start()
+            while html[pos:pos + 1] == b"-":  # "<!--" rồi "-" / ">" ngay: "<!-->", "<!--->" không vào escaped
+                pos += 1
+            if html[pos:pos + 1] == b">":
+                pos += 1
+            else:
+                state = 1
+        elif tok == b"-->":
+            state = 0
+        elif state == 1:
+            if m.group(1):
+                return m.start()
+            state = 2
+        else:
+            state = 1
+
+
+def _skip_to_gt(html: bytes, pos: int) -> Optional[int]:
+    end = html.find(b">", pos)
+    return None if end < 0 else end + 1
+
+
+def iter_script_bodies(html: bytes) -> Iterator[bytes]:
+    """Thân các script có type chứa "ld+json", theo thứ tự xuất hiện."""
+    pos, n = 0, len(html)
+    while True:
+        lt = _PLAIN_RE.match(html, pos).end()
+        if lt >= n:
+            return
+        c = html[lt + 1:lt + 2]  # html[lt] == "<", theo sau là ! ? / hoặc chữ cái
+        if c == b"!":
+            if html.startswith(b"<!--", lt):
+                q = lt + 4
+                if html.startswith(b">", q) or html.startswith(b"->", q):  # "<!-->", "<!--->": comment rỗng
+                    pos = html.index(b">", q) + 1
+                    continue
+                end = _COMMENT_END_RE.search(html, q)
+                if end is None:
+                    return
+                pos = end.end()
+            else:  # doctype, <![CDATA[ ...: tới ">" đầu tiên
+                pos = _skip_to_gt(html, lt + 2)
+            if pos is None:
+                return
+            continue
+        if c == b"?":
+            pos = _skip_to_gt(html, lt + 2)
+            if pos is None:
+                return
+            continue
+        closing = c == b"/"
+        start = lt + 2 if closing else lt + 1
+        if closing and not html[start:start + 1].isalpha():
+            if start >= n:
+                return
+            # "</>" bị bỏ; "</" + ký tự khác: bogus comment tới ">"
+            pos = start + 1 if html[start:start + 1] == b">" else _skip_to_gt(html, start)
+            if pos is None:
+                return
+            continue
+        t = _TAG_RE.match(html, start)
+        if t is None:  # hết trang giữa thẻ (vd. dấu nháy không đóng): phần còn lại bị bỏ
+            return
+        pos = t.end()
+        if closing or t.group(3):
+            continue
+        name = t.group(1).lower()
+        if name == b"script":
+            end = _script_end(html, pos)
+            if b"ld+json" in _type_attr(t.group(2)):
+                yield html[pos:end]
+            pos = end
+        elif name in _END_RE:
+            close = _END_RE[name].search(html, pos)
+            if close is None:
+                return
+            pos = close.start()
+        elif name == b"plaintext":
+            return
+
+
+def _loads(raw: Union[str, bytes]) -> Any:
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass  # json chuẩn chấp nhận thêm NaN/Infinity, số nguyên rất lớn...
+    return json.loads(raw)
+
+
+def parse_jsonld_blocks(html: Union[str, bytes], encoding: str = "utf-8") -> List[Dict[str, Any]]:
+    """Các object JSON-LD (dict) trong trang; block hỏng thì thử sửa dấu phẩy thừa rồi bỏ qua."""
+    data_bytes = html.encode("utf-8") if isinstance(html, str) else html
+    if isinstance(html, str):
+        encoding = "utf-8"
+    out: List[Dict[str, Any]] = []
+    for body in iter_script_bodies(data_bytes):
+        if encoding.lower().replace("-", "") == "utf8":
+            raw: Union[str, bytes] = body
+            text = None
+        else:
+            raw = text = body.decode(encoding, errors="replace")
+        if not raw.strip():
+            continue
+        try:
+            data = _loads(raw)
+        except Exception:
+            if text is None:  # bytes UTF-8 lỗi -> giải mã như Page.text rồi thử lại
+                text = body.decode("utf-8", errors="replace")
+            data = _NOTHING
+            for candidate in (text, _TRAILING_COMMA_RE.sub(r"\1", text)):  # sửa dấu phẩy thừa
+                try:
+                    data = _loads(candidate)
+                    break
+                except Exception:
+                    continue
+            if data is _NOTHING:
+                continue
+        if isinstance(data, list):
+            out.extend([x for x in data if isinstance(x, dict)])
+        elif isinstance(data, dict):
+            out.append(data)
+    return out
@@ -1,5 +1,5 @@
 import re
-from typing import Optional
+from typing import Optional, Union
 from bs4 import BeautifulSoup
 from app.schemas import PropertyItem
 from app.scrapers.common import extract_from_jsonld
@@ -12,8 +12,8 @@ def parse_listing_id(url: str) -> Optional[str]:
     return m.group(1) if m else None
 
 
-def transform(url: str, html: str) -> PropertyItem:
-    data = extract_from_jsonld(html)
+def transform(url: str, html: Union[str, bytes], encoding: Optional[str] = None) -> PropertyItem:
+    data = extract_from_jsonld(html, encoding)
     item = PropertyItem(
         source="realestate",
         url=url,
@@ -1,17 +1,37 @@
-import re, time, random
-from typing import List, Dict
-import httpx
+import re, random, asyncio, contextvars, logging, time
+from typing import AsyncIterator, Callable, List, Dict, Optional, Tuple
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse, parse_qs, unquote
-from duckduckgo_search import DDGS
+from duckduckgo_search import AsyncDDGS
 from duckduckgo_search.exceptions import RatelimitException
 from app import config
+from app.utils.http import Http
+from app.utils.ratelimit import limiter
+from app.address_plan import plan_queries, shape_stats
+from app.search_cache import search_cache, upstream_answered
+from app.utils.metrics import SEARCH_QUERY_SECONDS, SEARCH_UPSTREAM_CALLS, log
 
 RE_URL_REA = re.compile(r"https?://(www\.)?realestate\.com\.au/[^\s]+", re.I)
 RE_URL_DOM = re.compile(r"https?://(www\.)?domain\.com\.au/[^\s]+", re.I)
 
 SEARCH_RETRIES = getattr(config, "SEARCH_RETRIES", 4)
 BACKOFF_BASE   = getattr(config, "SEARCH_BACKOFF_BASE", 1.8)
+CONCURRENCY    = max(1, int(getattr(config, "SEARCH_CONCURRENCY", 3)))  # 1: tuần tự, ít call nhất
+SEARCH_BACKEND = getattr(config, "SEARCH_BACKEND", "ddg")  # ddg (API) | html (chỉ trang HTML)
+COMBINED_SITES = bool(getattr(config, "SEARCH_COMBINED_SITES", True))  # 1 query "site:a OR site:b"
+MAX_CALLS      = int(getattr(config, "SEARCH_MAX_CALLS", 0))             # ngân sách call / địa chỉ, 0 = không giới hạn
+_DDG_HOST      = "duckduckgo.com"
+
+# [số lần gọi upstream (mỗi lần thử DDG API / endpoint HTML), số query mọi endpoint đều lỗi]
+# của lần search hiện tại
+_upstream_calls: contextvars.ContextVar[Optional[List[int]]] = contextvars.ContextVar("search_upstream_calls",
+                                                                                      default=None)
+
+
+def _count_call(slot: int = 0):
+    calls = _upstream_calls.get()
+    if calls is not None:
+        calls[slot] += 1
 
 def _normalize_ddg_href(href: str) -> str:
     if not href:
@@ -37,27 +57,23 @@ def _normalize_ddg_href(href: str) -> str:
         pass
     return href
 
-def _ddg_html_fallback(query: str, max_results: int) -> List[str]:
-    """Fallback HTML – thử nhiều endpoint và luôn follow redirect."""
+async def _ddg_html_fallback(query: str, max_results: int) -> List[str]:
+    """Fallback HTML – thử nhiều endpoint qua Http._fetch (limiter, slot theo host, phạt khi 429/403/503)."""
     candidates = [
         "https://html.duckduckgo.com/html/",  # nên dùng cái này
         "https://duckduckgo.com/html/",
         "https://lite.duckduckgo.com/lite/",
     ]
-    proxies = None
-    if getattr(config, "PROXY_URL", ""):
-        proxies = {"http": config.PROXY_URL, "https": config.PROXY_URL}
-
-    for base in candidates:
-        try:
-            with httpx.Client(
-                timeout=20,
-                headers={"User-Agent": config.USER_AGENT},
-                follow_redirects=True,          # QUAN TRỌNG
-                proxies=proxies,
-            ) as c:
-                r = c.get(base, params={"q": query, "kl": (config.DDG_REGION or "wt-wt")})
-                r.raise_for_status()
+    http = Http()
+    answered = False
+    try:
+        for base in candidates:
+            t0 = None
+            try:
+                _count_call()
+                t0 = time.perf_counter()
+                # 1 lần thử mỗi endpoint (hỏng thì sang endpoint kế), _fetch tự xin token của host
+                r = await http._fetch(base, max_retries=0, params={"q": query, "kl": (config.DDG_REGION or "wt-wt")})
                 soup = BeautifulSoup(r.text, "lxml")
 
                 urls: List[str] = []
@@ -67,62 +83,68 @@ def _ddg_html_fallback(query: str, max_results: int) -> List[str]:
                         urls.append(href)
                         if len(urls) >= max_results:
                             break
-                print(f"[DDG-HTML] {base} ok: {query} -> {len(urls)} urls")
+                answered = True
+                SEARCH_QUERY_SECONDS.observe(time.perf_counter() - t0, backend="html", outcome="ok")
+                log("ddg_html_ok", endpoint=base, query=query, urls=len(urls))
                 if urls:
                     return urls
-        except Exception as e:
-            print(f"[DDG-HTML] {base} error: {query} -> {e}")
-    return []
+            except Exception as e:
+                if t0 is not None:
+                    SEARCH_QUERY_SECONDS.observe(time.perf_counter() - t0, backend="html", outcome="error")
+                log("ddg_html_error", logging.WARNING, endpoint=base, query=query, error=str(e))
+        if not answered:
+            _count_call(1)  # [] này là lỗi, không phải "không có kết quả"
+        return []
+    finally:
+        await http.close()
 
 
 
-def _ddg_text(query: str, max_results: int) -> List[str]:
+async def _ddg_text(query: str, max_results: int) -> List[str]:
+    if SEARCH_BACKEND == "html":
+        return await _ddg_html_fallback(query, max_results)
     attempt = 0
+    proxy = getattr(config, "PROXY_URL", "") or None
     while True:
+        t0 = None
         try:
+            await limiter.acquire(_DDG_HOST)
+            _count_call()
+            t0 = time.perf_counter()
             urls: List[str] = []
-            with DDGS() as ddgs:
-                for r in ddgs.text(
+            async with AsyncDDGS(proxy=proxy) as ddgs:
+                results = await ddgs.text(
                     query,
                     region=(config.DDG_REGION or "wt-wt"),
                     safesearch="off",
                     timelimit=None,
                     max_results=max_results * 5,
-                ):
-                    href = (r.get("href") or r.get("link") or "").strip()
-                    href = _normalize_ddg_href(href)
-                    if href:
-                        urls.append(href)
-                        if len(urls) >= max_results:
-                            break
-            print(f"[DDG] ok: {query} -> {len(urls)} urls")
+                )
+            for r in results or []:
+                href = (r.get("href") or r.get("link") or "").strip()
+                href = _normalize_ddg_href(href)
+                if href:
+                    urls.append(href)
+                    if len(urls) >= max_results:
+                        break
+            SEARCH_QUERY_SECONDS.observe(time.perf_counter() - t0, backend="ddg", outcome="ok")
+            log("ddg_ok", query=query, urls=len(urls))
             return urls
         except RatelimitException:
+            if t0 is not None:
+                SEARCH_QUERY_SECONDS.observe(time.perf_counter() - t0, backend="ddg", outcome="ratelimited")
             if attempt >= SEARCH_RETRIES:
-                print(f"[DDG] 429 fallback HTML: {query}")
-                return _ddg_html_fallback(query, max_results)
-            time.sleep((BACKOFF_BASE ** attempt) + random.uniform(0, 0.5))
+                log("ddg_ratelimited_fallback", logging.WARNING, query=query, attempts=attempt)
+                return await _ddg_html_fallback(query, max_results)
+            # limiter giữ mọi query DDG khác lại cho tới hết backoff
+            await limiter.penalize(_DDG_HOST, (BACKOFF_BASE ** attempt) + random.uniform(0, 0.5))
             attempt += 1
         except Exception as e:
-            print(f"[DDG] error: {query} -> {e} -> fallback HTML")
-            return _ddg_html_fallback(query, max_results)
-
-
-def _variants(address: str) -> List[str]:
-    """Sinh biến thể query để nới điều kiện khớp."""
-    a = address.strip()
-    outs = {a}
-    # Bỏ số căn/unit prefix: "107/131 ..." -> "131 ..."
-    outs.add(re.sub(r"^\s*\d+\s*/\s*", "", a))
-    # Bỏ postcode (4 chữ số cuối)
-    outs.add(re.sub(r"\b\d{4}\b", "", a).strip())
-    # Bỏ số nhà đầu
-    outs.add(re.sub(r"^\s*\d+[^A-Za-z]+", "", a).strip())
-    # Đổi QLD <-> Qld
-    outs.add(a.replace(" QLD ", " Qld "))
-    outs.add(a.replace(" Qld ", " QLD "))
-    # Biến thể không có ngoặc kép (DDG khớp rộng hơn)
-    return [s for s in outs if s]
+            if t0 is not None:
+                SEARCH_QUERY_SECONDS.observe(time.perf_counter() - t0, backend="ddg", outcome="error")
+            log("ddg_error_fallback", logging.WARNING, query=query, error=str(e))
+            return await _ddg_html_fallback(query, max_results)
+
 
 def _dedupe(seq: List[str]) -> List[str]:
     seen, out = set(), []
@@ -131,27 +153,133 @@ def _dedupe(seq: List[str]) -> List[str]:
             seen.add(x); out.append(x)
     return out
 
-def search_address(address: str, max_results: int | None = None) -> Dict[str, List[str]]:
+_SITES: Dict[str, Tuple[str, re.Pattern]] = {
+    "realestate": ("realestate.com.au", RE_URL_REA),
+    "domain":     ("domain.com.au", RE_URL_DOM),
+}
+
+async def search_address(address: str, max_results: int | None = None,
+                         report: Optional[dict] = None) -> Dict[str, List[str]]:
+    """Tra cache trước; các request trùng địa chỉ đang chạy dùng chung 1 lần search upstream.
+
+    `report` (nếu có) nhận `cached`, `upstream_calls` và `plan` (các query đã gửi, theo thứ tự).
+    Cache hit hoặc gộp vào search của request khác -> cached=True, upstream_calls=0.
+    """
     max_results = max_results or config.MAX_RESULTS
-    urls_rea: List[str] = []
-    urls_dom: List[str] = []
+    if report is not None:
+        report.update(cached=True, upstream_calls=0, plan=[])
+    return await search_cache.get_or_search(
+        address, max_results, lambda: _search_uncached(address, max_results, report=report)
+    )
 
-    for q in _variants(address):
-        if len(urls_rea) < max_results:
-            for href in _ddg_text(f'{q} site:realestate.com.au', max_results):
-                href = _normalize_ddg_href(href)
-                if RE_URL_REA.match(href):
-                    urls_rea.append(href)
-                    if len(urls_rea) >= max_results: break
-        time.sleep(0.6)
-        if len(urls_dom) < max_results:
-            for href in _ddg_text(f'{q} site:domain.com.au', max_results):
-                href = _normalize_ddg_href(href)
-                if RE_URL_DOM.match(href):
-                    urls_dom.append(href)
-                    if len(urls_dom) >= max_results: break
-        if len(urls_rea) >= max_results and len(urls_dom) >= max_results:
-            break
-
-    return {"realestate": _dedupe(urls_rea)[:max_results],
-            "domain":     _dedupe(urls_dom)[:max_results]}
+async def iter_search_address(address: str, max_results: int | None = None) -> AsyncIterator[Tuple[str, str]]:
+    """Như search_address nhưng trả từng (site, url) ngay khi tìm thấy, không chờ site còn lại.
+
+    Cache hit hoặc gộp vào 1 search đang chạy của request khác -> các URL ra cùng lúc ở cuối.
+    """
+    max_results = max_results or config.MAX_RESULTS
+    found: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(search_cache.get_or_search(
+        address, max_results, lambda: _search_uncached(address, max_results, found.put_nowait)
+    ))
+    seen = set()
+    try:
+        while True:
+            get = asyncio.ensure_future(found.get())
+            await asyncio.wait({get, task}, return_when=asyncio.FIRST_COMPLETED)
+            if not get.done():
+                get.cancel()
+                break
+            seen.add(get.result())
+            yield get.result()
+        while not found.empty():
+            pair = found.get_nowait()
+            if pair not in seen:
+                seen.add(pair)
+                yield pair
+        for key, urls in task.result().items():
+            for url in urls:
+                if (key, url) not in seen:
+                    seen.add((key, url))
+                    yield key, url
+    finally:
+        if not task.done():
+            task.cancel()  # get_or_search shield search upstream: request khác vẫn nhận kết quả
+            await asyncio.gather(task, return_exceptions=True)
+
+async def _search_uncached(address: str, max_results: int,
+                           on_url: Optional[Callable[[Tuple[str, str]], None]] = None,
+                           report: Optional[dict] = None) -> Dict[str, List[str]]:
+    """Thử các biến thể theo thứ tự của planner (cụ thể nhất/hay trúng nhất trước), dừng khi đủ cả 2 site.
+
+    Khi cả 2 site còn thiếu thì gửi 1 query gộp "site:realestate.com.au OR site:domain.com.au" rồi tách
+    URL theo domain; chỉ còn 1 site thiếu thì query riêng site đó. Mỗi biến thể đã gửi được ghi vào
+    shape_stats (có/không có kết quả) để planner học thứ tự.
+
+    `on_url((site, url))` được gọi cho mỗi URL mới (đã dedupe, trong max_results đầu) ngay khi có.
+    """
+    found: Dict[str, List[str]] = {k: [] for k in _SITES}
+    emitted: Dict[str, set] = {k: set() for k in _SITES}
+    sem = asyncio.Semaphore(CONCURRENCY)
+    calls = [0, 0]
+    _upstream_calls.set(calls)  # chạy trong task riêng của search_cache: không lẫn sang request khác
+    plan = plan_queries(address)
+    tried: List[dict] = []
+
+    def _enough(key: str) -> bool:
+        return len(_dedupe(found[key])) >= max_results
+
+    def _add(key: str, hrefs: List[str]):
+        found[key].extend(hrefs)
+        if on_url is not None:
+            for url in _dedupe(found[key])[:max_results]:
+                if url not in emitted[key]:
+                    emitted[key].add(url)
+                    on_url((key, url))
+
+    async def _one(shape: str, q: str):
+        async with sem:
+            # biến thể trước có thể đã lấp đủ trong lúc chờ semaphore
+            keys = [k for k in _SITES if not _enough(k)]
+            if not keys or (MAX_CALLS and calls[0] >= MAX_CALLS):
+                return None
+            if COMBINED_SITES and len(keys) > 1:
+                groups = [(keys, q + " (" + " OR ".join(f"site:{_SITES[k][0]}" for k in keys) + ")")]
+            else:
+                groups = [([k], f"{q} site:{_SITES[k][0]}") for k in keys]
+            got: Dict[str, List[str]] = {k: [] for k in keys}
+            for group, query in groups:
+                for h in map(_normalize_ddg_href, await _ddg_text(query, max_results * len(group))):
+                    for k in group:
+                        if _SITES[k][1].match(h):
+                            got[k].append(h)
+            hit = any(got.values())
+            shape_stats.record(shape, hit)
+            tried.append({"shape": shape, "query": q, "sites": keys, "hit": hit})
+            # ghi trước khi nhả semaphore: biến thể kế tiếp thấy ngay site nào đã đủ
+            for key, hrefs in got.items():
+                _add(key, hrefs)
+
+    pending = {asyncio.create_task(_one(shape, q)) for shape, q in plan}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                t.result()
+            if all(_enough(k) for k in _SITES):
+                break
+    finally:
+        for t in pending:
+            t.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    result = {k: _dedupe(v)[:max_results] for k, v in found.items()}
+    SEARCH_UPSTREAM_CALLS.observe(calls[0])
+    log("search_plan", address=address, upstream_calls=calls[0], queries=len(tried),
+        shapes=",".join(x["shape"] for x in tried), **{k: len(v) for k, v in result.items()})
+    if report is not None:
+        report.update(cached=False, upstream_calls=calls[0], plan=tried)
+    # rỗng chỉ đáng negative-cache khi mọi query đều có upstream trả lời
+    upstream_answered.set(bool(calls[0]) and not calls[1])
+    return result
@@ -0,0 +1,160 @@
+# app/search_cache.py
+import asyncio, contextvars, json, re, sqlite3, threading, time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+from app import config
+from app.address_plan import parse_address
+
+SearchResult = Dict[str, List[str]]
+
+# ---- Config ------------------------------------------------------------------
+CACHE_TTL_S     = float(getattr(config, "SEARCH_CACHE_TTL", 6 * 3600))
+CACHE_NEG_TTL_S = float(getattr(config, "SEARCH_CACHE_NEG_TTL", 900))
+CACHE_MAX       = int(getattr(config, "SEARCH_CACHE_MAX", 2048))
+CACHE_PATH      = getattr(config, "SEARCH_CACHE_PATH", "")  # "" -> chỉ cache trong RAM
+# -----------------------------------------------------------------------------
+
+
+# search() đặt False khi có query không tới được upstream (mọi endpoint lỗi): kết quả rỗng khi đó
+# là lỗi tạm chứ không phải "không có listing" -> không negative-cache
+upstream_answered: contextvars.ContextVar[bool] = contextvars.ContextVar("search_upstream_answered", default=True)
+
+
+def normalize_address(address: str) -> str:
+    """'107/131 Foo St,  Brisbane QLD 4000' -> '107/131 foo st brisbane qld 4000'."""
+    a = (address or "").lower()
+    a = re.sub(r"[^\w/]+", " ", a)
+    return re.sub(r"\s+", " ", a).strip()
+
+
+class _MemoryLRU:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple[float, SearchResult]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[SearchResult]:
+        hit = self._data.get(key)
+        if hit is None:
+            return None
+        expires, value = hit
+        if expires < time.time():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: SearchResult, expires: float):
+        self._data[key] = (expires, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _SqliteStore:
+    """Tầng cache trên đĩa (sống qua restart); truy cập qua thread để không chặn event loop."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS search_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[tuple[float, SearchResult]]:
+        with self._lock:
+            row = self._db.execute("SELECT value, expires FROM search_cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return row[1], json.loads(row[0])
+
+    def set(self, key: str, value: SearchResult, expires: float):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO search_cache (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires),
+            )
+            self._db.execute("DELETE FROM search_cache WHERE expires < ?", (time.time(),))
+            self._db.commit()
+
+
+class SearchCache:
+    """Cache kết quả search theo địa chỉ chuẩn hoá: TTL + LRU, negative cache, single-flight."""
+
+    def __init__(self, ttl: float = CACHE_TTL_S, neg_ttl: float = CACHE_NEG_TTL_S,
+                 max_entries: int = CACHE_MAX, path: str = CACHE_PATH):
+        self.ttl = ttl
+        self.neg_ttl = neg_ttl
+        self._mem = _MemoryLRU(max_entries)
+        self._disk = _SqliteStore(path) if path else None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = self.misses = self.coalesced = self.negative_hits = 0
+
+    @staticmethod
+    def key(address: str, max_results: int) -> str:
+        # dạng chuẩn của planner: "Street"/"St", "Unit 3, 5 ..."/"3/5 ..." dùng chung 1 entry
+        return f"{normalize_address(parse_address(address).canonical)}|{max_results}"
+
+    async def _lookup(self, key: str) -> Optional[SearchResult]:
+        value = self._mem.get(key)
+        if value is None and self._disk is not None:
+            hit = await asyncio.to_thread(self._disk.get, key)
+            if hit is not None:
+                expires, value = hit
+                self._mem.set(key, value, expires)
+        return value
+
+    async def _store(self, key: str, value: SearchResult):
+        empty = not any(value.values())
+        expires = time.time() + (self.neg_ttl if empty else self.ttl)
+        self._mem.set(key, value, expires)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.set, key, value, expires)
+
+    async def get_or_search(self, address: str, max_results: int,
+                            search: Callable[[], Awaitable[SearchResult]]) -> SearchResult:
+        key = self.key(address, max_results)
+        value = await self._lookup(key)
+        if value is not None:
+            self.hits += 1
+            if not any(value.values()):
+                self.negative_hits += 1
+            return {k: list(v) for k, v in value.items()}
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+
+            async def _run() -> SearchResult:
+                try:
+                    result = await search()
+                    if any(result.values()) or upstream_answered.get():
+                        await self._store(key, result)
+                    return result
+                finally:
+                    self._inflight.pop(key, None)
+
+            # chạy tách khỏi request gọi đầu tiên: client đó huỷ thì các request đang chờ vẫn có kết quả
+            task = self._inflight[key] = asyncio.create_task(_run())
+        value = await asyncio.shield(task)
+        return {k: list(v) for k, v in value.items()}
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._mem),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+            "disk": bool(self._disk),
+        }
+
+
+search_cache = SearchCache()
@@ -0,0 +1,110 @@
+# app/utils/compress.py
+"""Nén response theo Accept-Encoding (br / gzip), ASGI middleware.
+
+Chỉ nén response 1 khối (body gửi trong 1 message): stream ndjson / SSE đi thẳng, không bị giữ lại để
+nén. brotli là tuỳ chọn (pip install brotli); thiếu thì chỉ còn gzip.
+"""
+import asyncio, gzip
+from typing import Dict, Optional
+from starlette.datastructures import Headers, MutableHeaders
+from app import config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# ---- Config ------------------------------------------------------------------
+COMPRESS_ENCODINGS = [s.strip() for s in getattr(config, "COMPRESS_ENCODINGS", "br,gzip").split(",") if s.strip()]
+COMPRESS_MIN_BYTES = int(getattr(config, "COMPRESS_MIN_BYTES", 1024))
+COMPRESS_GZIP_LEVEL = int(getattr(config, "COMPRESS_GZIP_LEVEL", 5))
+COMPRESS_BR_QUALITY = int(getattr(config, "COMPRESS_BR_QUALITY", 4))
+# -----------------------------------------------------------------------------
+
+_TYPES = ("application/json", "text/", "application/x-ndjson", "application/javascript")
+_OFFLOAD_BYTES = 1 << 20  # body lớn: nén trong thread, không chặn event loop
+_stats = {"compressed": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+def _accepted(header: str) -> Dict[str, float]:
+    out = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        for p in params.split(";"):
+            k, _, v = p.strip().partition("=")
+            if k == "q":
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0.0
+        if name:
+            out[name.strip().lower()] = q
+    return out
+
+
+def choose_encoding(accept_encoding: str, supported=None) -> Optional[str]:
+    """Encoding đầu tiên trong COMPRESS_ENCODINGS mà client nhận (q > 0), hoặc None."""
+    accepted = _accepted(accept_encoding or "")
+    for enc in supported if supported is not None else COMPRESS_ENCODINGS:
+        if enc == "br" and brotli is None:
+            continue
+        if accepted.get(enc, accepted.get("*", 0.0)) > 0:
+            return enc
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESS_BR_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+
+
+class CompressMiddleware:
+    def __init__(self, app, min_bytes: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.min_bytes = min_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not COMPRESS_ENCODINGS:
+            return await self.app(scope, receive, send)
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start: Optional[dict] = None
+        decided = False
+
+        async def _send(message):
+            nonlocal start, decided
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if decided or message["type"] != "http.response.body":
+                return await send(message)
+            decided = True
+            body, more = message.get("body", b""), message.get("more_body", False)
+            headers = MutableHeaders(raw=start["headers"])
+            if (more or len(body) < self.min_bytes or "content-encoding" in headers
+                    or not headers.get("content-type", "").startswith(_TYPES)):
+                await send(start)
+                return await send(message)
+            data = (await asyncio.to_thread(compress, body, encoding) if len(body) >= _OFFLOAD_BYTES
+                    else compress(body, encoding))
+            headers["content-encoding"] = encoding
+            headers["content-length"] = str(len(data))
+            headers.add_vary_header("Accept-Encoding")
+            _stats["compressed"] += 1
+            _stats["bytes_in"] += len(body)
+            _stats["bytes_out"] += len(data)
+            await send(start)
+            await send({"type": "http.response.body", "body": data})
+
+        await self.app(scope, receive, _send)
+
+
+def stats() -> dict:
+    ratio = _stats["bytes_out"] / _stats["bytes_in"] if _stats["bytes_in"] else None
+    return {"encodings": [e for e in COMPRESS_ENCODINGS if e != "br" or brotli is not None],
+            "brotli_installed": brotli is not None, "min_bytes": COMPRESS_MIN_BYTES, **_stats,
+            "ratio": round(ratio, 3) if ratio is not None else None}
@@ -1,88 +1,169 @@
 # app/utils/http.py
-import asyncio, random, time
+import asyncio, logging, random, time
 from urllib.parse import urlparse
 import httpx
 from app import config
+from app.utils.metrics import PAGE_CACHE_RESULTS, UPSTREAM_FETCH_SECONDS, UPSTREAM_RETRIES, log
+from app.utils.ratelimit import limiter, parse_retry_after
+from app.utils.page_cache import Page, page_cache
 
 # ---- Config (đọc từ .env nếu có, có giá trị mặc định) -----------------------
 HTTP_TIMEOUT_S        = float(getattr(config, "HTTP_TIMEOUT", 20))     # tổng timeout
 HTTP_MAX_RETRIES      = int(getattr(config, "HTTP_MAX_RETRIES", 5))
 HTTP_BACKOFF_BASE     = float(getattr(config, "HTTP_BACKOFF_BASE", 1.8))
-HTTP_RATE_GAP_DEFAULT = float(getattr(config, "HTTP_RATE_GAP_DEFAULT", 1.5))
-
-_RATE_GAP_BY_HOST = {
-    "www.realestate.com.au": 2.5,
-    "realestate.com.au":     2.5,
-    "www.domain.com.au":     2.5,
-    "domain.com.au":         2.5,
-}
+HTTP_MAX_CONNECTIONS  = int(getattr(config, "HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE    = int(getattr(config, "HTTP_MAX_KEEPALIVE", 20))
+HTTP_KEEPALIVE_EXPIRY = float(getattr(config, "HTTP_KEEPALIVE_EXPIRY", 30))
+HTTP_MAX_PER_HOST     = int(getattr(config, "HTTP_MAX_PER_HOST", 6))
+HTTP_HTTP2            = bool(getattr(config, "HTTP_HTTP2", True))
+HTTP_UPSTREAM_OVERRIDE = getattr(config, "HTTP_UPSTREAM_OVERRIDE", "")  # bench: mọi request -> server này
 # -----------------------------------------------------------------------------
 
+class _UpstreamOverride(httpx.AsyncBaseTransport):
+    """Gửi mọi request tới HTTP_UPSTREAM_OVERRIDE, host gốc nằm ở header X-Upstream-Host.
+
+    URL phía trên (limiter theo host, page cache, log) vẫn là URL thật.
+    """
+
+    def __init__(self, base: str, inner: httpx.AsyncBaseTransport):
+        self.base = httpx.URL(base)
+        self.inner = inner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.headers["X-Upstream-Host"] = request.url.host
+        request.url = request.url.copy_with(scheme=self.base.scheme, host=self.base.host, port=self.base.port)
+        return await self.inner.handle_async_request(request)
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+def _build_client() -> httpx.AsyncClient:
+    proxies = None
+    if getattr(config, "PROXY_URL", ""):
+        proxies = {"http://": config.PROXY_URL, "https://": config.PROXY_URL}
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    transport = None
+    if HTTP_UPSTREAM_OVERRIDE:
+        transport = _UpstreamOverride(HTTP_UPSTREAM_OVERRIDE, httpx.AsyncHTTPTransport(limits=limits))
+        proxies = None
+
+    # QUAN TRỌNG: dùng 1 con số cho timeout (tránh lỗi thiếu 'pool')
+    return httpx.AsyncClient(
+        timeout=HTTP_TIMEOUT_S,
+        follow_redirects=True,
+        http2=HTTP_HTTP2,
+        limits=limits,
+        transport=transport,
+        headers={
+            "User-Agent": config.USER_AGENT,
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+            "Accept-Language": "en-US,en;q=0.9",
+            "Cache-Control": "no-cache",
+        },
+        # cookie jar chuẩn RFC: cookie của host nào chỉ gửi lại cho host đó
+        cookies=httpx.Cookies(),
+        proxies=proxies,
+    )
+
+
+# ---- Client dùng chung toàn process (mở/đóng trong lifespan của FastAPI) -----
+_shared: httpx.AsyncClient | None = None
+# host -> giới hạn kết nối đồng thời; Semaphore gắn với event loop nên sống/chết cùng client chung
+_host_slots: dict[str, asyncio.Semaphore] = {}
+
+
+async def open_shared_client() -> httpx.AsyncClient:
+    global _shared
+    if _shared is None or _shared.is_closed:
+        _shared = _build_client()
+        _host_slots.clear()
+    return _shared
+
+
+async def close_shared_client():
+    global _shared
+    if _shared is not None:
+        await _shared.aclose()
+        _shared = None
+    _host_slots.clear()
+
+
+def shared_client() -> httpx.AsyncClient | None:
+    return _shared if (_shared is not None and not _shared.is_closed) else None
+# -----------------------------------------------------------------------------
+
+
 class Http:
-    """HTTP client có retry + backoff + rate-gap theo host."""
-    _last_hit: dict[str, float] = {}  # host -> last monotonic time
+    """HTTP client có retry + backoff + token bucket theo host (app.utils.ratelimit).
 
+    Mặc định dùng lại client chung của process (giữ connection pool, HTTP/2 và
+    cookie giữa các request); nếu chưa mở client chung (script, CLI) thì tự tạo
+    client riêng và `close()` sẽ đóng nó.
+    """
     def __init__(self):
-        proxies = None
-        if getattr(config, "PROXY_URL", ""):
-            proxies = {"http": config.PROXY_URL, "https": config.PROXY_URL}
-
-        self.cookies = httpx.Cookies()
-        # QUAN TRỌNG: dùng 1 con số cho timeout (tránh lỗi thiếu 'pool')
-        self.client = httpx.AsyncClient(
-            timeout=HTTP_TIMEOUT_S,
-            follow_redirects=True,
-            http2=True,
-            headers={
-                "User-Agent": config.USER_AGENT,
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-                "Accept-Language": "en-US,en;q=0.9",
-                "Cache-Control": "no-cache",
-            },
-            cookies=self.cookies,
-            proxies=proxies,
-        )
-
-    async def _respect_rate_gap(self, host: str):
-        gap = _RATE_GAP_BY_HOST.get(host, HTTP_RATE_GAP_DEFAULT)
-        now = time.monotonic()
-        last = self._last_hit.get(host, 0.0)
-        wait = (last + gap) - now
-        if wait > 0:
-            await asyncio.sleep(wait)
-        self._last_hit[host] = time.monotonic()
-
-    async def _get(self, url: str, *, referer: str | None = None) -> httpx.Response:
-        headers = {}
+        shared = shared_client()
+        self._owned = shared is None
+        self.client = _build_client() if shared is None else shared
+        self.cookies = self.client.cookies
+        # client riêng (script, CLI): slot riêng, không dính vào dict của client chung
+        self._host_slots = _host_slots if shared is not None else {}
+
+    def _slot(self, host: str) -> asyncio.Semaphore:
+        sem = self._host_slots.get(host)
+        if sem is None:
+            sem = self._host_slots[host] = asyncio.Semaphore(HTTP_MAX_PER_HOST)
+        return sem
+
+    async def _get(self, url: str, *, referer: str | None = None, headers: dict | None = None,
+                   params: dict | None = None) -> httpx.Response:
+        headers = dict(headers or {})
         if referer:
             headers["Referer"] = referer
         # thỉnh thoảng đổi Accept-Language cho “giống người”
         if random.random() < 0.25:
             headers["Accept-Language"] = random.choice(["en-US,en;q=0.9", "en-AU,en;q=0.9"])
-        return await self.client.get(url, headers=headers)
+        async with self._slot(urlparse(url).netloc.lower()):
+            return await self.client.get(url, headers=headers, params=params)
 
-    async def get_text(self, url: str, *, max_retries: int | None = None, referer: str | None = None) -> str:
+    async def _fetch(self, url: str, *, max_retries: int | None = None, referer: str | None = None,
+                     headers: dict | None = None, params: dict | None = None) -> httpx.Response:
         host = urlparse(url).netloc.lower()
-        await self._respect_rate_gap(host)
-
         retries = HTTP_MAX_RETRIES if max_retries is None else max_retries
         attempt = 0
         last_exc: Exception | None = None
 
         while attempt <= retries:
+            # mỗi lần thử đều phải xin token -> retry cũng tính vào quota của host
+            await limiter.acquire(host)
             try:
-                r = await self._get(url, referer=referer)
-
-                # 429/403/503 -> backoff và thử lại
+                t0 = time.perf_counter()
+                try:
+                    r = await self._get(url, referer=referer, headers=headers, params=params)
+                except Exception as e:
+                    UPSTREAM_FETCH_SECONDS.observe(time.perf_counter() - t0, host=host, status=type(e).__name__)
+                    raise
+                UPSTREAM_FETCH_SECONDS.observe(time.perf_counter() - t0, host=host, status=r.status_code)
+
+                # 429/403/503 -> báo limiter giảm tốc rồi thử lại (limiter tự chờ Retry-After/backoff)
                 if r.status_code in (429, 403, 503):
-                    ra = r.headers.get("Retry-After")
-                    sleep_s = float(ra) if (ra and ra.isdigit()) else (HTTP_BACKOFF_BASE ** attempt) + random.uniform(0, 0.5)
-                    await asyncio.sleep(sleep_s)
+                    ra = parse_retry_after(r.headers.get("Retry-After"))
+                    await limiter.penalize(host, ra if ra is not None else (HTTP_BACKOFF_BASE ** attempt) + random.uniform(0, 0.5))
+                    log("upstream_throttled", logging.WARNING, host=host, status=r.status_code, attempt=attempt,
+                        retry_after=ra)
+                    last_exc = httpx.HTTPStatusError(f"{r.status_code} from {host}", request=r.request, response=r)
                     attempt += 1
                     continue
 
-                r.raise_for_status()
-                return r.text
+                if r.status_code != 304:  # 304 = GET có điều kiện, để caller xử lý
+                    r.raise_for_status()
+                await limiter.reward(host)
+                UPSTREAM_RETRIES.observe(attempt, host=host)
+                return r
 
             except (httpx.ReadTimeout, httpx.ConnectTimeout, httpx.RemoteProtocolError) as e:
                 last_exc = e
@@ -91,43 +172,56 @@ class Http:
                 continue
             except httpx.HTTPStatusError as e:
                 last_exc = e
+                UPSTREAM_RETRIES.observe(attempt, host=host)
                 # các mã “mềm” đã xử lý ở trên; còn lại ném ra luôn
                 raise
 
+        UPSTREAM_RETRIES.observe(attempt, host=host)
+        log("upstream_failed", logging.WARNING, host=host, attempts=attempt, error=repr(last_exc))
         raise last_exc or RuntimeError("Upstream failed after retries")
 
-    async def get_bytes(self, url: str, *, max_retries: int | None = None, referer: str | None = None) -> bytes:
-        host = urlparse(url).netloc.lower()
-        await self._respect_rate_gap(host)
-
-        retries = HTTP_MAX_RETRIES if max_retries is None else max_retries
-        attempt = 0
-        last_exc: Exception | None = None
-
-        while attempt <= retries:
-            try:
-                r = await self._get(url, referer=referer)
-
-                if r.status_code in (429, 403, 503):
-                    ra = r.headers.get("Retry-After")
-                    sleep_s = float(ra) if (ra and ra.isdigit()) else (HTTP_BACKOFF_BASE ** attempt) + random.uniform(0, 0.5)
-                    await asyncio.sleep(sleep_s)
-                    attempt += 1
-                    continue
-
-                r.raise_for_status()
-                return r.content
+    async def get_page(self, url: str, *, max_retries: int | None = None, referer: str | None = None) -> Page:
+        """GET HTML qua page cache: còn tươi -> trả luôn; hết hạn -> If-None-Match/If-Modified-Since."""
+        if page_cache is None:
+            r = await self._fetch(url, max_retries=max_retries, referer=referer)
+            PAGE_CACHE_RESULTS.inc(result="bypass")
+            return Page(url, r.content, r.encoding, "bypass")
+
+        entry, body, fresh = await asyncio.to_thread(page_cache.lookup, url)
+        if entry is not None and fresh:
+            page_cache.hits += 1
+            PAGE_CACHE_RESULTS.inc(result="hit")
+            await asyncio.to_thread(page_cache.touch, url, validated=False)
+            return Page(url, body, entry.encoding, "hit")
+
+        validators = {}
+        if entry is not None:
+            if entry.etag:
+                validators["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                validators["If-Modified-Since"] = entry.last_modified
+        r = await self._fetch(url, max_retries=max_retries, referer=referer, headers=validators)
+
+        if r.status_code == 304 and entry is not None:
+            page_cache.revalidated += 1
+            PAGE_CACHE_RESULTS.inc(result="revalidated")
+            await asyncio.to_thread(page_cache.touch, url, validated=True)
+            return Page(url, body, entry.encoding, "revalidated")
+
+        page_cache.misses += 1
+        PAGE_CACHE_RESULTS.inc(result="miss")
+        await asyncio.to_thread(
+            page_cache.store, url, r.content,
+            encoding=r.encoding, etag=r.headers.get("ETag"), last_modified=r.headers.get("Last-Modified"),
+        )
+        return Page(url, r.content, r.encoding, "miss")
 
-            except (httpx.ReadTimeout, httpx.ConnectTimeout, httpx.RemoteProtocolError) as e:
-                last_exc = e
-                await asyncio.sleep((HTTP_BACKOFF_BASE ** attempt) + random.uniform(0, 0.5))
-                attempt += 1
-                continue
-            except httpx.HTTPStatusError as e:
-                last_exc = e
-                raise
+    async def get_text(self, url: str, *, max_retries: int | None = None, referer: str | None = None) -> str:
+        return (await self.get_page(url, max_retries=max_retries, referer=referer)).text
 
-        raise last_exc or RuntimeError("Upstream failed after retries")
+    async def get_bytes(self, url: str, *, max_retries: int | None = None, referer: str | None = None) -> bytes:
+        return (await self._fetch(url, max_retries=max_retries, referer=referer)).content
 
     async def close(self):
-        await self.client.aclose()
+        if self._owned:
+            await self.client.aclose()
@@ -0,0 +1,270 @@
+# app/utils/metrics.py
+"""Histogram/counter kiểu Prometheus (không phụ thuộc thư viện ngoài) + log có trace id.
+
+- `observe` chỉ là bisect + vài phép cộng dưới 1 lock: để bật thường trực trên production.
+- `/metrics` gọi `render()` ra text exposition format 0.0.4.
+- `log(event, **fields)`: dòng text hoặc JSON (LOG_FORMAT=json), tự gắn trace id của request.
+- Thời gian mỗi stage cũng được cộng vào request hiện tại (contextvar) để log cuối request
+  cho biết request đó tốn vào đâu.
+"""
+import contextvars, json, logging, sys, threading, time, uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Sequence, Tuple
+from app import config
+
+# ---- Config ------------------------------------------------------------------
+METRICS_ENABLED = bool(getattr(config, "METRICS_ENABLED", True))
+LOG_FORMAT      = getattr(config, "LOG_FORMAT", "text")   # text | json
+LOG_LEVEL       = getattr(config, "LOG_LEVEL", "INFO")
+# -----------------------------------------------------------------------------
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS   = (0, 1, 2, 3, 4, 5, 8, 16, 32, 64, 128)
+
+trace_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("trace_id", default=None)
+# stage -> [số lần, tổng giây] của request hiện tại (dict dùng chung cho mọi task con của request)
+_request_stages: contextvars.ContextVar[Optional[Dict[str, list]]] = contextvars.ContextVar("request_stages", default=None)
+
+_registry: Dict[str, "_Metric"] = {}
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_num(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def _key(self, labels: dict) -> Tuple:
+        return tuple(labels.get(n, "") for n in self.labels)
+
+    def render(self) -> str:
+        return f"# HELP {self.name} {self.help}\n# TYPE {self.name} {self.kind}\n" + self._samples()
+
+    def _samples(self) -> str:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> str:
+        with self._lock:
+            items = list(self._values.items())
+        return "".join(f"{self.name}{_fmt_labels(self.labels, k)} {_fmt_num(v)}\n" for k, v in items)
+
+
+class Gauge(_Metric):
+    """Giá trị đọc lúc scrape qua callback (độ sâu hàng đợi, số task đang chạy...)."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float]):
+        super().__init__(name, help)
+        self.fn = fn
+
+    def _samples(self) -> str:
+        try:
+            return f"{self.name} {_fmt_num(self.fn())}\n"
+        except Exception:
+            return ""
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS,
+                 stage: Optional[str] = None):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.stage = stage  # tên stage cộng vào log cuối request (None = không cộng)
+        self._series: Dict[Tuple, list] = {}  # key -> [counts theo bucket..., +Inf], sum, count
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+        if self.stage is not None:
+            # observe trong thread pool: chỉ thấy stage của request nếu được submit qua copy_context().run
+            stages = _request_stages.get()
+            if stages is not None:
+                with self._lock:  # nhiều thread decode của cùng 1 request cộng vào cùng dict
+                    acc = stages.setdefault(self.stage, [0, 0.0])
+                    acc[0] += 1
+                    acc[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def _samples(self) -> str:
+        with self._lock:
+            items = [(k, list(s[0]), s[1], s[2]) for k, s in self._series.items()]
+        les = ['le="%s"' % _fmt_num(b) for b in self.buckets] + ['le="+Inf"']
+        out = []
+        for key, counts, total, n in items:
+            cum = 0
+            for le, c in zip(les, counts):  # bucket cuối là +Inf: cum == n
+                cum += c
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, le)} {cum}\n")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {total!r}\n")
+            out.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {n}\n")
+        return "".join(out)
+
+
+def render() -> str:
+    return "".join(m.render() for m in list(_registry.values()))
+
+
+# ---- Các metric hot path --------------------------------------------------------
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "API request latency", ("route", "method", "status"))
+SEARCH_QUERY_SECONDS = Histogram("search_query_duration_seconds", "One upstream search query (DDG API or HTML)",
+                                 ("backend", "outcome"), stage="search")
+SEARCH_UPSTREAM_CALLS = Histogram("search_upstream_calls", "Upstream search calls per address (cache miss)",
+                                  buckets=COUNT_BUCKETS)
+RATELIMIT_WAIT_SECONDS = Histogram("ratelimit_wait_seconds", "Time spent waiting for a host token",
+                                   ("host",), stage="ratelimit_wait")
+UPSTREAM_FETCH_SECONDS = Histogram("upstream_fetch_duration_seconds", "One upstream HTTP attempt",
+                                   ("host", "status"), stage="fetch")
+UPSTREAM_RETRIES = Histogram("upstream_fetch_retries", "Retries needed per upstream fetch", ("host",),
+                             buckets=COUNT_BUCKETS)
+PAGE_CACHE_RESULTS = Counter("page_cache_results_total", "Page cache outcome per listing page", ("result",))
+PARSE_SECONDS = Histogram("parse_duration_seconds", "HTML -> PropertyItem in the parse executor",
+                          ("source",), stage="parse")
+PARSE_QUEUE_SECONDS = Histogram("parse_queue_wait_seconds", "Wait for a parse executor slot", stage="parse_wait")
+CLIP_PREPROCESS_SECONDS = Histogram("clip_preprocess_duration_seconds", "Image decode + resize + normalize",
+                                    stage="preprocess")
+CLIP_QUEUE_SECONDS = Histogram("clip_queue_wait_seconds", "Image wait in the CLIP micro-batcher queue")
+CLIP_FORWARD_SECONDS = Histogram("clip_forward_duration_seconds", "CLIP image forward pass per batch")
+CLIP_BATCH_SIZE = Histogram("clip_batch_size", "Images per CLIP forward pass", buckets=COUNT_BUCKETS)
+
+
+# ---- Log + trace id ------------------------------------------------------------
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        out = {"ts": round(record.created, 3), "level": record.levelname, "event": record.getMessage()}
+        out.update(getattr(record, "fields", {}))
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, "fields", {})
+        tail = " ".join(f"{k}={v}" for k, v in fields.items())
+        return f"[{record.getMessage()}] {tail}" if tail else f"[{record.getMessage()}]"
+
+
+logger = logging.getLogger("realestate")
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(_JsonFormatter() if LOG_FORMAT == "json" else _TextFormatter())
+    logger.addHandler(_handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+
+def log(event: str, level: int = logging.INFO, **fields):
+    if not logger.isEnabledFor(level):
+        return
+    tid = trace_id.get()
+    if tid is not None:
+        fields = {"trace_id": tid, **fields}
+    logger.log(level, event, extra={"fields": fields})
+
+
+def begin_request(tid: str) -> Tuple[contextvars.Token, contextvars.Token]:
+    return trace_id.set(tid), _request_stages.set({})
+
+
+def request_stages() -> Dict[str, dict]:
+    """Tổng thời gian từng stage của request hiện tại: {stage: {"n": .., "ms": ..}}."""
+    stages = _request_stages.get() or {}
+    return {k: {"n": n, "ms": round(1000 * s, 2)} for k, (n, s) in stages.items()}
+
+
+def end_request(tokens: Tuple[contextvars.Token, contextvars.Token]):
+    trace_id.reset(tokens[0])
+    _request_stages.reset(tokens[1])
+
+
+class TraceMiddleware:
+    """ASGI middleware: trace id (nhận X-Request-ID hoặc tự sinh, trả lại ở header), histogram
+    latency theo route, và (LOG_REQUESTS) 1 dòng log cuối request kèm thời gian từng stage.
+
+    ASGI thuần thay vì BaseHTTPMiddleware: không bọc thêm task, và đo được cả response stream.
+    """
+
+    def __init__(self, app, log_requests: bool = bool(getattr(config, "LOG_REQUESTS", False))):
+        self.app = app
+        self.log_requests = log_requests
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        tid = None
+        for k, v in scope.get("headers", ()):
+            if k == b"x-request-id":
+                tid = v.decode("latin-1")[:64]
+                break
+        tid = tid or uuid.uuid4().hex[:16]
+        tokens = begin_request(tid)
+        status = 500
+        t0 = time.perf_counter()
+
+        async def _send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", tid.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            dt = time.perf_counter() - t0
+            route = getattr(scope.get("route"), "path", None) or "unmatched"  # template, không phải path thật
+            REQUEST_SECONDS.observe(dt, route=route, method=scope["method"], status=status)
+            if self.log_requests:
+                log("request", method=scope["method"], path=scope["path"], route=route, status=status,
+                    ms=round(1000 * dt, 1), stages=request_stages())
+            end_request(tokens)
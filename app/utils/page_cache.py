@@ -0,0 +1,162 @@
+# app/utils/page_cache.py
+import hashlib, os, sqlite3, threading, time, zlib
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlparse
+from app import config
+
+# ---- Config ------------------------------------------------------------------
+PAGE_CACHE_DIR       = getattr(config, "PAGE_CACHE_DIR", "")         # "" -> tắt cache
+PAGE_CACHE_FRESH_S   = float(getattr(config, "PAGE_CACHE_FRESH_S", 3600))
+PAGE_CACHE_MAX_BYTES = int(getattr(config, "PAGE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# host (bỏ "www.") -> số giây coi là còn tươi, không cần revalidate
+PAGE_CACHE_FRESH_BY_HOST: dict[str, float] = dict(getattr(config, "PAGE_CACHE_FRESH_BY_HOST", {}))
+# -----------------------------------------------------------------------------
+
+
+@dataclass
+class Page:
+    """Body trang + trạng thái cache: "hit" | "revalidated" | "miss" | "bypass"."""
+    url: str
+    content: bytes
+    encoding: Optional[str] = None
+    cache: str = "bypass"
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+
+@dataclass
+class _Entry:
+    file: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    encoding: Optional[str]
+    validated_at: float
+    size: int
+
+
+def _fresh_for(url: str) -> float:
+    host = urlparse(url).netloc.lower()
+    host = host[4:] if host.startswith("www.") else host
+    return PAGE_CACHE_FRESH_BY_HOST.get(host, PAGE_CACHE_FRESH_S)
+
+
+class PageCache:
+    """Cache HTML trên đĩa (nén zlib) theo URL, giữ ETag/Last-Modified để GET có điều kiện.
+
+    Index là SQLite; mọi method đều blocking -> gọi qua asyncio.to_thread. Thư mục và connection
+    mở lười theo pid ở lần dùng đầu (import module không đụng đĩa, không dùng lại connection qua fork).
+    """
+
+    def __init__(self, root: str, max_bytes: int = PAGE_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._pid = 0
+        self.hits = self.revalidated = self.misses = self.evictions = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        """Gọi khi đang giữ self._lock."""
+        if self._pid != os.getpid():
+            os.makedirs(self.root, exist_ok=True)
+            db = sqlite3.connect(os.path.join(self.root, "index.sqlite3"), check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                " url TEXT PRIMARY KEY, file TEXT NOT NULL, etag TEXT, last_modified TEXT, encoding TEXT,"
+                " validated_at REAL NOT NULL, last_access REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS pages_access ON pages(last_access)")
+            db.commit()
+            self._db, self._pid = db, os.getpid()
+        return self._db
+
+    def _path(self, file: str) -> str:
+        return os.path.join(self.root, file[:2], file)
+
+    def lookup(self, url: str) -> tuple[Optional[_Entry], Optional[bytes], bool]:
+        """-> (entry, body đã giải nén, còn tươi?)"""
+        with self._lock:
+            row = self._conn().execute(
+                "SELECT file, etag, last_modified, encoding, validated_at, size FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None, None, False
+        entry = _Entry(*row)
+        try:
+            with open(self._path(entry.file), "rb") as f:
+                body = zlib.decompress(f.read())
+        except (OSError, zlib.error):
+            return None, None, False
+        fresh = (time.time() - entry.validated_at) < _fresh_for(url)
+        return entry, body, fresh
+
+    def touch(self, url: str, *, validated: bool):
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            if validated:
+                db.execute("UPDATE pages SET validated_at = ?, last_access = ? WHERE url = ?", (now, now, url))
+            else:
+                db.execute("UPDATE pages SET last_access = ? WHERE url = ?", (now, url))
+            db.commit()
+
+    def store(self, url: str, body: bytes, *, encoding: Optional[str], etag: Optional[str], last_modified: Optional[str]):
+        file = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        path = self._path(file)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        blob = zlib.compress(body, 6)
+        tmp = f"{path}.tmp{threading.get_ident()}"
+        with open(tmp, "wb") as f:
+            f.write(blob)
+        os.replace(tmp, path)
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            db.execute(
+                "INSERT OR REPLACE INTO pages (url, file, etag, last_modified, encoding, validated_at, last_access, size)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, file, etag, last_modified, encoding, now, now, len(blob)),
+            )
+            db.commit()
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            db = self._conn()
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            victims = []
+            for url, file, size in db.execute("SELECT url, file, size FROM pages ORDER BY last_access"):
+                if total <= self.max_bytes:
+                    break
+                victims.append((url, file))
+                total -= size
+            db.executemany("DELETE FROM pages WHERE url = ?", [(u,) for u, _ in victims])
+            db.commit()
+        for _, file in victims:
+            try:
+                os.remove(self._path(file))
+            except OSError:
+                pass
+        self.evictions += len(victims)
+
+    def stats(self) -> dict:
+        with self._lock:
+            n, size = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages").fetchone()
+        return {
+            "entries": n,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+page_cache: Optional[PageCache] = PageCache(PAGE_CACHE_DIR) if PAGE_CACHE_DIR else None  # mở đĩa ở lần dùng đầu
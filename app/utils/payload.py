@@ -0,0 +1,95 @@
+# app/utils/payload.py
+"""Serialize response nhanh: JSON qua orjson, chiếu field (`fields=`) cho PropertyItem, vector float16.
+
+- `FastJSONResponse`: orjson ghi thẳng ndarray / numpy scalar, không qua jsonable_encoder hay .tolist().
+- `parse_fields` + `dump_items`: chỉ serialize các field cần (bỏ `raw`, `description`...), bằng pydantic
+  dump_json (Rust) thẳng ra bytes.
+- `pack_vectors`: ma trận (N, dim) float16 little-endian cho /embed dạng binary / base64.
+"""
+import json
+from typing import Any, Iterable, List, Optional, Tuple
+import numpy as np
+from pydantic import TypeAdapter
+from starlette.responses import JSONResponse
+from app.schemas import PropertyItem
+
+try:
+    import orjson  # nhanh hơn json chuẩn nhiều lần, ghi được ndarray
+except ImportError:  # pragma: no cover
+    orjson = None
+
+LISTING_FIELDS = tuple(PropertyItem.model_fields)
+# preset: "lean" = bỏ 2 field nặng nhất (JSON-LD gốc + mô tả dài)
+FIELD_PRESETS = {"lean": "-raw,-description"}
+VECTOR_DTYPE = "<f2"  # float16 little-endian
+
+_items_adapter = TypeAdapter(List[PropertyItem])
+
+
+def _default(o: Any):
+    if isinstance(o, np.ndarray):
+        return o.tolist()
+    if isinstance(o, np.generic):
+        return o.item()
+    raise TypeError(f"not JSON serializable: {type(o).__name__}")
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, default=_default).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse dùng orjson; trả thẳng instance từ endpoint để FastAPI bỏ qua jsonable_encoder."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+Projection = Tuple[Optional[set], Optional[set]]  # (include, exclude)
+
+
+def parse_fields(spec: Optional[str]) -> Projection:
+    """"url,price,images" -> chỉ các field đó; "-raw,-description" hoặc "lean" -> bỏ các field đó.
+
+    Field lạ -> ValueError (endpoint trả 400).
+    """
+    if not spec:
+        return None, None
+    names = [s.strip() for part in spec.split(",") for s in FIELD_PRESETS.get(part.strip(), part).split(",")]
+    names = [s for s in names if s]
+    drop = {s[1:] for s in names if s.startswith("-")}
+    keep = {s for s in names if not s.startswith("-")}
+    unknown = (drop | keep) - set(LISTING_FIELDS)
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(sorted(unknown))} (có: {', '.join(LISTING_FIELDS)})")
+    if keep and drop:
+        raise ValueError("fields: dùng danh sách field cần giữ hoặc danh sách '-field' cần bỏ, không trộn")
+    return keep or None, drop or None
+
+
+def dump_item(item: PropertyItem, proj: Projection = (None, None)) -> dict:
+    include, exclude = proj
+    return item.model_dump(include=include, exclude=exclude)
+
+
+def dump_items(items: Iterable[PropertyItem], proj: Projection = (None, None)) -> bytes:
+    """List PropertyItem -> JSON bytes, chỉ các field trong projection."""
+    include, exclude = proj
+    return _items_adapter.dump_json(list(items), include={"__all__": include} if include else None,
+                                    exclude={"__all__": exclude} if exclude else None)
+
+
+def dump_one(item: PropertyItem, proj: Projection = (None, None)) -> bytes:
+    include, exclude = proj
+    return item.model_dump_json(include=include, exclude=exclude)
+
+
+def pack_vectors(vectors: List[Optional[np.ndarray]], dim: int) -> np.ndarray:
+    """(N, dim) float16 little-endian; ảnh lỗi -> dòng 0 (xem danh sách lỗi đi kèm)."""
+    out = np.zeros((len(vectors), dim), dtype=VECTOR_DTYPE)
+    for i, v in enumerate(vectors):
+        if v is not None:
+            out[i] = v
+    return out
@@ -0,0 +1,288 @@
+# app/utils/ratelimit.py
+import asyncio, os, sqlite3, threading, time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from app import config
+from app.utils.metrics import RATELIMIT_WAIT_SECONDS
+
+# ---- Config ------------------------------------------------------------------
+RATE_DEFAULT      = float(getattr(config, "HTTP_RATE_DEFAULT", 0.66))  # token/giây
+BURST_DEFAULT     = float(getattr(config, "HTTP_RATE_BURST", 2))
+RATE_MIN_FACTOR   = float(getattr(config, "HTTP_RATE_MIN_FACTOR", 0.1))  # sàn khi bị phạt
+RATE_DECREASE     = 0.5    # 429/403/503 -> giảm một nửa tốc độ
+RATE_INCREASE     = 0.05   # mỗi lần thành công -> tăng lại 5% tốc độ gốc
+RATELIMIT_BACKEND = getattr(config, "RATELIMIT_BACKEND", "memory")  # memory | sqlite (chung mọi worker)
+RATELIMIT_DB_PATH = os.path.join(getattr(config, "SHARED_STATE_DIR", ".cache/shared"), "ratelimit.sqlite3")
+
+# host (bỏ "www.") -> (rate token/giây, burst)
+_HOST_RATES: dict[str, tuple[float, float]] = {
+    "realestate.com.au": (0.4, 2),
+    "domain.com.au":     (0.4, 2),
+    "duckduckgo.com":    (1 / max(float(getattr(config, "SEARCH_MIN_GAP", 0.6)), 0.01), 2),
+}
+_HOST_RATES.update(dict(getattr(config, "HTTP_RATE_BY_HOST", {})))  # HTTP_RATE_BY_HOST ghi đè
+# -----------------------------------------------------------------------------
+
+
+def _norm_host(host: str) -> str:
+    host = (host or "").lower().split(":", 1)[0]
+    return host[4:] if host.startswith("www.") else host
+
+
+def _rate_for(host: str) -> tuple[float, float]:
+    # khớp cả subdomain: html.duckduckgo.com -> duckduckgo.com
+    parts = host.split(".")
+    for i in range(len(parts) - 1):
+        hit = _HOST_RATES.get(".".join(parts[i:]))
+        if hit:
+            return hit
+    return RATE_DEFAULT, BURST_DEFAULT
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Retry-After dạng số giây hoặc HTTP-date -> số giây (None nếu không đọc được)."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except Exception:
+        return None
+
+
+class HostBucket:
+    """Token bucket cho 1 host, phục vụ FIFO và tự giảm tốc khi upstream kêu quá tải."""
+
+    def __init__(self, host: str, rate: float, burst: float):
+        self.host = host
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        # asyncio.Lock trao quyền theo thứ tự đến -> hàng đợi công bằng giữa các caller
+        self._lock = asyncio.Lock()
+        self.waiting = 0
+        self.served = 0
+        self.penalties = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    async def _take(self) -> float:
+        """Lấy 1 token nếu được (-> 0), không thì trả số giây cần chờ."""
+        now = time.monotonic()
+        self._refill(now)
+        delay = self.blocked_until - now
+        if delay <= 0:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            delay = (1 - self.tokens) / self.rate
+        return delay
+
+    async def acquire(self) -> float:
+        """Chờ tới lượt và lấy 1 token; trả về số giây đã chờ."""
+        t0 = time.monotonic()
+        self.waiting += 1
+        try:
+            async with self._lock:
+                while True:
+                    delay = await self._take()
+                    if delay <= 0:
+                        break
+                    await asyncio.sleep(delay)
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - t0
+        RATELIMIT_WAIT_SECONDS.observe(waited, host=self.host)
+        self.served += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        return waited
+
+    async def penalize(self, retry_after: float | None = None):
+        """Upstream trả 429/403/503: giảm tốc độ, chặn tới hết Retry-After rồi chỉ cho 1 request thăm dò.
+
+        `updated = blocked_until`: không nạp token trong lúc bị chặn, nên hết chặn chỉ còn đúng 1 token
+        (không dồn burst), sau đó nạp lại theo rate đã giảm. SharedState.penalize làm y hệt.
+        """
+        now = time.monotonic()
+        self.penalties += 1
+        self.rate = max(self.base_rate * RATE_MIN_FACTOR, self.rate * RATE_DECREASE)
+        pause = retry_after if retry_after is not None else 1.0 / self.rate
+        self.blocked_until = max(self.blocked_until, now + pause)
+        self.tokens = 1.0
+        self.updated = self.blocked_until
+
+    async def reward(self):
+        if self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate + self.base_rate * RATE_INCREASE)
+
+    def stats(self) -> dict:
+        return {
+            "rate": round(self.rate, 4),
+            "base_rate": self.base_rate,
+            "burst": self.burst,
+            "tokens": round(min(self.burst, self.tokens + max(time.monotonic() - self.updated, 0.0) * self.rate), 3),
+            "queue_depth": self.waiting,
+            "served": self.served,
+            "penalties": self.penalties,
+            "avg_wait_s": round(self.total_wait / self.served, 4) if self.served else 0.0,
+            "max_wait_s": round(self.max_wait, 4),
+            "blocked_for_s": round(max(self.blocked_until - time.monotonic(), 0.0), 3),
+        }
+
+
+class SharedState:
+    """tokens/rate/blocked_until của mọi host trong 1 file SQLite (WAL), dùng chung giữa các worker.
+
+    Mỗi thao tác là 1 transaction IMMEDIATE ngắn nên các process không giẫm lên nhau. Thời gian
+    dùng time.time() (monotonic của từng process không so được với nhau sau restart). Connection
+    mở lười theo pid: không bao giờ dùng lại connection SQLite qua fork. Method đều blocking.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._pid = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=OFF")  # mất trạng thái bucket khi crash cũng không sao
+            db.execute("CREATE TABLE IF NOT EXISTS buckets (host TEXT PRIMARY KEY, tokens REAL NOT NULL,"
+                       " updated REAL NOT NULL, rate REAL NOT NULL, blocked_until REAL NOT NULL)")
+            self._db, self._pid = db, os.getpid()
+        return self._db
+
+    def _update(self, host: str, base_rate: float, burst: float, fn) -> tuple:
+        with self._lock:
+            db = self._conn()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute("SELECT tokens, updated, rate, blocked_until FROM buckets WHERE host = ?",
+                                 (host,)).fetchone()
+                now = time.time()
+                tokens, updated, rate, blocked = row if row else (burst, now, base_rate, 0.0)
+                rate = min(rate, base_rate)  # base rate có thể đã bị hạ trong config
+                if now > updated:
+                    tokens, updated = min(burst, tokens + (now - updated) * rate), now
+                result, (tokens, updated, rate, blocked) = fn(now, tokens, updated, rate, blocked)
+                db.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?, ?)",
+                           (host, tokens, updated, rate, blocked))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return result, rate
+
+    def take(self, host: str, base_rate: float, burst: float) -> tuple[float, float]:
+        """-> (giây cần chờ, 0 = đã lấy token; rate hiện tại)."""
+        def fn(now, tokens, updated, rate, blocked):
+            if blocked > now:
+                return blocked - now, (tokens, updated, rate, blocked)
+            if tokens >= 1:
+                return 0.0, (tokens - 1, updated, rate, blocked)
+            return (1 - tokens) / rate, (tokens, updated, rate, blocked)
+        return self._update(host, base_rate, burst, fn)
+
+    def penalize(self, host: str, base_rate: float, burst: float, retry_after: float | None) -> float:
+        def fn(now, tokens, updated, rate, blocked):
+            rate = max(base_rate * RATE_MIN_FACTOR, rate * RATE_DECREASE)
+            blocked = max(blocked, now + (retry_after if retry_after is not None else 1.0 / rate))
+            return None, (1.0, blocked, rate, blocked)
+        return self._update(host, base_rate, burst, fn)[1]
+
+    def reward(self, host: str, base_rate: float, burst: float) -> float:
+        def fn(now, tokens, updated, rate, blocked):
+            return None, (tokens, updated, min(base_rate, rate + base_rate * RATE_INCREASE), blocked)
+        return self._update(host, base_rate, burst, fn)[1]
+
+    def peek(self, host: str) -> Optional[tuple]:
+        with self._lock:
+            return self._conn().execute("SELECT tokens, updated, rate, blocked_until FROM buckets WHERE host = ?",
+                                        (host,)).fetchone()
+
+
+class SharedHostBucket(HostBucket):
+    """HostBucket có quota nằm trong SharedState: N worker cộng lại vẫn đúng rate của host.
+
+    Lock asyncio vẫn giữ thứ tự FIFO giữa các caller trong cùng worker; giữa các worker thì ai
+    tới lượt trước lấy trước. `self.rate` chỉ là bản sao đọc lần gần nhất (cho reward/stats).
+    """
+
+    def __init__(self, host: str, rate: float, burst: float, state: SharedState):
+        super().__init__(host, rate, burst)
+        self._state = state
+
+    async def _take(self) -> float:
+        delay, self.rate = await asyncio.to_thread(self._state.take, self.host, self.base_rate, self.burst)
+        return delay
+
+    # ghi SQLite (BEGIN IMMEDIATE, có thể chờ worker khác) -> chạy trong thread như _take, không chặn event loop
+    async def penalize(self, retry_after: float | None = None):
+        self.penalties += 1
+        self.rate = await asyncio.to_thread(self._state.penalize, self.host, self.base_rate, self.burst, retry_after)
+
+    async def reward(self):
+        if self.rate < self.base_rate:  # thường rate đã bằng gốc: khỏi ghi SQLite mỗi request
+            self.rate = await asyncio.to_thread(self._state.reward, self.host, self.base_rate, self.burst)
+
+    def stats(self) -> dict:
+        """Đọc SQLite: gọi qua HostLimiter.stats trong thread (xem /stats/ratelimit)."""
+        out = super().stats()
+        row = self._state.peek(self.host)
+        if row is not None:
+            tokens, updated, rate, blocked = row
+            now = time.time()
+            out.update(rate=round(rate, 4), tokens=round(min(self.burst, tokens + max(now - updated, 0.0) * rate), 3),
+                       blocked_for_s=round(max(blocked - now, 0.0), 3))
+        return {**out, "shared": True}
+
+
+class HostLimiter:
+    """Registry các HostBucket theo host (dùng chung toàn process; `state` -> chung mọi worker)."""
+
+    def __init__(self, state: Optional[SharedState] = None):
+        self._buckets: dict[str, HostBucket] = {}
+        self._state = state
+
+    def bucket(self, host: str) -> HostBucket:
+        host = _norm_host(host)
+        b = self._buckets.get(host)
+        if b is None:
+            rate, burst = _rate_for(host)
+            b = self._buckets[host] = (HostBucket(host, rate, burst) if self._state is None
+                                       else SharedHostBucket(host, rate, burst, self._state))
+        return b
+
+    async def acquire(self, host: str) -> float:
+        return await self.bucket(host).acquire()
+
+    async def penalize(self, host: str, retry_after: float | None = None):
+        await self.bucket(host).penalize(retry_after)
+
+    async def reward(self, host: str):
+        await self.bucket(host).reward()
+
+    @property
+    def waiting(self) -> int:
+        return sum(b.waiting for b in self._buckets.values())
+
+    def stats(self) -> dict:
+        return {h: b.stats() for h, b in sorted(self._buckets.items())}
+
+
+limiter = HostLimiter(SharedState(RATELIMIT_DB_PATH) if RATELIMIT_BACKEND == "sqlite" else None)
@@ -0,0 +1,20 @@
+# app/utils/workers.py
+"""Process hiện tại là worker nào khi chạy nhiều worker qua serve.py.
+
+serve.py đặt WORKER_ID/WORKERS vào môi trường của từng worker sau khi fork, nên phải đọc lúc gọi
+(app.config đã được import trong master, trước khi fork).
+"""
+import os
+
+
+def worker_id() -> int:
+    return int(os.environ.get("WORKER_ID", "0"))
+
+
+def worker_count() -> int:
+    return max(1, int(os.environ.get("WORKERS", "1")))
+
+
+def is_primary() -> bool:
+    """Worker 0 làm các việc chỉ nên chạy 1 nơi: chạy tiếp batch job dở, ghi photo index ra đĩa."""
+    return worker_id() == 0
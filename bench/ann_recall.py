@@ -0,0 +1,100 @@
+"""Recall@k + QPS của IVF-PQ (app/ann.py) so với quét toàn bộ (exact).
+
+    python -m bench.ann_recall --n 200000 --sweep 4:0,8:50,16:100,32:200
+    python -m bench.ann_recall --vectors .cache/photo-index/vectors.npy --queries 500
+
+Không có --vectors thì sinh vector giả có cụm (gần phân bố embedding CLIP hơn
+nhiễu đều). Truy vấn là vector trong tập + nhiễu nhỏ, nên exact top-1 có nghĩa.
+"""
+import argparse, json, os, sys, time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.ann import IVFPQIndex  # noqa: E402
+
+
+def _open_vectors(path: str, dim: int) -> np.ndarray:
+    """Mở file vector dạng memmap: .npy (vd. photo index) hoặc raw float16 (.f16, embed cache)."""
+    if path.endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+    rows = os.path.getsize(path) // (2 * dim)
+    return np.memmap(path, dtype=np.float16, mode="r", shape=(rows, dim))
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def _synthetic(n: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    x = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return _normalize(x).astype(np.float16)
+
+
+def _exact(x: np.ndarray, q: np.ndarray, k: int) -> np.ndarray:
+    out = np.empty((len(q), k), dtype=np.int64)
+    best = np.full((len(q), k), -np.inf, dtype=np.float32)
+    for i in range(0, len(x), 65536):
+        s = q @ np.asarray(x[i:i + 65536], dtype=np.float32).T
+        cand = np.concatenate([best, s], axis=1)
+        ids = np.concatenate([out, np.broadcast_to(np.arange(i, i + s.shape[1]), s.shape)], axis=1)
+        top = np.argpartition(-cand, k - 1, axis=1)[:, :k]
+        best, out = np.take_along_axis(cand, top, 1), np.take_along_axis(ids, top, 1)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--vectors", default=None, help=".npy hoặc raw .f16 (embed cache)")
+    ap.add_argument("--dim", type=int, default=512)
+    ap.add_argument("--n", type=int, default=100000, help="số vector giả khi không có --vectors")
+    ap.add_argument("--clusters", type=int, default=500)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--nlist", type=int, default=0)
+    ap.add_argument("--m", type=int, default=32)
+    ap.add_argument("--train-size", type=int, default=65536)
+    ap.add_argument("--sweep", default="1:0,4:0,8:50,16:100,32:200,64:400", help="nprobe:rerank,...")
+    ap.add_argument("--out", default=None, help="ghi kết quả JSON ra file")
+    args = ap.parse_args()
+
+    x = _open_vectors(args.vectors, args.dim) if args.vectors else _synthetic(args.n, args.dim, args.clusters, 0)
+    rng = np.random.default_rng(1)
+    qi = rng.choice(len(x), args.queries, replace=False)
+    q = _normalize(np.asarray(x[np.sort(qi)], dtype=np.float32)
+                   + 0.05 * rng.standard_normal((args.queries, x.shape[1])).astype(np.float32))
+
+    t0 = time.perf_counter()
+    idx = IVFPQIndex.build(x, nlist=args.nlist, m=args.m, train_size=args.train_size)
+    build_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    truth = _exact(x, q, args.k)
+    exact_qps = len(q) / (time.perf_counter() - t0)
+
+    def vectors(ids: np.ndarray) -> np.ndarray:
+        return np.asarray(x[np.sort(ids)], dtype=np.float32)[np.argsort(np.argsort(ids))]
+
+    results = []
+    for item in args.sweep.split(","):
+        nprobe, rerank = (int(v) for v in item.split(":"))
+        t0 = time.perf_counter()
+        found = [idx.search(qv, args.k, nprobe=nprobe, rerank=rerank, vectors=vectors)[0] for qv in q]
+        qps = len(q) / (time.perf_counter() - t0)
+        recall = np.mean([len(set(f) & set(t)) / args.k for f, t in zip(found, truth)])
+        results.append({"nprobe": nprobe, "rerank": rerank, f"recall@{args.k}": round(float(recall), 4),
+                        "qps": round(qps, 1), "speedup": round(qps / exact_qps, 2)})
+
+    report = {"n": len(x), "dim": int(x.shape[1]), "queries": len(q), "k": args.k,
+              "build_s": round(build_s, 2), "exact_qps": round(exact_qps, 1), "index": idx.stats(),
+              "results": results}
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
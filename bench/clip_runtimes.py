@@ -0,0 +1,82 @@
+"""So sánh throughput + độ lệch cosine của các CLIP_RUNTIME so với fp32.
+
+    python -m bench.clip_runtimes --images ./samples --batch 16 --runtimes fp32,int8,torchscript,bf16
+
+Không có --images thì dùng ảnh nhiễu ngẫu nhiên (đủ để đo tốc độ, độ lệch
+cosine thì nên đo trên ảnh thật).
+"""
+import argparse, glob, json, os, sys, time
+import torch
+import clip
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import config  # noqa: E402
+from app.clip_runtime import RUNTIMES, build_encoder, configure_threads, input_resolution  # noqa: E402
+
+
+def _load_batch(preprocess, side: int, images: str | None, n: int) -> torch.Tensor:
+    if images:
+        paths = sorted(glob.glob(os.path.join(images, "*")))[:n]
+        return torch.stack([preprocess(Image.open(p).convert("RGB")) for p in paths])
+    g = torch.Generator().manual_seed(0)
+    return torch.rand(n, 3, side, side, generator=g)
+
+
+def _run(encode, batch: torch.Tensor, bs: int, repeat: int) -> tuple[torch.Tensor, float]:
+    with torch.inference_mode():
+        encode(batch[:bs])  # warm-up
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            feats = torch.cat([encode(batch[i:i + bs]).float() for i in range(0, len(batch), bs)])
+        dt = time.perf_counter() - t0
+    return feats / feats.norm(dim=-1, keepdim=True), (len(batch) * repeat) / dt
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", default=config.CLIP_MODEL)
+    ap.add_argument("--images", default=None, help="thư mục ảnh mẫu")
+    ap.add_argument("--n", type=int, default=64, help="số ảnh")
+    ap.add_argument("--batch", type=int, default=16)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--runtimes", default=",".join(RUNTIMES))
+    ap.add_argument("--out", default=None, help="ghi kết quả JSON ra file")
+    args = ap.parse_args()
+
+    configure_threads()
+    model, preprocess = clip.load(args.model, device="cpu")
+    model.eval()
+    batch = _load_batch(preprocess, input_resolution(model), args.images, args.n)
+
+    base, base_ips = _run(model.encode_image, batch, args.batch, args.repeat)
+    results = [{"runtime": "fp32", "images_per_s": round(base_ips, 2), "speedup": 1.0,
+                "cosine_min": 1.0, "cosine_mean": 1.0}]
+    for rt in [r for r in args.runtimes.split(",") if r and r != "fp32"]:
+        try:
+            # runtime có thể sửa model tại chỗ (bf16 -> channels_last) nên load bản riêng
+            m, _ = clip.load(args.model, device="cpu")
+            feats, ips = _run(build_encoder(m.eval(), args.model, rt), batch, args.batch, args.repeat)
+        except Exception as e:
+            results.append({"runtime": rt, "error": str(e)})
+            continue
+        cos = (feats * base).sum(dim=-1)
+        results.append({
+            "runtime": rt,
+            "images_per_s": round(ips, 2),
+            "speedup": round(ips / base_ips, 3),
+            "cosine_min": round(cos.min().item(), 5),
+            "cosine_mean": round(cos.mean().item(), 5),
+        })
+
+    report = {"model": args.model, "n": len(batch), "batch": args.batch,
+              "threads": torch.get_num_threads(), "results": results}
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
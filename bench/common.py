@@ -0,0 +1,51 @@
+"""Tiện ích chung cho bench: percentile, metadata môi trường, ghi JSON ổn định để diff."""
+import json, os, platform, subprocess, sys, time
+from typing import List, Optional
+
+
+def percentiles(samples: List[float], ps=(50, 95, 99)) -> dict:
+    """samples (giây) -> {"p50_ms": .., ...}; nearest-rank, đủ ổn định để so giữa các lần chạy."""
+    if not samples:
+        return {f"p{p}_ms": None for p in ps}
+    s = sorted(samples)
+    return {f"p{p}_ms": round(1000 * s[min(len(s) - 1, max(0, int(round(p / 100 * len(s))) - 1))], 2) for p in ps}
+
+
+def summarize(samples: List[float], wall_s: float, errors: int = 0) -> dict:
+    n = len(samples)
+    return {
+        "requests": n + errors,
+        "ok": n,
+        "errors": errors,
+        "throughput_rps": round(n / wall_s, 2) if wall_s > 0 else None,
+        "mean_ms": round(1000 * sum(samples) / n, 2) if n else None,
+        **percentiles(samples),
+    }
+
+
+def _git_sha() -> Optional[str]:
+    try:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=root,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def meta(**extra) -> dict:
+    return {
+        "git": _git_sha(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        **extra,
+    }
+
+
+def write_report(report: dict, out: Optional[str]):
+    text = json.dumps(report, indent=2, ensure_ascii=False, sort_keys=False)
+    if out:
+        with open(out, "w") as f:
+            f.write(text + "\n")
+    print(text, file=sys.stdout)
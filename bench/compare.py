@@ -0,0 +1,80 @@
+"""So 2 báo cáo bench (suite/load/micro) và in chênh lệch theo từng chỉ số.
+
+    python -m bench.compare base.json new.json --threshold 0.15
+
+Latency (*_ms) tăng hoặc throughput (*_per_s, *_rps) giảm quá --threshold (tỉ lệ) thì
+tính là regression, thoát mã 1.
+"""
+import argparse, json, sys
+from typing import Dict, Iterator, Tuple
+
+
+def _flatten(obj, prefix: str = "") -> Iterator[Tuple[str, float]]:
+    """Chỉ số dạng số, key theo đường dẫn; list theo concurrency thì đánh theo c=<n>."""
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            if k not in ("meta", "status"):
+                yield from _flatten(v, f"{prefix}.{k}" if prefix else k)
+    elif isinstance(obj, list):
+        for i, v in enumerate(obj):
+            tag = f"c={v['concurrency']}" if isinstance(v, dict) and "concurrency" in v else str(i)
+            yield from _flatten(v, f"{prefix}[{tag}]")
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        yield prefix, float(obj)
+
+
+def _direction(key: str) -> int:
+    """+1: càng cao càng tốt, -1: càng thấp càng tốt, 0: chỉ để tham khảo."""
+    leaf = key.rsplit(".", 1)[-1]
+    if leaf.endswith("_ms"):
+        return -1
+    if leaf.endswith(("_per_s", "_rps")) or leaf.startswith("speedup"):
+        return 1
+    if leaf == "errors":
+        return -1
+    return 0
+
+
+def compare(base: Dict, new: Dict, threshold: float) -> Tuple[list, list]:
+    a, b = dict(_flatten(base)), dict(_flatten(new))
+    rows, regressions = [], []
+    for key in sorted(set(a) & set(b)):
+        d = _direction(key)
+        if d == 0:
+            continue
+        old, cur = a[key], b[key]
+        change = (cur - old) / old if old else (0.0 if cur == old else float("inf"))
+        rows.append((key, old, cur, change))
+        if d * change < -threshold:
+            regressions.append(key)
+    return rows, regressions
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("base")
+    ap.add_argument("new")
+    ap.add_argument("--threshold", type=float, default=0.10)
+    ap.add_argument("--json", action="store_true", help="in kết quả dạng JSON")
+    args = ap.parse_args()
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    rows, regressions = compare(base, new, args.threshold)
+    if args.json:
+        print(json.dumps({"base": base.get("meta", {}).get("git"), "new": new.get("meta", {}).get("git"),
+                          "threshold": args.threshold, "regressions": regressions,
+                          "changes": {k: {"base": o, "new": c, "change": round(ch, 4)} for k, o, c, ch in rows}},
+                         indent=2, ensure_ascii=False))
+    else:
+        width = max((len(r[0]) for r in rows), default=10)
+        for key, old, cur, change in rows:
+            mark = "  REGRESSION" if key in regressions else ""
+            print(f"{key:<{width}}  {old:>10.2f} -> {cur:>10.2f}  {change:+7.1%}{mark}")
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
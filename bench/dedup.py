@@ -0,0 +1,133 @@
+"""Gộp trùng realestate/domain (app/dedup.py) trên listing giả, offline.
+
+Một phần listing có bản "bên kia": địa chỉ viết khác (hoặc ẩn địa chỉ), ảnh cùng nội dung nhưng
+resize + nén lại dưới URL khác. Đo: gộp đúng/sai, số ảnh phải embed trước/sau gộp, thời gian,
+và HammingIndex so với quét tuyến tính trên nhiều hash.
+
+    python -m bench.dedup --listings 200 --dup-rate 0.4 --photos 8
+"""
+import argparse, asyncio, io, os, random, sys, time
+from PIL import Image, ImageDraw, ImageFilter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import dedup  # noqa: E402
+from app.dedup import HammingIndex, dedupe_listings, image_hashes  # noqa: E402
+from app.schemas import PropertyItem  # noqa: E402
+from bench.common import meta, percentiles, write_report  # noqa: E402
+
+
+def _photo(seed: int, size=(1024, 768)) -> bytes:
+    """Ảnh trơn kiểu ảnh chụp thật (mảng màu + blur), không phải nhiễu."""
+    rng = random.Random(seed)
+    img = Image.new("RGB", size, tuple(rng.randint(0, 255) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x, y = rng.randint(0, size[0]), rng.randint(0, size[1])
+        draw.rectangle([x, y, x + rng.randint(50, 400), y + rng.randint(50, 300)],
+                       fill=tuple(rng.randint(0, 255) for _ in range(3)))
+    buf = io.BytesIO()
+    img.filter(ImageFilter.GaussianBlur(3)).save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def _recode(raw: bytes, size=(800, 600), quality=70) -> bytes:
+    buf = io.BytesIO()
+    Image.open(io.BytesIO(raw)).convert("RGB").resize(size).save(buf, "JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def _dataset(n: int, dup_rate: float, photos: int, seed: int):
+    """-> (items, bytes theo URL, id căn thật của từng item)."""
+    rng = random.Random(seed)
+    items, raw, truth = [], {}, []
+    for p in range(n):
+        lat, lon = -33.87 + rng.uniform(-0.2, 0.2), 151.21 + rng.uniform(-0.2, 0.2)
+        unit, number = rng.randint(1, 40), p + 1  # mỗi căn 1 địa chỉ riêng
+        imgs = [_photo(p * 1000 + k) for k in range(photos)]
+        urls = [f"https://rea.test/{p}/{k}.jpg" for k in range(photos)]
+        raw.update(zip(urls, imgs))
+        items.append(PropertyItem(source="realestate", url=f"https://www.realestate.com.au/p-{p}",
+                                  address=f"{unit}/{number} Bench Street, Sydney, NSW 2000",
+                                  latitude=lat, longitude=lon, images=urls))
+        truth.append(p)
+        if rng.random() < dup_rate:
+            # bản domain: viết địa chỉ kiểu khác hoặc ẩn, ảnh nén lại + thiếu/thêm vài tấm
+            address = (f"Unit {unit}, {number} Bench St, Sydney NSW 2000" if rng.random() < 0.7
+                       else "Address available on request")
+            keep = rng.sample(range(photos), max(2, photos - rng.randint(0, 2)))
+            urls = [f"https://dom.test/{p}/{k}.jpg" for k in keep]
+            raw.update((u, _recode(imgs[k])) for u, k in zip(urls, keep))
+            items.append(PropertyItem(source="domain", url=f"https://www.domain.com.au/p-{p}", address=address,
+                                      latitude=lat + rng.uniform(-2e-4, 2e-4), longitude=lon + rng.uniform(-2e-4, 2e-4),
+                                      images=urls))
+            truth.append(p)
+    order = list(range(len(items)))
+    rng.shuffle(order)
+    return [items[i] for i in order], raw, [truth[i] for i in order]
+
+
+def _bench_index(n: int, queries: int, max_dist: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    hashes = [rng.getrandbits(64) for _ in range(n)]
+    idx = HammingIndex(max_dist)
+    t0 = time.perf_counter()
+    for h in hashes:
+        idx.add(h)
+    add_s = time.perf_counter() - t0
+    qs = [hashes[rng.randrange(n)] ^ (1 << rng.randrange(64)) for _ in range(queries)]
+    mi, lin, mismatches = [], [], 0
+    for q in qs:
+        t = time.perf_counter()
+        got = {i for i, _ in idx.query(q)}
+        mi.append(time.perf_counter() - t)
+        if len(lin) < 20:  # quét tuyến tính chậm: chỉ đo vài truy vấn để đối chiếu
+            t = time.perf_counter()
+            want = {i for i, h in enumerate(hashes) if (h ^ q).bit_count() <= max_dist}
+            lin.append(time.perf_counter() - t)
+            mismatches += got != want
+    return {"hashes": n, "add_per_s": round(n / add_s), "multi_index": percentiles(mi),
+            "linear_scan": percentiles(lin), "mismatches": mismatches}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--listings", type=int, default=200, help="số căn (trước khi thêm bản trùng)")
+    ap.add_argument("--dup-rate", type=float, default=0.4, help="tỉ lệ căn có cả bản domain")
+    ap.add_argument("--photos", type=int, default=8)
+    ap.add_argument("--index-size", type=int, default=200000, help="số hash cho phần đo HammingIndex")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    items, raw, truth = _dataset(args.listings, args.dup_rate, args.photos, args.seed)
+    t0 = time.perf_counter()
+    for b in list(raw.values())[:200]:
+        image_hashes(b)
+    hash_ms = (time.perf_counter() - t0) / min(200, len(raw)) * 1000
+
+    dedup._hash_cache = dedup._HashCache(dedup.DEDUP_HASH_CACHE)  # đo cả phần hash, không ăn cache
+    t0 = time.perf_counter()
+    out = asyncio.run(dedupe_listings(items, None, dict(raw)))
+    took = time.perf_counter() - t0
+
+    by_url = dict(zip((x.url for x in items), truth))
+    clusters = [{by_url[u] for u in x.source_urls} for x in out]
+    wrong = sum(len(c) > 1 for c in clusters)                       # gộp 2 căn khác nhau
+    want_out = len(set(truth))
+    photos_in = sum(len(x.images) for x in items)
+    photos_out = sum(len(x.images) for x in out)
+    write_report({
+        "meta": meta(listings=args.listings, dup_rate=args.dup_rate, photos=args.photos,
+                     hamming_max=dedup.DEDUP_HAMMING_MAX, min_photo_matches=dedup.DEDUP_MIN_PHOTO_MATCHES),
+        "dedup": {"items_in": len(items), "items_out": len(out), "ideal_out": want_out,
+                  "missed_merges": len(out) - want_out + wrong, "wrong_merges": wrong,
+                  "photos_to_embed_before": photos_in, "photos_to_embed_after": photos_out,
+                  "embed_saved_pct": round(100 * (1 - photos_out / photos_in), 1) if photos_in else 0,
+                  "took_s": round(took, 3), "hash_ms_per_image": round(hash_ms, 2)},
+        "hamming_index": _bench_index(args.index_size, 2000, dedup.DEDUP_HAMMING_MAX, args.seed),
+        "stats": dedup.stats(),
+    }, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Server upstream giả cho bench offline: trang kết quả DDG (HTML), trang listing
+realestate/domain (JSON-LD) và ảnh JPEG, với độ trễ + 429/Retry-After tuỳ chỉnh.
+
+    python -m bench.fake_upstream --port 9100 --latency-ms 80 --jitter-ms 30 --p429 0.02
+
+App chạy với HTTP_UPSTREAM_OVERRIDE=http://127.0.0.1:9100 + SEARCH_BACKEND=html: mọi
+request đi tới đây, host gốc nằm ở header X-Upstream-Host. Nội dung tất định theo URL
+(cùng URL -> cùng bytes, có ETag) nên các lần chạy so sánh được với nhau.
+
+--pages: thư mục HTML listing đã lưu (phục vụ xoay vòng thay cho trang sinh ra).
+--images: thư mục JPEG mẫu (không có thì sinh ảnh ở lúc khởi động).
+"""
+import argparse, asyncio, glob, hashlib, html, io, json, os, random, re
+from collections import Counter
+from typing import List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+IMAGE_HOST = "i.bench-cdn.test"
+_SITES = {"realestate.com.au": "realestate", "domain.com.au": "domain"}
+
+
+def _seed(s: str) -> int:
+    return int.from_bytes(hashlib.sha1(s.encode("utf-8")).digest()[:8], "big")
+
+
+def listing_url(site: str, address: str, n: int) -> str:
+    lid = f"{_seed(f'{site}|{address}|{n}') % 10**8:08d}"
+    host = "www.realestate.com.au" if site == "realestate" else "www.domain.com.au"
+    return f"https://{host}/property-house-nsw-sydney-{lid}"
+
+
+def listing_html(url: str, page_kb: int = 600, images: int = 8) -> bytes:
+    """Trang listing giả: JSON-LD đủ trường transform cần + phần HTML đệm cho đủ kích thước thật."""
+    rng = random.Random(_seed(url))
+    lid = url.rstrip("/").rsplit("-", 1)[-1]
+    ld = {
+        "@context": "https://schema.org",
+        "@type": "House",
+        "name": f"{rng.randint(1, 5)} bedroom house",
+        "address": {"streetAddress": f"{rng.randint(1, 300)} Bench St", "addressLocality": "Sydney",
+                    "addressRegion": "NSW", "postalCode": "2000", "addressCountry": "AU"},
+        "geo": {"latitude": -33.87 + rng.uniform(-0.2, 0.2), "longitude": 151.21 + rng.uniform(-0.2, 0.2)},
+        "offers": {"price": f"${rng.randint(500, 3000)},000"},
+        "numberOfBedrooms": rng.randint(1, 5),
+        "numberOfBathroomsTotal": rng.randint(1, 3),
+        "numberOfParkingSpaces": rng.randint(0, 2),
+        "description": "Sunny family home close to transport. " * 5,
+        "image": [f"https://{IMAGE_HOST}/{lid}/{k}.jpg" for k in range(images)],
+    }
+    head = (
+        '<!doctype html><html><head><meta charset="utf-8"><title>Listing</title>'
+        '<script>window.__STATE__ = {"a": 1};</script>'
+        f'<script type="application/ld+json">{json.dumps(ld)}</script>'
+        '<script type="application/ld+json">{"@type": "BreadcrumbList", "itemListElement": [],}</script>'
+        "</head><body>"
+    )
+    block = ('<div class="card"><span class="k">Feature</span><a href="/x">link</a>'
+             '<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p></div>\n')
+    body = block * max(1, (page_kb * 1024 - len(head)) // len(block))
+    return (head + body + "</body></html>").encode("utf-8")
+
+
+def ddg_html(query: str, results: int = 5) -> bytes:
+    """Trang kết quả giống html.duckduckgo.com: a.result__a trỏ thẳng tới URL listing.
+
+    Query gộp "(site:a OR site:b)" -> kết quả xen kẽ các site, như DDG thật.
+    """
+    sites = [v for k, v in _SITES.items() if f"site:{k}" in query] or ["realestate"]
+    address = re.sub(r"\s*\(?site:\S+?(?:\s+OR\s+site:\S+?)*\)?\s*$", "", query).strip()
+    links = "".join(
+        f'<div class="result"><a class="result__a" '
+        f'href="{html.escape(listing_url(sites[i % len(sites)], address, i // len(sites)))}">'
+        f"Listing {i}</a></div>"
+        for i in range(results)
+    )
+    return f"<html><body><div id=links>{links}</div></body></html>".encode("utf-8")
+
+
+def sample_jpegs(n: int = 16, size=(1024, 768)) -> List[bytes]:
+    from PIL import Image
+    out = []
+    for i in range(n):
+        rng = random.Random(i)
+        img = Image.new("RGB", size, (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)))
+        noise = Image.effect_noise(size, 40 + i).convert("RGB")
+        img = Image.blend(img, noise, 0.5)
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=85)
+        out.append(buf.getvalue())
+    return out
+
+
+class Upstream:
+    def __init__(self, latency_ms: float = 50, jitter_ms: float = 20, p429: float = 0.0, retry_after: int = 1,
+                 throttle_hosts: Optional[List[str]] = None, page_kb: int = 600, results: int = 5,
+                 pages_dir: Optional[str] = None, images_dir: Optional[str] = None, seed: int = 0):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.p429 = p429
+        self.retry_after = retry_after
+        self.throttle_hosts = throttle_hosts
+        self.page_kb = page_kb
+        self.results = results
+        self.rng = random.Random(seed)
+        self.pages = [open(p, "rb").read() for p in sorted(glob.glob(os.path.join(pages_dir, "*.htm*")))] \
+            if pages_dir else []
+        self.images = [open(p, "rb").read() for p in sorted(glob.glob(os.path.join(images_dir, "*.jp*g")))] \
+            if images_dir else sample_jpegs()
+        self.counts: Counter = Counter()
+
+    async def handle(self, request: Request) -> Response:
+        host = (request.headers.get("x-upstream-host") or request.url.hostname or "").lower()
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.rng.gauss(self.latency, self.jitter)))
+        site = host[4:] if host.startswith("www.") else host
+        throttled = self.throttle_hosts is None or any(site.endswith(h) for h in self.throttle_hosts)
+        if self.p429 and throttled and self.rng.random() < self.p429:
+            self.counts[f"{site} 429"] += 1
+            return Response(b"slow down", 429, {"Retry-After": str(self.retry_after)})
+
+        if "duckduckgo" in site:
+            q = request.query_params.get("q", "")
+            body, ctype = ddg_html(q, self.results), "text/html; charset=utf-8"
+        elif site in _SITES:
+            url = f"https://{host}{request.url.path}"
+            body = self.pages[_seed(url) % len(self.pages)] if self.pages else listing_html(url, self.page_kb)
+            ctype = "text/html; charset=utf-8"
+        elif site == IMAGE_HOST:
+            body, ctype = self.images[_seed(request.url.path) % len(self.images)], "image/jpeg"
+        else:
+            self.counts[f"{site} 404"] += 1
+            return Response(b"not found", 404)
+
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+        if request.headers.get("if-none-match") == etag:
+            self.counts[f"{site} 304"] += 1
+            return Response(status_code=304, headers={"ETag": etag})
+        self.counts[f"{site} 200"] += 1
+        return Response(body, 200, {"Content-Type": ctype, "ETag": etag})
+
+    async def stats(self, request: Request) -> Response:
+        return JSONResponse(dict(sorted(self.counts.items())))
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[
+            Route("/__stats", self.stats),
+            Route("/{path:path}", self.handle, methods=["GET", "POST"]),
+        ])
+
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9100)
+    ap.add_argument("--latency-ms", type=float, default=50)
+    ap.add_argument("--jitter-ms", type=float, default=20)
+    ap.add_argument("--p429", type=float, default=0.0, help="xác suất trả 429")
+    ap.add_argument("--retry-after", type=int, default=1, help="giá trị header Retry-After (giây)")
+    ap.add_argument("--throttle-hosts", default=None, help="chỉ 429 cho các host này (phẩy), mặc định mọi host")
+    ap.add_argument("--page-kb", type=int, default=600)
+    ap.add_argument("--results", type=int, default=5, help="số kết quả mỗi trang DDG")
+    ap.add_argument("--pages", default=None, help="thư mục HTML listing đã lưu")
+    ap.add_argument("--images", default=None, help="thư mục JPEG mẫu")
+    return ap
+
+
+def make_upstream(args) -> Upstream:
+    return Upstream(args.latency_ms, args.jitter_ms, args.p429, args.retry_after,
+                    args.throttle_hosts.split(",") if args.throttle_hosts else None,
+                    args.page_kb, args.results, args.pages, args.images)
+
+
+def main():
+    import uvicorn
+    args = build_parser().parse_args()
+    uvicorn.run(make_upstream(args).app(), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Độ trễ /nearby và bbox của app/geo_index.py trên N listing giả quanh các thành phố lớn ở AU,
+đối chiếu với quét toàn bộ mảng (kết quả phải trùng).
+
+    python -m bench.geo_nearby --n 300000 --queries 2000 --radius-km 2
+"""
+import argparse, math, os, sys, time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.geo_index import GeoIndex, _haversine_km  # noqa: E402
+from bench.common import meta, percentiles, write_report  # noqa: E402
+
+CITIES = [(-33.87, 151.21), (-37.81, 144.96), (-27.47, 153.03), (-31.95, 115.86), (-34.93, 138.60)]
+
+
+def _listings(n: int, seed: int):
+    rng = np.random.default_rng(seed)
+    city = rng.integers(0, len(CITIES), n)
+    centers = np.array(CITIES)[city]
+    # mật độ giảm dần từ trung tâm, như dữ liệu thật
+    lat = centers[:, 0] + rng.normal(0, 0.15, n)
+    lon = centers[:, 1] + rng.normal(0, 0.18, n)
+    beds = rng.integers(1, 6, n)
+    price = rng.integers(400, 4000, n) * 1000
+    for i in range(n):
+        yield {"source": "realestate", "listing_id": str(i), "url": f"u{i}", "latitude": float(lat[i]),
+               "longitude": float(lon[i]), "bedrooms": float(beds[i]), "bathrooms": 1.0, "parking": 1.0,
+               "price": f"${price[i]:,}"}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=300000)
+    ap.add_argument("--queries", type=int, default=2000)
+    ap.add_argument("--radius-km", type=float, default=2.0)
+    ap.add_argument("--cell-deg", type=float, default=0.01)
+    ap.add_argument("--limit", type=int, default=100, help="limit mỗi truy vấn khi đo thời gian")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    idx = GeoIndex(args.cell_deg)
+    t0 = time.perf_counter()
+    idx.extend(_listings(args.n, args.seed))
+    insert_s = time.perf_counter() - t0
+
+    rng = np.random.default_rng(args.seed + 1)
+    qs = [(c[0] + rng.normal(0, 0.1), c[1] + rng.normal(0, 0.1))
+          for c in (CITIES[i] for i in rng.integers(0, len(CITIES), args.queries))]
+    lats, lons = idx._lat[:idx.n], idx._lon[:idx.n]
+
+    res = {}
+    for name, kw in (("nearby", {}), ("nearby_filtered", {"min_bedrooms": 3, "max_price": 1_500_000})):
+        times, hits, mismatches = [], 0, 0
+        for lat, lon in qs:
+            t = time.perf_counter()
+            idx.nearby(lat, lon, args.radius_km, limit=args.limit, **kw)
+            times.append(time.perf_counter() - t)
+        # kiểm tra trên 50 truy vấn: lấy hết kết quả, so với quét toàn bộ
+        for lat, lon in qs[:50]:
+            d = _haversine_km(lat, lon, lats, lons)
+            want = set(np.flatnonzero(d <= args.radius_km))
+            if kw:
+                a = idx._attrs[:idx.n]
+                want = {r for r in want if a[r, 0] >= 3 and a[r, 3] <= 1_500_000}
+            got = {int(h["listing_id"]) for h in idx.nearby(lat, lon, args.radius_km, limit=10**9, **kw)}
+            hits += len(got)
+            mismatches += got != want
+        res[name] = {"avg_hits": round(hits / 50, 1), "mismatches": mismatches, **percentiles(times)}
+
+    times = []
+    for lat, lon in qs:
+        d = args.radius_km / 111.2
+        t = time.perf_counter()
+        idx.bbox(lat - d, lon - d / math.cos(math.radians(lat)), lat + d, lon + d / math.cos(math.radians(lat)),
+                 limit=args.limit, min_bedrooms=2)
+        times.append(time.perf_counter() - t)
+    res["bbox"] = percentiles(times)
+
+    write_report({"meta": meta(n=args.n, queries=args.queries, radius_km=args.radius_km, cell_deg=args.cell_deg,
+                               limit=args.limit),
+                  "insert_per_s": round(args.n / insert_s), "stats": idx.stats(), "geo": res}, args.out)
+
+
+if __name__ == "__main__":
+    main()
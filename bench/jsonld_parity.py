@@ -0,0 +1,85 @@
+"""Đối chiếu JSON-LD fast path với bản BeautifulSoup trên trang đã lưu + đo tốc độ.
+
+    python -m bench.jsonld_parity --page-cache .cache/pages
+    python -m bench.jsonld_parity --pages ./saved-pages --source realestate
+
+--pages: thư mục file .html (tên file dùng làm URL nếu không có host).
+--page-cache: đọc thẳng PAGE_CACHE_DIR (URL + encoding lấy từ index).
+Thoát với mã 1 nếu có trang cho kết quả transform khác nhau.
+"""
+import argparse, glob, json, os, sqlite3, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.scrapers import common, domain_au, realestate_au  # noqa: E402
+from app.utils.page_cache import PageCache  # noqa: E402
+
+
+def _pages(args):
+    if args.pages:
+        for path in sorted(glob.glob(os.path.join(args.pages, "*.htm*"))):
+            with open(path, "rb") as f:
+                yield os.path.basename(path), f.read(), None
+    if args.page_cache:
+        cache = PageCache(args.page_cache)
+        db = sqlite3.connect(os.path.join(args.page_cache, "index.sqlite3"))
+        for (url,) in db.execute("SELECT url FROM pages ORDER BY url"):
+            entry, body, _ = cache.lookup(url)
+            if body is not None:
+                yield url, body, entry.encoding
+
+
+def _transform(url: str, source: str):
+    if source == "domain" or (not source and "domain.com.au" in url):
+        return domain_au.transform
+    return realestate_au.transform
+
+
+def _run(parser: str, fn, url: str, html: str):
+    common.JSONLD_PARSER = parser
+    t0 = time.perf_counter()
+    item = fn(url, html)
+    return item.model_dump(), time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", default=None, help="thư mục file .html")
+    ap.add_argument("--page-cache", default=None, help="thư mục PAGE_CACHE_DIR")
+    ap.add_argument("--source", default=None, choices=["realestate", "domain"], help="mặc định đoán theo URL")
+    ap.add_argument("--out", default=None, help="ghi kết quả JSON ra file")
+    args = ap.parse_args()
+    if not (args.pages or args.page_cache):
+        ap.error("cần --pages hoặc --page-cache")
+
+    n = 0
+    t_bs4 = t_fast = 0.0
+    mismatches = []
+    for url, body, encoding in _pages(args):
+        html = body.decode(encoding or "utf-8", errors="replace")
+        fn = _transform(url, args.source)
+        ref, dt_ref = _run("bs4", fn, url, html)
+        got, dt_got = _run("fast", fn, url, html)
+        n += 1
+        t_bs4 += dt_ref
+        t_fast += dt_got
+        if got != ref:
+            diff = sorted(k for k in ref if ref.get(k) != got.get(k))
+            mismatches.append({"url": url, "fields": diff})
+
+    report = {
+        "pages": n,
+        "mismatches": mismatches,
+        "bs4_ms_per_page": round(1000 * t_bs4 / max(n, 1), 3),
+        "fast_ms_per_page": round(1000 * t_fast / max(n, 1), 3),
+        "speedup": round(t_bs4 / t_fast, 2) if t_fast else None,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    print(text)
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Tải song song lên API đang chạy: p50/p95/p99 + throughput theo từng mức concurrency.
+
+    python -m bench.load --base http://127.0.0.1:8000 --scenarios search,scrape,listings \\
+        --concurrency 1,8,32 --requests 200 --out load.json
+
+Mỗi mức concurrency dùng địa chỉ/URL riêng (đổi theo --salt + mức) nên đo đường cache miss
+thật; --reuse dùng lại cùng bộ key cho mọi mức để đo đường cache hit. URL listing/ảnh sinh
+theo bench.fake_upstream nên app phải chạy với HTTP_UPSTREAM_OVERRIDE trỏ tới upstream giả.
+"""
+import argparse, asyncio, os, sys, time
+from collections import Counter
+from typing import Callable, Dict, List, Tuple
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench.common import meta, summarize, write_report  # noqa: E402
+from bench.fake_upstream import IMAGE_HOST, listing_url  # noqa: E402
+
+SCENARIOS = ("search", "scrape", "listings", "embed")
+
+
+def _address(i: int, key: str) -> str:
+    return f"{i + 1} Bench{key} Street, Sydney NSW 2000"
+
+
+def _request(scenario: str, i: int, key: str, images: int) -> Tuple[str, str, dict]:
+    """(method, path, kwargs cho httpx) của request thứ i."""
+    if scenario == "search":
+        return "GET", "/search", {"params": {"address": _address(i, key)}}
+    if scenario == "listings":
+        return "GET", "/listings", {"params": {"address": _address(i, key)}}
+    if scenario == "scrape":
+        site = "realestate" if i % 2 == 0 else "domain"
+        return "GET", "/scrape", {"params": {"url": listing_url(site, _address(i, key), 0)}}
+    if scenario == "embed":
+        urls = [f"https://{IMAGE_HOST}/{key}-{i}/{k}.jpg" for k in range(images)]
+        return "POST", "/embed", {"json": {"image_urls": urls}}
+    raise ValueError(f"unknown scenario {scenario!r}")
+
+
+async def run_level(client: httpx.AsyncClient, make: Callable[[int], Tuple[str, str, dict]],
+                    concurrency: int, n: int) -> dict:
+    samples: List[float] = []
+    statuses: Counter = Counter()
+    errors = 0
+    it = iter(range(n))
+
+    async def _worker():
+        nonlocal errors
+        for i in it:  # iterator dùng chung: mỗi request đúng 1 worker lấy
+            method, path, kw = make(i)
+            t0 = time.perf_counter()
+            try:
+                r = await client.request(method, path, **kw)
+                statuses[str(r.status_code)] += 1
+                if r.status_code < 400:
+                    samples.append(time.perf_counter() - t0)
+                else:
+                    errors += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+                errors += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(_worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - t0
+    return {"concurrency": concurrency, **summarize(samples, wall, errors), "wall_s": round(wall, 3),
+            "status": dict(sorted(statuses.items()))}
+
+
+async def run(base: str, scenarios: List[str], levels: List[int], n: int, salt: str, reuse: bool,
+              images: int, timeout: float) -> Dict[str, list]:
+    limits = httpx.Limits(max_connections=max(levels) + 4, max_keepalive_connections=max(levels) + 4)
+    out: Dict[str, list] = {}
+    async with httpx.AsyncClient(base_url=base, timeout=timeout, limits=limits) as client:
+        for scenario in scenarios:
+            out[scenario] = []
+            for c in levels:
+                key = salt if reuse else f"{salt}c{c}"
+                res = await run_level(client, lambda i, s=scenario, k=key: _request(s, i, k, images), c, n)
+                print(f"{scenario:>9} c={c:<4} p50={res['p50_ms']}ms p99={res['p99_ms']}ms "
+                      f"rps={res['throughput_rps']} errors={res['errors']}", file=sys.stderr)
+                out[scenario].append(res)
+    return out
+
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--base", default="http://127.0.0.1:8000")
+    ap.add_argument("--scenarios", default="search,scrape,listings", help=f"phẩy, trong {','.join(SCENARIOS)}")
+    ap.add_argument("--concurrency", default="1,8,32")
+    ap.add_argument("--requests", type=int, default=200, help="số request mỗi (scenario, concurrency)")
+    ap.add_argument("--embed-images", type=int, default=8, help="số ảnh mỗi request /embed")
+    ap.add_argument("--salt", default=None, help="đổi bộ địa chỉ/URL (mặc định theo thời gian: luôn miss cache)")
+    ap.add_argument("--reuse", action="store_true", help="cùng bộ key cho mọi mức concurrency (đo cache hit)")
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--out", default=None)
+    return ap
+
+
+def parse_levels(s: str) -> List[int]:
+    return [int(x) for x in s.split(",") if x.strip()]
+
+
+def main():
+    args = build_parser().parse_args()
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    bad = set(scenarios) - set(SCENARIOS)
+    if bad:
+        sys.exit(f"unknown scenarios: {','.join(sorted(bad))}")
+    salt = args.salt or f"{int(time.time()) % 100000}"
+    levels = parse_levels(args.concurrency)
+    results = asyncio.run(run(args.base, scenarios, levels, args.requests, salt, args.reuse,
+                              args.embed_images, args.timeout))
+    write_report({"meta": meta(base=args.base, requests=args.requests, salt=salt, reuse=args.reuse),
+                  "load": results}, args.out)
+
+
+if __name__ == "__main__":
+    main()
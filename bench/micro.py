@@ -0,0 +1,109 @@
+"""Microbenchmark các hàm nóng, không cần API chạy:
+
+- extract_from_jsonld: parser fast vs bs4 trên trang listing giả (hoặc --pages).
+- embed_image_urls: tải ảnh từ upstream giả (chạy trong cùng process) + CLIP, không cache.
+
+    python -m bench.micro --out micro.json
+    python -m bench.micro --only jsonld --pages ./saved-pages
+"""
+import argparse, asyncio, glob, os, sys, time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench.common import meta, percentiles, write_report  # noqa: E402
+from bench.fake_upstream import IMAGE_HOST, Upstream, listing_html, listing_url  # noqa: E402
+
+
+def _timed(fn, repeat: int) -> List[float]:
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+def bench_jsonld(pages: List[bytes], repeat: int) -> dict:
+    from app.scrapers import common
+    out = {"pages": len(pages), "avg_kb": round(sum(map(len, pages)) / len(pages) / 1024, 1)}
+    saved = common.JSONLD_PARSER
+    try:
+        for parser in ("fast", "bs4"):
+            common.JSONLD_PARSER = parser
+            samples = _timed(lambda: [common.extract_from_jsonld(p, "utf-8") for p in pages], repeat)
+            per_page = [s / len(pages) for s in samples]
+            out[parser] = {"pages_per_s": round(len(pages) * len(samples) / sum(samples), 1), **percentiles(per_page)}
+    finally:
+        common.JSONLD_PARSER = saved
+    if out["fast"]["p50_ms"]:
+        out["speedup_p50"] = round(out["bs4"]["p50_ms"] / out["fast"]["p50_ms"], 1)
+    return out
+
+
+async def bench_embed(batches: int, images: int, port: int) -> dict:
+    import uvicorn
+    upstream = Upstream(latency_ms=0, jitter_ms=0)
+    server = uvicorn.Server(uvicorn.Config(upstream.app(), host="127.0.0.1", port=port, log_level="warning"))
+    serve = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    try:
+        from app import clip_embed
+        # lượt đầu: nạp model + warm-up, không tính
+        await clip_embed.embed_image_urls([f"https://{IMAGE_HOST}/warm/{k}.jpg" for k in range(images)])
+        samples = []
+        t_all = time.perf_counter()
+        for b in range(batches):
+            urls = [f"https://{IMAGE_HOST}/micro-{time.time_ns()}-{b}/{k}.jpg" for k in range(images)]
+            t0 = time.perf_counter()
+            vecs = await clip_embed.embed_image_urls(urls)
+            samples.append(time.perf_counter() - t0)
+            if not all(vecs):
+                raise RuntimeError(f"{sum(1 for v in vecs if not v)} images failed to embed")
+        wall = time.perf_counter() - t_all
+        await clip_embed.shutdown()
+        return {"batches": batches, "images_per_batch": images,
+                "images_per_s": round(batches * images / wall, 1), **percentiles(samples)}
+    finally:
+        server.should_exit = True
+        await serve
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--only", default="jsonld,embed", help="phẩy: jsonld, embed")
+    ap.add_argument("--pages", default=None, help="thư mục HTML listing thật thay cho trang giả")
+    ap.add_argument("--page-kb", type=int, default=600)
+    ap.add_argument("--n-pages", type=int, default=20)
+    ap.add_argument("--repeat", type=int, default=10)
+    ap.add_argument("--embed-batches", type=int, default=10)
+    ap.add_argument("--embed-images", type=int, default=8)
+    ap.add_argument("--port", type=int, default=9199, help="cổng upstream giả cho embed")
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+    only = {s.strip() for s in args.only.split(",")}
+
+    if "embed" in only:
+        # config đọc env lúc import: phải đặt trước khi import app.*
+        os.environ["HTTP_UPSTREAM_OVERRIDE"] = f"http://127.0.0.1:{args.port}"
+        os.environ["EMBED_CACHE_DIR"] = ""
+        os.environ.setdefault("HTTP_RATE_BY_HOST", f"{IMAGE_HOST}=10000:10000")
+
+    report = {"meta": meta(), "micro": {}}
+    if "jsonld" in only:
+        if args.pages:
+            pages = [open(p, "rb").read() for p in sorted(glob.glob(os.path.join(args.pages, "*.htm*")))]
+        else:
+            pages = [listing_html(listing_url("realestate", "micro", i), args.page_kb) for i in range(args.n_pages)]
+        report["micro"]["extract_from_jsonld"] = bench_jsonld(pages, args.repeat)
+    if "embed" in only:
+        try:
+            report["micro"]["embed_image_urls"] = asyncio.run(
+                bench_embed(args.embed_batches, args.embed_images, args.port))
+        except ImportError as e:  # torch/clip chưa cài: ghi lại lý do thay vì hỏng cả báo cáo
+            report["micro"]["embed_image_urls"] = {"skipped": f"{type(e).__name__}: {e}"}
+    write_report(report, args.out)
+
+
+if __name__ == "__main__":
+    main()
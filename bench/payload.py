@@ -0,0 +1,90 @@
+"""Serialize + nén payload listing và vector /embed, offline (app/utils/payload.py, app/utils/compress.py).
+
+Listing lấy từ trang giả của bench.fake_upstream qua transform thật; `raw` được đệm thêm cho gần kích
+thước JSON-LD thật (--raw-kb). So sánh: dict + json.dumps (đường cũ), pydantic dump_json, projection
+"lean"; gzip/br; vector: tolist + json.dumps, orjson ghi ndarray, base64 float16, binary float16.
+
+    python -m bench.payload --items 20 --raw-kb 12 --images 20
+"""
+import argparse, base64, json, os, sys, time
+from typing import Callable, List
+import numpy as np
+from pydantic import TypeAdapter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.schemas import PropertyItem  # noqa: E402
+from app.scrapers import realestate_au  # noqa: E402
+from app.utils import compress as comp  # noqa: E402
+from app.utils.payload import dump_items, dumps, pack_vectors, parse_fields  # noqa: E402
+from bench.common import meta, percentiles, write_report  # noqa: E402
+from bench.fake_upstream import listing_html, listing_url  # noqa: E402
+
+
+def _items(n: int, raw_kb: int, images: int) -> List[PropertyItem]:
+    out = []
+    for i in range(n):
+        url = listing_url("realestate", "12 Bench St Sydney NSW 2000", i)
+        item = realestate_au.transform(url, listing_html(url, page_kb=8, images=images))
+        pad = [{"@type": "LocationFeatureSpecification", "name": f"feature {k}", "value": True}
+               for k in range(raw_kb * 1024 // 80)]
+        item.raw = {**item.raw, "amenityFeature": pad}
+        out.append(item)
+    return out
+
+
+def _measure(fn: Callable[[], bytes], repeat: int) -> dict:
+    samples, body = [], b""
+    for _ in range(repeat):
+        t = time.perf_counter()
+        body = fn()
+        samples.append(time.perf_counter() - t)
+    out = {"bytes": len(body), **percentiles(samples)}
+    for enc in ("gzip", "br"):
+        if enc == "br" and comp.brotli is None:
+            continue
+        t = time.perf_counter()
+        z = comp.compress(body, enc)
+        out[enc] = {"bytes": len(z), "ms": round((time.perf_counter() - t) * 1000, 2)}
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--items", type=int, default=20, help="số listing mỗi response /listings")
+    ap.add_argument("--raw-kb", type=int, default=12, help="kích thước JSON-LD `raw` mỗi listing")
+    ap.add_argument("--images", type=int, default=20)
+    ap.add_argument("--vectors", type=int, default=32, help="số ảnh mỗi response /embed")
+    ap.add_argument("--dim", type=int, default=512)
+    ap.add_argument("--repeat", type=int, default=200)
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    items = _items(args.items, args.raw_kb, args.images)
+    adapter = TypeAdapter(List[PropertyItem])
+    lean = parse_fields("lean")
+    listings = {
+        "dict_json_dumps": lambda: json.dumps(adapter.dump_python(items, mode="json"), ensure_ascii=False).encode(),
+        "pydantic_dump_json": lambda: dump_items(items),
+        "pydantic_dump_json_lean": lambda: dump_items(items, lean),
+    }
+
+    rng = np.random.default_rng(0)
+    vecs = rng.standard_normal((args.vectors, args.dim)).astype(np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    rows = list(vecs)
+    vectors = {
+        "tolist_json_dumps": lambda: json.dumps({"vectors": [v.tolist() for v in rows]}).encode(),
+        "orjson_ndarray": lambda: dumps({"vectors": rows}),
+        "base64_f16": lambda: dumps({"vectors_b64": base64.b64encode(pack_vectors(rows, args.dim).tobytes()).decode()}),
+        "binary_f16": lambda: pack_vectors(rows, args.dim).tobytes(),
+    }
+    write_report({
+        "meta": meta(items=args.items, raw_kb=args.raw_kb, images=args.images, vectors=args.vectors, dim=args.dim,
+                     brotli=comp.brotli is not None),
+        "listings": {k: _measure(fn, args.repeat) for k, fn in listings.items()},
+        "embed": {k: _measure(fn, args.repeat) for k, fn in vectors.items()},
+    }, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Chạy trọn bộ bench offline: upstream giả + API (uvicorn) + load + micro -> 1 file JSON.
+
+    python -m bench.suite --out bench-$(git rev-parse --short HEAD).json
+    python -m bench.suite --scenarios search,scrape --concurrency 1,16 --p429 0.05 --real-rates
+    python -m bench.compare bench-old.json bench-new.json
+
+Mặc định limiter theo host được nới rất rộng (đo app, không đo token bucket); --real-rates giữ
+rate thật để xem ảnh hưởng của limiter + 429/Retry-After. Mọi cache trên đĩa đều tắt để các
+lần chạy độc lập với nhau.
+"""
+import argparse, json, os, subprocess, sys, tempfile, time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from bench.common import meta, write_report  # noqa: E402
+from bench.fake_upstream import IMAGE_HOST  # noqa: E402
+from bench.load import SCENARIOS  # noqa: E402
+
+_HOSTS = ("realestate.com.au", "domain.com.au", "duckduckgo.com", IMAGE_HOST)
+
+
+def _wait_http(url: str, proc: subprocess.Popen, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{proc.args[2:4]} exited with {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+def app_env(upstream: str, embed: bool, real_rates: bool) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "HTTP_UPSTREAM_OVERRIDE": upstream,
+        "SEARCH_BACKEND": "html",
+        "PAGE_CACHE_DIR": "",
+        "EMBED_CACHE_DIR": "",
+        "SEARCH_CACHE_PATH": "",
+        "BATCH_DB_PATH": "",
+        "PHOTO_INDEX_DIR": "",
+        "LISTING_STORE_PATH": "",
+        "TAG_CACHE_DIR": "",
+        "CLIP_WARMUP": "1" if embed else "0",
+        "PROXY_URL": "",
+    })
+    if not real_rates:
+        env["HTTP_RATE_BY_HOST"] = ",".join(f"{h}=100000:100000" for h in _HOSTS)
+        env["SEARCH_MIN_GAP"] = "0"
+    return env
+
+
+def main():
+    from bench.load import build_parser as load_parser
+    ap = argparse.ArgumentParser(parents=[load_parser()], conflict_handler="resolve")
+    ap.add_argument("--app-port", type=int, default=8765)
+    ap.add_argument("--upstream-port", type=int, default=9100)
+    ap.add_argument("--latency-ms", type=float, default=50)
+    ap.add_argument("--jitter-ms", type=float, default=20)
+    ap.add_argument("--p429", type=float, default=0.0)
+    ap.add_argument("--retry-after", type=int, default=1)
+    ap.add_argument("--page-kb", type=int, default=600)
+    ap.add_argument("--pages", default=None, help="thư mục HTML listing thật cho upstream giả")
+    ap.add_argument("--images", default=None, help="thư mục JPEG mẫu cho upstream giả")
+    ap.add_argument("--real-rates", action="store_true", help="giữ rate limit thật theo host")
+    ap.add_argument("--no-micro", action="store_true")
+    ap.add_argument("--startup-timeout", type=float, default=120.0)
+    args = ap.parse_args()
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    bad = set(scenarios) - set(SCENARIOS)
+    if bad:
+        sys.exit(f"unknown scenarios: {','.join(sorted(bad))}")
+    embed = "embed" in scenarios
+
+    upstream_url = f"http://127.0.0.1:{args.upstream_port}"
+    base = f"http://127.0.0.1:{args.app_port}"
+    up_cmd = [sys.executable, "-m", "bench.fake_upstream", "--port", str(args.upstream_port),
+              "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms), "--p429", str(args.p429),
+              "--retry-after", str(args.retry_after), "--page-kb", str(args.page_kb)]
+    if args.pages:
+        up_cmd += ["--pages", args.pages]
+    if args.images:
+        up_cmd += ["--images", args.images]
+    app_cmd = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.app_port), "--log-level", "warning"]
+
+    procs = []
+    try:
+        procs.append(subprocess.Popen(up_cmd, cwd=ROOT))
+        _wait_http(f"{upstream_url}/__stats", procs[0], args.startup_timeout)
+        procs.append(subprocess.Popen(app_cmd, cwd=ROOT, env=app_env(upstream_url, embed, args.real_rates),
+                                      stdout=subprocess.DEVNULL))
+        _wait_http(f"{base}/health", procs[1], args.startup_timeout)
+
+        import asyncio
+        from bench.load import parse_levels, run
+        salt = args.salt or f"{int(time.time()) % 100000}"
+        load = asyncio.run(run(base, scenarios, parse_levels(args.concurrency), args.requests, salt, args.reuse,
+                               args.embed_images, args.timeout))
+        upstream_stats = httpx.get(f"{upstream_url}/__stats").json()
+        parse_stats = httpx.get(f"{base}/stats/parse").json()
+    finally:
+        for p in reversed(procs):
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+    report = {
+        "meta": meta(requests=args.requests, salt=salt, reuse=args.reuse, real_rates=args.real_rates,
+                     upstream={"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "p429": args.p429,
+                               "retry_after": args.retry_after, "page_kb": args.page_kb}),
+        "load": load,
+        "upstream": upstream_stats,
+        "parse": parse_stats,
+    }
+    if not args.no_micro:
+        only = "jsonld,embed" if embed else "jsonld"
+        with tempfile.TemporaryDirectory() as tmp:  # qua file: stdout của micro lẫn log của app
+            path = os.path.join(tmp, "micro.json")
+            subprocess.run([sys.executable, "-m", "bench.micro", "--only", only, "--page-kb", str(args.page_kb),
+                            "--out", path], cwd=ROOT, stdout=subprocess.DEVNULL, check=True)
+            with open(path) as f:
+                report["micro"] = json.load(f)["micro"]
+    write_report(report, args.out)
+
+
+if __name__ == "__main__":
+    main()
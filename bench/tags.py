@@ -0,0 +1,88 @@
+"""Chấm điểm gắn tag (app/photo_tags.py) offline: 1 phép nhân ma trận cho cả lô ảnh × nhãn so với
+chấm từng ảnh, và đọc bộ nhãn từ cache .npy so với encode lại (cần CLIP, chỉ đo khi có --clip).
+
+Vector ảnh/nhãn giả (ngẫu nhiên, L2-normalized): đo thời gian, không đo độ chính xác.
+
+    python -m bench.tags --listings 50 --photos 20 --labels 17
+"""
+import argparse, asyncio, os, sys, tempfile, time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import photo_tags  # noqa: E402
+from app.photo_tags import listing_tags, score  # noqa: E402
+from bench.common import meta, percentiles, write_report  # noqa: E402
+
+
+def _unit(rng, n: int, dim: int) -> np.ndarray:
+    m = rng.standard_normal((n, dim)).astype(np.float32)
+    return m / np.linalg.norm(m, axis=1, keepdims=True)
+
+
+def _label_cache(labels, repeat: int, use_clip: bool) -> dict:
+    out = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        photo_tags.TAG_CACHE_DIR = tmp
+        if use_clip:
+            t = time.perf_counter()
+            asyncio.run(photo_tags.label_matrix(labels))
+            out["encode_ms"] = round((time.perf_counter() - t) * 1000, 2)
+        else:  # không có CLIP: ghi file cache từ vector giả
+            key = photo_tags._key(photo_tags.config.CLIP_MODEL, labels, photo_tags.TAG_PROMPT)
+            photo_tags._save(os.path.join(tmp, f"labels-{key}.npy"), _unit(np.random.default_rng(0), len(labels), 512))
+        disk = []
+        for _ in range(repeat):
+            photo_tags._labels_cache.clear()
+            t = time.perf_counter()
+            asyncio.run(photo_tags.label_matrix(labels))
+            disk.append(time.perf_counter() - t)
+        ram = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            asyncio.run(photo_tags.label_matrix(labels))
+            ram.append(time.perf_counter() - t)
+    out.update({"disk": percentiles(disk), "ram": percentiles(ram)})
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--listings", type=int, default=50, help="số listing mỗi request")
+    ap.add_argument("--photos", type=int, default=20, help="số ảnh mỗi listing")
+    ap.add_argument("--labels", type=int, default=len(photo_tags.TAG_LABELS))
+    ap.add_argument("--dim", type=int, default=512)
+    ap.add_argument("--repeat", type=int, default=200)
+    ap.add_argument("--clip", action="store_true", help="đo cả encode_text bộ nhãn (load CLIP)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    labels = (photo_tags.TAG_LABELS + [f"label {i}" for i in range(args.labels)])[:args.labels]
+    images = _unit(rng, args.listings * args.photos, args.dim)
+    label_vecs = _unit(rng, args.labels, args.dim)
+
+    batch, per_image = [], []
+    for _ in range(args.repeat):
+        t = time.perf_counter()
+        probs = score(images, label_vecs)
+        for i in range(args.listings):
+            listing_tags(probs[i * args.photos:(i + 1) * args.photos], labels)
+        batch.append(time.perf_counter() - t)
+    for _ in range(max(1, args.repeat // 10)):  # chậm: ít vòng hơn
+        t = time.perf_counter()
+        for i in range(args.listings):
+            rows = np.stack([score(images[j:j + 1], label_vecs)[0]
+                             for j in range(i * args.photos, (i + 1) * args.photos)])
+            listing_tags(rows, labels)
+        per_image.append(time.perf_counter() - t)
+
+    write_report({
+        "meta": meta(listings=args.listings, photos=args.photos, labels=args.labels, dim=args.dim),
+        "score": {"batched_matmul": percentiles(batch), "per_image": percentiles(per_image)},
+        "label_matrix": _label_cache(labels, args.repeat, args.clip),
+    }, args.out)
+
+
+if __name__ == "__main__":
+    main()
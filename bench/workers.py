@@ -0,0 +1,129 @@
+"""serve.py với N worker: bộ nhớ (RSS/PSS/USS) và throughput, có/không preload CLIP trước khi fork.
+
+PSS chia trang nhớ dùng chung cho các process cùng map, nên tổng PSS mới là bộ nhớ thật của cả
+nhóm; RSS cộng dồn đếm weights dùng chung N lần. Cần Linux (/proc/<pid>/smaps_rollup).
+
+    python -m bench.workers --workers 1,2,4 --scenarios scrape,embed --concurrency 16
+    python -m bench.workers --workers 4 --modes preload,no-preload
+"""
+import argparse, asyncio, os, shutil, signal, subprocess, sys, tempfile, time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from bench.common import meta, write_report  # noqa: E402
+from bench.load import SCENARIOS, parse_levels, run  # noqa: E402
+from bench.suite import _wait_http, app_env  # noqa: E402
+
+MODES = ("preload", "no-preload")
+
+
+def _children(pid: int) -> list:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(x) for x in f.read().split()]
+    except OSError:
+        return []
+
+
+def _mem_kb(pid: int) -> dict:
+    out = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            k, _, rest = line.partition(":")
+            if k in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                out[k] = int(rest.split()[0])
+    return {"rss": out["Rss"], "pss": out["Pss"], "uss": out["Private_Clean"] + out["Private_Dirty"]}
+
+
+def _memory(master: int) -> dict:
+    procs = {"master": _mem_kb(master)}
+    for i, pid in enumerate(_children(master)):
+        procs[f"worker{i}"] = _mem_kb(pid)
+    total = {k: sum(p[k] for p in procs.values()) for k in ("rss", "pss", "uss")}
+    return {"total_mb": {k: round(v / 1024, 1) for k, v in total.items()},
+            "per_process_mb": {n: {k: round(v / 1024, 1) for k, v in p.items()} for n, p in procs.items()}}
+
+
+def _one(args, workers: int, mode: str, env: dict, base: str) -> dict:
+    cmd = [sys.executable, "serve.py", "--workers", str(workers), "--port", str(args.app_port),
+           "--host", "127.0.0.1", "--log-level", "warning"] + (["--no-preload"] if mode == "no-preload" else [])
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    try:
+        _wait_http(f"{base}/health", proc, args.startup_timeout)
+        # /health 200 ở 1 worker chưa đủ: đợi đủ N worker sẵn sàng trước khi đo bộ nhớ
+        deadline = time.monotonic() + args.startup_timeout
+        while len(_children(proc.pid)) < workers and time.monotonic() < deadline:
+            time.sleep(0.2)
+        seen = set()
+        while len(seen) < workers and time.monotonic() < deadline:
+            r = httpx.get(f"{base}/health", timeout=5)
+            if r.status_code == 200:
+                seen.add(r.json().get("worker"))
+        ready_s = time.perf_counter() - t0
+        idle = _memory(proc.pid)
+        salt = f"{int(time.time()) % 100000}w{workers}{mode[0]}"
+        load = asyncio.run(run(base, args.scenarios, args.levels, args.requests, salt, False,
+                               args.embed_images, args.timeout))
+        return {"workers": workers, "mode": mode, "ready_s": round(ready_s, 1), "memory_idle": idle,
+                "memory_after_load": _memory(proc.pid), "load": load}
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", default="1,2,4")
+    ap.add_argument("--modes", default="preload,no-preload", help=f"phẩy, trong {','.join(MODES)}")
+    ap.add_argument("--scenarios", default="scrape,embed", help=f"phẩy, trong {','.join(SCENARIOS)}")
+    ap.add_argument("--concurrency", default="16")
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--embed-images", type=int, default=8)
+    ap.add_argument("--app-port", type=int, default=8765)
+    ap.add_argument("--upstream-port", type=int, default=9100)
+    ap.add_argument("--latency-ms", type=float, default=50)
+    ap.add_argument("--page-kb", type=int, default=600)
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--startup-timeout", type=float, default=180.0)
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    args.levels = parse_levels(args.concurrency)
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    if set(modes) - set(MODES) or set(args.scenarios) - set(SCENARIOS):
+        sys.exit("unknown mode/scenario")
+
+    upstream = f"http://127.0.0.1:{args.upstream_port}"
+    base = f"http://127.0.0.1:{args.app_port}"
+    up = subprocess.Popen([sys.executable, "-m", "bench.fake_upstream", "--port", str(args.upstream_port),
+                           "--latency-ms", str(args.latency_ms), "--page-kb", str(args.page_kb)], cwd=ROOT)
+    runs = []
+    try:
+        _wait_http(f"{upstream}/__stats", up, args.startup_timeout)
+        env = app_env(upstream, True, False)
+        env["LISTING_STORE_PATH"] = ""
+        for workers in parse_levels(args.workers):
+            for mode in modes:
+                shared = tempfile.mkdtemp(prefix="bench-workers-")  # rate limit + search cache dùng chung
+                env.update({"SHARED_STATE_DIR": shared, "SEARCH_CACHE_PATH": ""})
+                try:
+                    runs.append(_one(args, workers, mode, env, base))
+                finally:
+                    shutil.rmtree(shared, ignore_errors=True)
+                print(f"workers={workers} {mode}: pss={runs[-1]['memory_idle']['total_mb']['pss']}MB "
+                      f"rss={runs[-1]['memory_idle']['total_mb']['rss']}MB", file=sys.stderr)
+    finally:
+        up.terminate()
+        up.wait(10)
+    write_report({"meta": meta(scenarios=args.scenarios, concurrency=args.levels, requests=args.requests,
+                               cpu_count=os.cpu_count()), "runs": runs}, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,69 +1,624 @@
-from typing import List
-from fastapi import FastAPI, Query, HTTPException
+from typing import Dict, List, Optional
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Query, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from app.schemas import PropertyItem, SearchResponse, EmbedRequest
-from app.utils.http import Http
-from app.scrapers import realestate_au, domain_au
-from app.scrapers.common import extract_from_jsonld
+from app.utils.http import Http, open_shared_client, close_shared_client
+from app.utils.ratelimit import limiter
+from app.utils.page_cache import page_cache
+from app.parse_pool import parse_executor, source_for
 from app import config
-from app.search import search_address
+from app.address_plan import shape_stats
+from app.search import search_address, iter_search_address
+from app.listings import fetch_listing, fetch_listings, refresh_listings, tag_listings
+from app import dedup
+from app.dedup import dedupe_listings
+from app.listing_store import listing_store
+from app.geo_index import geo_index
+from app.batch_jobs import batch_runner, parse_csv, QueueFull
+from app.search_cache import search_cache
+from app import clip_embed
+from app.photo_index import photo_index, listing_key, PHOTO_INDEX_DIR, ANN_M
+from app import photo_tags
 from fastapi import Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from app.utils import metrics
+from app.utils.metrics import log
+from app.utils import compress
+from app.utils.compress import CompressMiddleware
+from app.utils.payload import FastJSONResponse, Projection, dump_item, dump_items, dump_one, dumps, pack_vectors, \
+    parse_fields, VECTOR_DTYPE
+from app.utils.workers import is_primary, worker_count, worker_id
 from duckduckgo_search.exceptions import RatelimitException
-import asyncio
+import asyncio, base64, json, logging, time
+import numpy as np
 
+CLIP_WARMUP = bool(getattr(config, "CLIP_WARMUP", True))
+LISTINGS_STREAM_DEADLINE_S = float(getattr(config, "LISTINGS_STREAM_DEADLINE_S", 30))
+GEO_SYNC_S = float(getattr(config, "GEO_SYNC_S", 5))
 
-app = FastAPI(title="Real Estate Aggregator + CLIP", version="0.1.0")
+async def _geo_sync_loop():
+    """Nhiều worker: listing do worker khác ghi vào store được nạp dần vào geo index của worker này."""
+    since = time.time()
+    while True:
+        await asyncio.sleep(GEO_SYNC_S)
+        now = time.time()
+        try:
+            rows = await asyncio.to_thread(listing_store.geo_rows, since - 1)  # lùi 1s: ghi cùng lúc lần đọc trước
+            await asyncio.to_thread(geo_index.extend, rows)
+        except Exception as e:
+            # giữ nguyên since: lần sau đọc lại từ mốc cũ (upsert theo key nên nạp lại không bị trùng)
+            log("geo_sync_error", logging.WARNING, error=str(e)[:200])
+            continue
+        since = now
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 1 client HTTP dùng chung cho scrapers, CLIP image fetch và DDG HTML fallback
+    await open_shared_client()
+    parse_executor.start()
+    # geo index chỉ nằm trong RAM: nạp lại từ listing store
+    await asyncio.to_thread(lambda: geo_index.extend(listing_store.geo_rows()))
+    geo_sync = asyncio.create_task(_geo_sync_loop()) if worker_count() > 1 else None
+    if worker_count() > 1 and is_primary() and PHOTO_INDEX_DIR:
+        log("photo_index_per_worker", workers=worker_count(),
+            msg="photo index nằm trong RAM từng worker; chỉ worker 0 ghi ra đĩa")
+    # job batch chưa xong từ lần chạy trước được chạy tiếp (nhiều worker: chỉ worker 0, tránh chạy 2 lần)
+    await batch_runner.start(resume=is_primary())
+    # load CLIP ở background: server nhận request ngay, /health báo 503 cho tới khi model sẵn sàng
+    warm = asyncio.create_task(clip_embed.warmup()) if CLIP_WARMUP else None
+    try:
+        yield
+    finally:
+        for t in (warm, geo_sync):
+            if t is not None and not t.done():
+                t.cancel()
+        await batch_runner.stop()
+        await clip_embed.shutdown()
+        await close_shared_client()
+        parse_executor.stop()
+        if _photo_index_persist() and photo_index.dirty:
+            await asyncio.to_thread(photo_index.save, PHOTO_INDEX_DIR)
+
+
+app = FastAPI(title="Real Estate Aggregator + CLIP", version="0.1.0", lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(metrics.TraceMiddleware)
+app.add_middleware(CompressMiddleware)
+
+# gauge đọc lúc scrape, không tốn gì trên hot path
+metrics.Gauge("parse_inflight", "Pages being parsed", lambda: parse_executor.inflight)
+metrics.Gauge("parse_waiting", "Pages waiting for a parse slot", lambda: parse_executor.waiting)
+metrics.Gauge("batch_pending_addresses", "Batch addresses waiting for a worker", lambda: batch_runner.pending)
+metrics.Gauge("ratelimit_waiting", "Requests waiting for a host token", lambda: limiter.waiting)
+metrics.Gauge("clip_queue_depth", "Images waiting in the CLIP batcher",
+              lambda: (clip_embed.stats()["batcher"] or {}).get("queue_depth", 0))
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
+    clip_state = clip_embed.state()
+    if CLIP_WARMUP and clip_state["state"] != "ready":
+        return JSONResponse(status_code=503, content={"status": "starting", "clip": clip_state,
+                                                      "worker": worker_id()})
+    return {"status": "ok", "clip": clip_state, "worker": worker_id()}
+
+@app.get("/stats/ratelimit")
+async def ratelimit_stats():
+    """Trạng thái token bucket theo host: tốc độ hiện tại, độ sâu hàng đợi, thời gian chờ."""
+    return await asyncio.to_thread(limiter.stats)  # backend sqlite: stats đọc DB
+
+@app.get("/stats/search-cache")
+async def search_cache_stats():
+    return search_cache.stats()
 
-@app.get("/search", response_model=SearchResponse)
-async def search(address: str = Query(..., description="Full street address")):
-    return search_address(address)
+@app.get("/stats/search")
+async def search_stats():
+    """Planner: số lần thử / có kết quả và điểm hiện tại của từng shape biến thể địa chỉ."""
+    shapes = shape_stats.stats()
+    return {"shapes": shapes, "order": sorted(shapes, key=lambda k: -shapes[k]["score"])}
+
+@app.get("/stats/page-cache")
+async def page_cache_stats():
+    if page_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **await asyncio.to_thread(page_cache.stats)}
+
+@app.get("/stats/dedup")
+async def dedup_stats():
+    """Gộp trùng giữa các site: số listing vào/ra, gộp theo địa chỉ/ảnh, số ảnh trùng đã bỏ."""
+    return dedup.stats()
+
+@app.get("/stats/compress")
+async def compress_stats():
+    """Nén response: encoding đang bật, số response đã nén, tỉ lệ byte sau/trước."""
+    return compress.stats()
+
+@app.get("/stats/parse")
+async def parse_stats():
+    """Parse executor: số trang đang parse/chờ, thời gian parse và chờ hàng đợi để chọn số worker."""
+    return parse_executor.stats()
+
+@app.get("/search", response_model=SearchResponse, response_model_exclude_none=True)
+async def search(address: str = Query(..., description="Full street address"),
+                 explain: bool = Query(False, description="Kèm số call upstream + các query planner đã gửi")):
+    if not explain:
+        return await search_address(address)
+    report: dict = {}
+    urls = await search_address(address, report=report)
+    return {**urls, **report}
+
+_FIELDS_DOC = "Chỉ trả các field này (url,price,images) hoặc bỏ các field ('-raw,-description', 'lean')"
+
+def _projection(fields: Optional[str]) -> Projection:
+    try:
+        return parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/scrape", response_model=PropertyItem)
-async def scrape(url: str = Query(...)):
+async def scrape(background: BackgroundTasks, url: str = Query(...),
+                 fields: Optional[str] = Query(None, description=_FIELDS_DOC),
+                 index: bool = Query(False, description="Đưa ảnh của listing vào photo index"),
+                 tags: bool = Query(False, description="Gắn tag zero-shot cho ảnh (bếp, hồ bơi...) vào features")):
+    if source_for(url) is None:
+        raise HTTPException(status_code=400, detail="Unsupported domain")
+    proj = _projection(fields)
     http = Http()
     try:
-        html = await http.get_text(url)
+        item = await fetch_listing(http, url)
     finally:
         await http.close()
-
-    if "realestate.com.au" in url:
-        return realestate_au.transform(url, html)
-    if "domain.com.au" in url:
-        return domain_au.transform(url, html)
-    raise HTTPException(status_code=400, detail="Unsupported domain")
+    # vector ảnh đã tính để gắn tag -> photo index dùng lại, không embed lần 2
+    embedded = await tag_listings([item]) if tags else None
+    if index:
+        background.add_task(index_items, [item], None, embedded)
+    # pydantic ghi thẳng ra bytes, chỉ các field cần
+    return Response(dump_one(item, proj), media_type="application/json")
 
 @app.get("/listings", response_model=List[PropertyItem])
-async def listings(address: str = Query(...)):
-    urls = search_address(address)
-    tasks = []
+async def listings(background: BackgroundTasks, address: str = Query(...),
+                   fields: Optional[str] = Query(None, description=_FIELDS_DOC),
+                   index: bool = Query(False, description="Đưa ảnh của các listing vào photo index"),
+                   dedupe: bool = Query(True, description="Gộp cùng 1 căn trên realestate + domain thành 1 item"),
+                   tags: bool = Query(False, description="Gắn tag zero-shot cho ảnh (bếp, hồ bơi...) vào features")):
+    proj = _projection(fields)
+    # ảnh dedup đã tải để hash -> embed cho photo index dùng lại, khỏi tải lần 2
+    prefetched: Optional[Dict[str, bytes]] = {} if index else None
+    # gắn tag trước khi gộp trùng: tag được ghi vào listing store theo từng trang nguồn
+    embedded: Optional[Dict[str, np.ndarray]] = {} if tags else None
+    out = await fetch_listings(address, dedupe=dedupe, prefetched=prefetched, embedded=embedded)
+    if index:
+        background.add_task(index_items, out, prefetched, embedded)
+    return Response(dump_items(out, proj), media_type="application/json")
+
+async def _listing_events(address: str, deadline: float, collected: List[PropertyItem],
+                          proj: Projection = (None, None)):
+    """Sự kiện cho /listings/stream: mỗi trang parse xong -> 1 "item" (hoặc "error"), cuối cùng "done".
+
+    Trang bắt đầu tải ngay khi search trả URL của nó; hết `deadline` thì dừng, các trang chưa xong bị huỷ.
+    """
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()
+    events: asyncio.Queue = asyncio.Queue()
     http = Http()
+    fetches: set = set()
+
     async def _fetch(url: str):
         try:
-            html = await http.get_text(url)
-            if "realestate.com.au" in url:
-                return realestate_au.transform(url, html)
-            elif "domain.com.au" in url:
-                return domain_au.transform(url, html)
-        except Exception:
-            return None
-    for u in urls.get("realestate", []) + urls.get("domain", []):
-        tasks.append(asyncio.create_task(_fetch(u)))
-    out = [x for x in await asyncio.gather(*tasks) if x is not None]
-    await http.close()
-    return out
-
-from app.clip_embed import embed_image_urls  # noqa: E402
+            await events.put({"type": "item", "item": await fetch_listing(http, url)})
+        except Exception as e:
+            await events.put({"type": "error", "url": url, "reason": f"{type(e).__name__}: {(str(e).splitlines() or [''])[0]}"})
+
+    async def _discover():
+        try:
+            async for _, url in iter_search_address(address):
+                if source_for(url) is not None:
+                    fetches.add(asyncio.create_task(_fetch(url)))
+            await asyncio.gather(*fetches)
+        except Exception as e:
+            await events.put({"type": "error", "url": None, "reason": f"search: {type(e).__name__}: {e}"})
+        finally:
+            await events.put(None)
+
+    discover = asyncio.create_task(_discover())
+    partial = False
+    try:
+        while True:
+            remaining = t0 + deadline - loop.time()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                ev = await asyncio.wait_for(events.get(), remaining)
+            except asyncio.TimeoutError:
+                partial = True
+                break
+            if ev is None:
+                break
+            if ev["type"] == "item":
+                collected.append(ev["item"])
+                ev = {"type": "item", "item": dump_item(ev["item"], proj)}
+            yield ev
+        yield {"type": "done", "count": len(collected), "partial": partial,
+               "pending": sum(1 for t in fetches if not t.done()),
+               "elapsed_ms": round(1000 * (loop.time() - t0), 1)}
+    finally:
+        # client ngắt hoặc hết deadline: huỷ search + các trang đang tải
+        for t in [discover, *fetches]:
+            t.cancel()
+        await asyncio.gather(discover, *fetches, return_exceptions=True)
+        await http.close()
+
+@app.get("/listings/stream")
+async def listings_stream(background: BackgroundTasks, address: str = Query(...),
+                          format: str = Query("ndjson", pattern="^(ndjson|sse)$", description="ndjson | sse"),
+                          deadline: float = Query(LISTINGS_STREAM_DEADLINE_S, gt=0, le=300,
+                                                  description="Giây; hết hạn thì trả phần đã có"),
+                          index: bool = Query(False, description="Đưa ảnh của các listing vào photo index"),
+                          fields: Optional[str] = Query(None, description=_FIELDS_DOC)):
+    """Như /listings nhưng stream từng PropertyItem ngay khi trang của nó parse xong."""
+    collected: List[PropertyItem] = []
+    proj = _projection(fields)
+
+    async def _body():
+        async for ev in _listing_events(address, deadline, collected, proj):
+            data = dumps(ev)
+            yield b"event: %s\ndata: %s\n\n" % (ev["type"].encode(), data) if format == "sse" else data + b"\n"
+
+    if index:
+        # chạy sau khi stream xong, với các item đã gửi (gộp trùng trước để mỗi ảnh chỉ embed 1 lần)
+        background.add_task(_dedupe_and_index, collected)
+    media = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(_body(), media_type=media, headers={"Cache-Control": "no-cache"})
+
+# ---- Batch: nhiều địa chỉ / 1 job ------------------------------------------
+@app.post("/batch/listings", status_code=202)
+async def batch_listings(request: Request):
+    """Nhận {"addresses": [...]} (JSON), CSV thô (text/csv) hoặc file CSV upload (multipart, field "file")."""
+    ctype = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    try:
+        if ctype == "application/json":
+            body = await request.json()
+            addresses = body if isinstance(body, list) else (body or {}).get("addresses", [])
+        elif ctype == "multipart/form-data":
+            upload = (await request.form()).get("file")
+            if upload is None or isinstance(upload, str):
+                raise HTTPException(status_code=400, detail='multipart body needs a "file" field')
+            addresses = parse_csv((await upload.read()).decode("utf-8-sig", errors="replace"))
+        else:
+            addresses = parse_csv((await request.body()).decode("utf-8-sig", errors="replace"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid request body")
+    addresses = [a.strip() for a in addresses if isinstance(a, str) and a.strip()]
+    if not addresses:
+        raise HTTPException(status_code=400, detail="No addresses")
+    try:
+        job_id = await batch_runner.submit(addresses)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"job_id": job_id, "total": len(addresses), "status": "queued",
+            "stream": f"/batch/listings/{job_id}/stream"}
+
+@app.get("/batch/listings/{job_id}")
+async def batch_job(job_id: str, results: bool = Query(True, description="Kèm kết quả các địa chỉ đã xong")):
+    job = await asyncio.to_thread(batch_runner.store.job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if results:
+        job["results"] = await asyncio.to_thread(batch_runner.store.results, job_id)
+    return job
+
+_BATCH_STREAM_POLL_S = 1.0
+
+@app.get("/batch/listings/{job_id}/stream")
+async def batch_job_stream(job_id: str):
+    """NDJSON: trạng thái job, các kết quả đã có, rồi từng kết quả mới tới khi job xong.
+
+    Sự kiện live chỉ có khi job chạy ở chính worker này; nhiều worker (serve.py) thì job có thể chạy ở
+    worker khác, nên lúc chờ vẫn đọc lại job store (SQLite chung) mỗi _BATCH_STREAM_POLL_S giây.
+    """
+    live = batch_runner.subscribe(job_id)  # đăng ký trước khi đọc DB để không lỡ kết quả nào
+    job = await asyncio.to_thread(batch_runner.store.job, job_id)
+    if job is None:
+        batch_runner.unsubscribe(job_id, live)
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def _body():
+        try:
+            yield json.dumps({"type": "job", **job}, ensure_ascii=False) + "\n"
+            sent = set()
+            for r in await asyncio.to_thread(batch_runner.store.results, job_id):
+                sent.add(r["index"])
+                yield json.dumps({"type": "result", **r}, ensure_ascii=False) + "\n"
+            if job["status"] in ("done", "cancelled"):
+                return
+            while True:
+                try:
+                    ev = await asyncio.wait_for(live.get(), _BATCH_STREAM_POLL_S)
+                except asyncio.TimeoutError:
+                    # đọc job trước kết quả: "done" chỉ ghi sau kết quả cuối nên không lỡ dòng nào
+                    cur = await asyncio.to_thread(batch_runner.store.job, job_id)
+                    for r in await asyncio.to_thread(batch_runner.store.new_results, job_id, sent):
+                        sent.add(r["index"])
+                        yield json.dumps({"type": "result", **r}, ensure_ascii=False) + "\n"
+                    if cur is None or cur["status"] in ("done", "cancelled"):
+                        status = cur["status"] if cur else "cancelled"
+                        yield json.dumps({"type": "job", "status": status}, ensure_ascii=False) + "\n"
+                        break
+                    continue
+                if ev is None:
+                    break
+                if ev["type"] == "result":
+                    if ev["index"] in sent:
+                        continue
+                    sent.add(ev["index"])
+                yield json.dumps(ev, ensure_ascii=False) + "\n"
+        finally:
+            batch_runner.unsubscribe(job_id, live)
+
+    return StreamingResponse(_body(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache"})
+
+@app.delete("/batch/listings/{job_id}")
+async def batch_job_cancel(job_id: str):
+    if not await batch_runner.cancel(job_id):
+        raise HTTPException(status_code=404, detail="Job not found or already finished")
+    return {"job_id": job_id, "status": "cancelled"}
+
+@app.get("/stats/batch")
+async def batch_stats():
+    return batch_runner.stats()
+
+from app.clip_embed import embed_images, embed_texts  # noqa: E402
+
+@app.get("/stats/clip")
+async def clip_stats():
+    """Micro-batching CLIP: độ sâu hàng đợi, phân bố batch size, thời gian chờ/forward."""
+    return clip_embed.stats()
 
 @app.post("/embed")
-async def embed(req: EmbedRequest):
-    vecs = await embed_image_urls(req.image_urls)
-    return {"vectors": vecs, "dim": (len(vecs[0]) if vecs and vecs[0] else 0)}
+async def embed(req: EmbedRequest, request: Request,
+                format: str = Query("json", pattern="^(json|base64|binary)$",
+                                    description="json | base64 (float16) | binary (float16, application/octet-stream)")):
+    """Vector ảnh. json: list float; base64/binary: ma trận (N, dim) float16 little-endian, ảnh lỗi = dòng 0.
+
+    `Accept: application/octet-stream` cũng chọn binary; shape ở header X-Embedding-Shape.
+    """
+    results = await embed_images(req.image_urls)
+    errors = [{"index": i, "url": r.url, "reason": r.error} for i, r in enumerate(results) if r.error]
+    dim = next((len(r.vector) for r in results if r.vector is not None), 0)
+    if format == "json" and "application/octet-stream" in request.headers.get("accept", ""):
+        format = "binary"
+    if format == "json":
+        # orjson ghi thẳng ndarray, không qua .tolist()
+        vecs = [r.vector if r.vector is not None else [] for r in results]
+        return FastJSONResponse({"vectors": vecs, "dim": dim, "errors": errors})
+    mat = pack_vectors([r.vector for r in results], dim)
+    if format == "base64":
+        return FastJSONResponse({"vectors_b64": base64.b64encode(mat.tobytes()).decode(), "dtype": VECTOR_DTYPE,
+                                 "shape": list(mat.shape), "dim": dim, "errors": errors})
+    headers = {"X-Embedding-Shape": f"{mat.shape[0]},{dim}", "X-Embedding-Dtype": VECTOR_DTYPE,
+               "X-Embedding-Errors": ",".join(str(e["index"]) for e in errors)}
+    return Response(mat.tobytes(), media_type="application/octet-stream", headers=headers)
+
+
+# ---- Photo index: tìm listing theo text / ảnh -------------------------------
+_PHOTO_INDEX_SAVE_EVERY_S = 60.0
+_photo_index_saved_at = 0.0
+
+def _photo_index_persist() -> bool:
+    """Photo index nằm trong RAM từng worker: nhiều worker thì chỉ worker 0 ghi ra đĩa, tránh ghi đè lẫn nhau."""
+    return bool(PHOTO_INDEX_DIR) and is_primary()
+
+async def index_items(items: List[PropertyItem], prefetched: Optional[Dict[str, bytes]] = None,
+                      embedded: Optional[Dict[str, np.ndarray]] = None) -> dict:
+    """Embed ảnh của các listing (qua cache vector) rồi ghi vào photo index.
+
+    Ảnh đã có trong index thì giữ vector cũ: listing refresh lại chỉ tốn embed cho ảnh mới.
+    `prefetched`: bytes ảnh đã tải (từ bước dedup), URL -> bytes.
+    `embedded`: vector đã tính (từ bước gắn tag), URL -> vector.
+    """
+    global _photo_index_saved_at
+    added = images = 0
+    for item in items:
+        if not item.images:
+            continue
+        listing = item.model_dump()
+        known = await asyncio.to_thread(photo_index.indexed_images, listing)
+        keep = [u for u in item.images if u in known]
+        todo = [u for u in item.images if u not in known]
+        results = [(u, embedded[u]) for u in todo if embedded and u in embedded]
+        todo = [u for u in todo if not embedded or u not in embedded]
+        if todo:
+            results += [(r.url, r.vector) for r in await embed_images(todo, prefetched) if r.vector is not None]
+        if not results and not keep:
+            continue
+        added += await asyncio.to_thread(
+            photo_index.add, listing, [u for u, _ in results], [v for _, v in results], keep
+        )
+        images += len(results)
+    now = asyncio.get_running_loop().time()
+    if _photo_index_persist() and photo_index.dirty and now - _photo_index_saved_at > _PHOTO_INDEX_SAVE_EVERY_S:
+        _photo_index_saved_at = now
+        await asyncio.to_thread(photo_index.save, PHOTO_INDEX_DIR)
+    return {"listings": len(items), "images": images, "added": added}
+
+async def _dedupe_and_index(items: List[PropertyItem]) -> dict:
+    prefetched: Dict[str, bytes] = {}
+    http = Http()
+    try:
+        items = await dedupe_listings(items, http, prefetched)
+    finally:
+        await http.close()
+    return await index_items(items, prefetched)
+
+@app.get("/stats/tags")
+async def tags_stats():
+    """Gắn tag zero-shot: bộ nhãn, ngưỡng, số listing/ảnh đã chấm, số lần phải encode lại bộ nhãn."""
+    return photo_tags.stats()
+
+@app.post("/index/listings")
+async def index_listings(items: List[PropertyItem]):
+    return await index_items(items)
+
+@app.delete("/index/listings/{source}/{listing_id}")
+async def index_delete(source: str, listing_id: str):
+    removed = await asyncio.to_thread(photo_index.delete_listing, listing_key(source, listing_id, ""))
+    if not removed:
+        raise HTTPException(status_code=404, detail="Listing not in index")
+    return {"removed": removed}
+
+def _search_kwargs(by_listing: bool, source: Optional[str], min_bedrooms: Optional[float],
+                   max_bedrooms: Optional[float], exact: bool, nprobe: Optional[int], rerank: Optional[int]) -> dict:
+    kw = dict(by_listing=by_listing, source=source, min_bedrooms=min_bedrooms, max_bedrooms=max_bedrooms, exact=exact)
+    if nprobe is not None:
+        kw["nprobe"] = nprobe
+    if rerank is not None:
+        kw["rerank"] = rerank
+    return kw
+
+@app.get("/index/search")
+async def index_search(q: str = Query(..., description="Mô tả bằng text, vd. 'modern kitchen with island'"),
+                       k: int = Query(10, ge=1, le=200),
+                       by_listing: bool = Query(True, description="Gom điểm ảnh theo listing"),
+                       source: Optional[str] = Query(None, description="realestate | domain"),
+                       min_bedrooms: Optional[float] = Query(None),
+                       max_bedrooms: Optional[float] = Query(None),
+                       exact: bool = Query(False, description="Bỏ qua ANN, quét toàn bộ"),
+                       nprobe: Optional[int] = Query(None, ge=1, description="ANN: số list duyệt"),
+                       rerank: Optional[int] = Query(None, ge=0, description="ANN: số ứng viên chấm lại bằng vector gốc")):
+    qv = (await embed_texts([q]))[0]
+    kw = _search_kwargs(by_listing, source, min_bedrooms, max_bedrooms, exact, nprobe, rerank)
+    return {"results": await asyncio.to_thread(photo_index.search, qv, k, **kw)}
+
+@app.get("/index/search/image")
+async def index_search_image(url: str = Query(..., description="URL ảnh truy vấn"),
+                             k: int = Query(10, ge=1, le=200),
+                             by_listing: bool = Query(True),
+                             source: Optional[str] = Query(None),
+                             min_bedrooms: Optional[float] = Query(None),
+                             max_bedrooms: Optional[float] = Query(None),
+                             exact: bool = Query(False),
+                             nprobe: Optional[int] = Query(None, ge=1),
+                             rerank: Optional[int] = Query(None, ge=0)):
+    r = (await embed_images([url]))[0]
+    if r.vector is None:
+        raise HTTPException(status_code=422, detail=r.error or "Cannot embed image")
+    kw = _search_kwargs(by_listing, source, min_bedrooms, max_bedrooms, exact, nprobe, rerank)
+    hits = await asyncio.to_thread(photo_index.search, r.vector, k, exclude_images=[url], **kw)
+    return {"results": hits}
+
+@app.post("/index/ann/build")
+async def index_ann_build(nlist: int = Query(0, ge=0, description="0 = tự chọn ~4·sqrt(N)"),
+                          m: int = Query(ANN_M, ge=1, description="số sub-quantizer PQ (dim phải chia hết)")):
+    try:
+        return await asyncio.to_thread(photo_index.build_ann, nlist, m)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/stats/index")
+async def index_stats():
+    return photo_index.stats()
+
+
+# ---- Listing store: listing đã scrape + lịch sử thay đổi ----------------------
+@app.get("/store/listings")
+async def store_listings(address: Optional[str] = Query(None, description="Khớp tiền tố địa chỉ (đã chuẩn hoá)"),
+                         min_lat: Optional[float] = Query(None), min_lon: Optional[float] = Query(None),
+                         max_lat: Optional[float] = Query(None), max_lon: Optional[float] = Query(None),
+                         changed_since: Optional[float] = Query(None, description="Epoch giây"),
+                         limit: int = Query(100, ge=1, le=1000)):
+    box = (min_lat, min_lon, max_lat, max_lon)
+    if any(v is not None for v in box) and any(v is None for v in box):
+        raise HTTPException(status_code=400, detail="Bounding box needs min_lat, min_lon, max_lat and max_lon")
+    bbox = box if box[0] is not None else None
+    return {"results": await asyncio.to_thread(listing_store.find, address=address, bbox=bbox,
+                                               changed_since=changed_since, limit=limit)}
+
+@app.get("/store/listings/{source}/{listing_id}")
+async def store_listing(source: str, listing_id: str,
+                        history: bool = Query(True, description="Kèm lịch sử thay đổi")):
+    item = await asyncio.to_thread(listing_store.get, source, listing_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Listing not in store")
+    if history:
+        item["history"] = await asyncio.to_thread(listing_store.history, source, listing_id)
+    return item
+
+@app.get("/store/listings/{source}/{listing_id}/history")
+async def store_listing_history(source: str, listing_id: str,
+                                field: Optional[str] = Query(None, description="vd. price"),
+                                limit: int = Query(200, ge=1, le=5000)):
+    return {"history": await asyncio.to_thread(listing_store.history, source, listing_id, field, limit)}
+
+@app.get("/store/changes")
+async def store_changes(since: Optional[float] = Query(None, description="Epoch giây; mặc định 24 giờ trước"),
+                        field: Optional[str] = Query(None, description="vd. price"),
+                        limit: int = Query(500, ge=1, le=5000)):
+    since = time.time() - 86400 if since is None else since
+    return {"since": since, "changes": await asyncio.to_thread(listing_store.changes_since, since, field, limit)}
+
+@app.post("/store/refresh")
+async def store_refresh(background: BackgroundTasks,
+                        older_than_s: float = Query(3600, ge=0, description="Chỉ listing chưa kiểm tra trong N giây"),
+                        limit: int = Query(200, ge=1, le=5000),
+                        index: bool = Query(False, description="Embed ảnh mới của listing mới/đổi vào photo index")):
+    """Kiểm tra lại listing trong store: trang không đổi thì khỏi parse, chỉ listing đổi mới ghi lịch sử."""
+    stats, changed = await refresh_listings(older_than_s, limit)
+    if index and changed:
+        background.add_task(index_items, changed)
+    return {**stats, "updated": [{"source": it.source, "listing_id": it.listing_id, "change": it.change}
+                                 for it in changed]}
+
+@app.get("/stats/store")
+async def store_stats():
+    return await asyncio.to_thread(listing_store.stats)
+
+
+# ---- Geo: listing quanh 1 điểm / trong khung ---------------------------------
+def _geo_filters(min_bedrooms, max_bedrooms, min_bathrooms, max_bathrooms, min_parking, max_parking,
+                 min_price, max_price) -> dict:
+    return dict(min_bedrooms=min_bedrooms, max_bedrooms=max_bedrooms, min_bathrooms=min_bathrooms,
+                max_bathrooms=max_bathrooms, min_parking=min_parking, max_parking=max_parking,
+                min_price=min_price, max_price=max_price)
+
+@app.get("/nearby")
+async def nearby(lat: float = Query(..., ge=-90, le=90), lon: float = Query(..., ge=-180, le=180),
+                 radius_km: float = Query(2.0, gt=0, le=200),
+                 limit: int = Query(100, ge=1, le=5000),
+                 min_bedrooms: Optional[float] = Query(None), max_bedrooms: Optional[float] = Query(None),
+                 min_bathrooms: Optional[float] = Query(None), max_bathrooms: Optional[float] = Query(None),
+                 min_parking: Optional[float] = Query(None), max_parking: Optional[float] = Query(None),
+                 min_price: Optional[float] = Query(None, description="Giá (AUD); so với khoảng giá của listing"),
+                 max_price: Optional[float] = Query(None)):
+    """Listing đã scrape trong bán kính `radius_km` quanh (lat, lon), gần nhất trước."""
+    t0 = time.perf_counter()
+    kw = _geo_filters(min_bedrooms, max_bedrooms, min_bathrooms, max_bathrooms, min_parking, max_parking,
+                      min_price, max_price)
+    hits = geo_index.nearby(lat, lon, radius_km, limit, **kw)
+    return {"results": hits, "took_ms": round(1000 * (time.perf_counter() - t0), 3)}
+
+@app.get("/nearby/bbox")
+async def nearby_bbox(min_lat: float = Query(..., ge=-90, le=90), min_lon: float = Query(..., ge=-180, le=180),
+                      max_lat: float = Query(..., ge=-90, le=90), max_lon: float = Query(..., ge=-180, le=180),
+                      limit: int = Query(100, ge=1, le=5000),
+                      min_bedrooms: Optional[float] = Query(None), max_bedrooms: Optional[float] = Query(None),
+                      min_bathrooms: Optional[float] = Query(None), max_bathrooms: Optional[float] = Query(None),
+                      min_parking: Optional[float] = Query(None), max_parking: Optional[float] = Query(None),
+                      min_price: Optional[float] = Query(None), max_price: Optional[float] = Query(None)):
+    if min_lat > max_lat or min_lon > max_lon:
+        raise HTTPException(status_code=400, detail="min_lat/min_lon must not exceed max_lat/max_lon")
+    t0 = time.perf_counter()
+    kw = _geo_filters(min_bedrooms, max_bedrooms, min_bathrooms, max_bathrooms, min_parking, max_parking,
+                      min_price, max_price)
+    hits = geo_index.bbox(min_lat, min_lon, max_lat, max_lon, limit, **kw)
+    return {"results": hits, "took_ms": round(1000 * (time.perf_counter() - t0), 3)}
+
+@app.get("/stats/geo")
+async def geo_stats():
+    return geo_index.stats()
 
 
 @app.exception_handler(RatelimitException)
@@ -0,0 +1,147 @@
+"""Chạy API với nhiều worker process; weights CLIP load 1 lần trong master rồi fork.
+
+    python serve.py --workers 4 --port 8000
+
+`uvicorn --workers N` spawn từng worker từ đầu nên mỗi worker tự load weights CLIP (ViT-B/32 fp32
+~350 MB / worker). Ở đây master load weights (1 thread, không chạy forward pass) rồi fork: các worker
+dùng chung trang nhớ của weights (copy-on-write, suy luận không ghi vào weights).
+
+Master không import main / app.* có mở SQLite lúc import (listing store, search cache, page cache,
+batch job store): mỗi worker import sau khi fork để có connection riêng. Trạng thái dùng chung:
+- token bucket theo host: RATELIMIT_BACKEND=sqlite (tự bật khi WORKERS > 1)
+- search cache: SEARCH_CACHE_PATH trong SHARED_STATE_DIR nếu đang để trống; single-flight vẫn theo worker
+- embed cache, listing store, batch job store: file SQLite chung như khi chạy 1 worker
+- geo index: mỗi worker nạp listing worker khác ghi vào store mỗi GEO_SYNC_S giây
+- photo index: RAM riêng từng worker, chỉ worker 0 ghi ra đĩa
+"""
+import argparse, gc, os, signal, socket, sys, time, traceback
+from dotenv import load_dotenv
+
+_QUICK_EXIT_S = 10.0  # worker chết trong 10s đầu -> lỗi cấu hình, không restart vòng lặp
+
+
+def _log(ev: str, **kw):
+    print(" ".join([f"serve: {ev}"] + [f"{k}={v}" for k, v in kw.items()]), file=sys.stderr, flush=True)
+
+
+def _shared_env(workers: int):
+    """Mặc định cho trạng thái dùng chung; biến đã đặt (env / .env) thì giữ nguyên."""
+    os.environ["WORKERS"] = str(workers)
+    if workers <= 1:
+        return
+    shared = os.environ["SHARED_STATE_DIR"] = os.environ.get("SHARED_STATE_DIR") or ".cache/shared"
+    os.makedirs(shared, exist_ok=True)
+    if not os.environ.get("RATELIMIT_BACKEND"):
+        os.environ["RATELIMIT_BACKEND"] = "sqlite"
+    if not os.environ.get("SEARCH_CACHE_PATH"):
+        os.environ["SEARCH_CACHE_PATH"] = os.path.join(shared, "search.sqlite3")
+
+
+def _preimport():
+    """Thư viện nặng import 1 lần trong master: các worker dùng chung trang nhớ code/module."""
+    for name in ("numpy", "PIL.Image", "httpx", "fastapi", "pydantic", "bs4", "lxml.html", "orjson",
+                 "duckduckgo_search", "uvicorn"):
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+
+
+def _preload():
+    from app import config
+    from app.clip_runtime import preload, CLIP_RUNTIME
+    t0 = time.perf_counter()
+    preload(config.CLIP_MODEL, CLIP_RUNTIME)
+    _log("preloaded", model=config.CLIP_MODEL, runtime=CLIP_RUNTIME, took_s=round(time.perf_counter() - t0, 1))
+
+
+def _worker(i: int, sock: socket.socket, args):
+    os.setpgid(0, 0)  # Ctrl-C chỉ tới master, master báo lại cho worker
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    os.environ["WORKER_ID"] = str(i)
+    import uvicorn
+    from main import app
+    server = uvicorn.Server(uvicorn.Config(app, log_level=args.log_level, timeout_graceful_shutdown=args.graceful_s))
+    server.run(sockets=[sock])
+
+
+def main():
+    load_dotenv()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=int(os.getenv("WORKERS", "1")))
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--no-preload", action="store_true", help="mỗi worker tự load CLIP (như uvicorn --workers)")
+    ap.add_argument("--log-level", default="info")
+    ap.add_argument("--graceful-s", type=int, default=30)
+    args = ap.parse_args()
+
+    _shared_env(args.workers)
+    _preimport()
+    if not args.no_preload:
+        _preload()
+    # object tạo tới đây sống suốt đời process: không để GC của worker chạm vào (tránh copy trang nhớ)
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.socket(socket.AF_INET6 if ":" in args.host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    children = {}  # pid -> (worker id, thời điểm start)
+    stopping = False
+
+    def spawn(i: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _worker(i, sock, args)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = (i, time.monotonic())
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for i in range(args.workers):
+        spawn(i)
+    _log("started", workers=args.workers, pid=os.getpid(), bind=f"{args.host}:{args.port}")
+
+    code = 0
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        i, started = children.pop(pid)
+        if stopping:
+            continue
+        rc = os.waitstatus_to_exitcode(status)
+        if time.monotonic() - started < _QUICK_EXIT_S:
+            _log("worker_failed", worker=i, exit=rc)
+            code = 1
+            stop(None, None)
+            continue
+        _log("worker_restart", worker=i, exit=rc)
+        spawn(i)
+    sock.close()
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+"""Chạy test không đụng cache/DB trên đĩa: tắt mọi đường dẫn trước khi import app.*."""
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for _name in ("PAGE_CACHE_DIR", "EMBED_CACHE_DIR", "SEARCH_CACHE_PATH", "BATCH_DB_PATH", "LISTING_STORE_PATH",
+              "PHOTO_INDEX_DIR", "SEARCH_SHAPE_STATS_PATH", "TAG_CACHE_DIR", "PROXY_URL"):
+    os.environ[_name] = ""
+os.environ["CLIP_WARMUP"] = "0"
@@ -0,0 +1,53 @@
+import pytest
+from app.address_plan import ShapeStats, parse_address, plan_queries
+
+
+@pytest.mark.parametrize("text, unit, number, street, street_type, suburb, state, postcode", [
+    ("107/131 George Street, Brisbane City QLD 4000", "107", "131", "George", "St", "Brisbane City", "QLD", "4000"),
+    ("45 Bay View Tce Claremont WA 6010", None, "45", "Bay View", "Tce", "Claremont", "WA", "6010"),
+    ("22 Mount View Rd Mount Evelyn VIC 3796", None, "22", "Mount View", "Rd", "Mount Evelyn", "VIC", "3796"),
+    ("Unit 4 18 Ocean View Parade Coolum Beach QLD 4573", "4", "18", "Ocean View", "Pde", "Coolum Beach", "QLD",
+     "4573"),
+    ("12 Smith St Fairfield Heights NSW 2165", None, "12", "Smith", "St", "Fairfield Heights", "NSW", "2165"),
+    ("5 Acland St St Kilda VIC 3182", None, "5", "Acland", "St", "St Kilda", "VIC", "3182"),
+    ("9 The Esplanade, St Kilda VIC 3182", None, "9", "The", "Esp", "St Kilda", "VIC", "3182"),
+    ("14 Grove Street Eltham VIC 3095, Australia", None, "14", "Grove", "St", "Eltham", "VIC", "3095"),
+    ("3/27-29 Park Lane Way Perth WA 6000", "3", "27-29", "Park Lane", "Way", "Perth", "WA", "6000"),
+])
+def test_parse_address(text, unit, number, street, street_type, suburb, state, postcode):
+    a = parse_address(text)
+    assert (a.unit, a.number, a.street, a.street_type, a.suburb, a.state, a.postcode) == \
+        (unit, number, street, street_type, suburb, state, postcode)
+
+
+def test_parse_address_partial():
+    a = parse_address("Bay View Terrace")
+    assert (a.number, a.street, a.street_type, a.suburb) == (None, "Bay View", "Tce", None)
+    assert parse_address("").canonical == ""
+
+
+def test_plan_queries_specific_first():
+    plan = plan_queries("Unit 2, 45 Bay View Terrace, Claremont WA 6010", ShapeStats(path=""))
+    assert plan[0] == ("full", "2/45 Bay View Tce Claremont WA 6010")
+    assert dict(plan)["no_unit"] == "45 Bay View Tce Claremont WA 6010"
+    assert dict(plan)["street_suburb"] == "45 Bay View Tce Claremont"
+    assert [s for s, _ in plan][-1] == "street_no_number"
+    assert len({q.lower() for _, q in plan}) == len(plan)
+
+
+def test_plan_queries_skips_missing_parts():
+    plan = dict(plan_queries("131 George St Brisbane City QLD 4000", ShapeStats(path="")))
+    assert "no_unit" not in plan  # không có unit -> trùng "full", bỏ
+    assert plan["full"] == "131 George St Brisbane City QLD 4000"
+    assert plan["no_postcode"] == "131 George St Brisbane City QLD"
+
+
+def test_plan_queries_reorders_by_hit_rate():
+    stats = ShapeStats(path="")
+    for _ in range(50):
+        stats.record("full", False)
+        stats.record("street_suburb", True)
+    plan = plan_queries("45 Bay View Terrace, Claremont WA 6010", stats)
+    shapes = [s for s, _ in plan]
+    assert shapes[0] == "street_suburb"
+    assert shapes.index("full") > shapes.index("raw")
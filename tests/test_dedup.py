@@ -0,0 +1,87 @@
+import asyncio, io, random
+from PIL import Image, ImageDraw, ImageFilter
+from app.dedup import dedupe_listings
+from app.schemas import PropertyItem
+
+
+def _photo(seed: int) -> bytes:
+    rng = random.Random(seed)
+    img = Image.new("RGB", (640, 480), tuple(rng.randint(0, 255) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x, y = rng.randint(0, 640), rng.randint(0, 480)
+        draw.rectangle([x, y, x + rng.randint(40, 300), y + rng.randint(40, 200)],
+                       fill=tuple(rng.randint(0, 255) for _ in range(3)))
+    buf = io.BytesIO()
+    img.filter(ImageFilter.GaussianBlur(3)).save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+# ảnh chung của toà nhà (sảnh, hồ bơi, mặt tiền) + ảnh riêng từng căn
+_SHARED = {f"https://img.test/building/{k}.jpg": _photo(k) for k in range(3)}
+
+
+def _item(source: str, n: int, address: str, own: int) -> PropertyItem:
+    own_urls = {f"https://img.test/{source}/{n}/{k}.jpg": _photo(1000 * own + k) for k in range(3)}
+    _SHARED.update(own_urls)
+    return PropertyItem(source=source, url=f"https://{source}.test/{n}", address=address,
+                        latitude=-33.8688, longitude=151.2093, images=list(own_urls) + list(_SHARED)[:3])
+
+
+def _dedupe(items):
+    return asyncio.run(dedupe_listings(items, None, dict(_SHARED)))
+
+
+def test_two_units_same_building_same_source_not_merged():
+    items = [_item("realestate", 1, "3/5 George St, Sydney NSW 2000", own=1),
+             _item("realestate", 2, "4/5 George St, Sydney NSW 2000", own=2)]
+    assert len(_dedupe(items)) == 2
+
+
+def test_two_units_same_building_cross_source_not_merged():
+    items = [_item("realestate", 1, "3/5 George St, Sydney NSW 2000", own=1),
+             _item("domain", 2, "Unit 4, 5 George Street, Sydney NSW 2000", own=2)]
+    assert len(_dedupe(items)) == 2
+
+
+def test_hidden_address_cross_source_merged_by_photos():
+    items = [_item("realestate", 1, "3/5 George St, Sydney NSW 2000", own=1),
+             _item("domain", 2, "Address available on request", own=1)]
+    out = _dedupe(items)
+    assert len(out) == 1
+    assert sorted(out[0].source_urls) == ["https://domain.test/2", "https://realestate.test/1"]
+
+
+def test_same_address_written_differently_merged():
+    items = [_item("realestate", 1, "3/5 George St, Sydney NSW 2000", own=1),
+             _item("domain", 2, "Unit 3, 5 George Street, Sydney NSW 2000", own=7)]
+    assert len(_dedupe(items)) == 1
+
+
+def test_address_merged_group_downloads_no_photos():
+    items = [_item("realestate", 1, "3/5 George St, Sydney NSW 2000", own=1),
+             _item("domain", 2, "Unit 3, 5 George Street, Sydney NSW 2000", own=7)]
+    prefetched = {}
+    out = asyncio.run(dedupe_listings(items, None, prefetched))  # http=None: tải ảnh nào là lỗi
+    assert len(out) == 1 and prefetched == {}
+    assert len(out[0].images) == len(set(items[0].images) | set(items[1].images))
+
+
+def test_same_source_same_address_merged_only_for_same_listing_id():
+    relisted = [_item("realestate", 1, "3/5 George St, Sydney NSW 2000", own=1),
+                _item("realestate", 2, "3/5 George St, Sydney NSW 2000", own=2)]
+    assert len(_dedupe(relisted)) == 2
+    again = relisted[0].model_copy(update={"url": "https://realestate.test/1?utm=x", "listing_id": "1"})
+    first = relisted[0].model_copy(update={"listing_id": "1"})
+    assert len(_dedupe([first, again])) == 1
+
+
+def test_hidden_address_does_not_bridge_two_units():
+    # listing giấu địa chỉ dùng ảnh chung toà nhà + ảnh riêng của cả căn 3 lẫn căn 4
+    unit3 = _item("realestate", 1, "3/5 George St, Sydney NSW 2000", own=1)
+    unit4 = _item("realestate", 2, "4/5 George St, Sydney NSW 2000", own=2)
+    hidden = _item("domain", 3, "Address available on request", own=3)
+    hidden = hidden.model_copy(update={"images": unit3.images[:2] + unit4.images[:2]})
+    out = _dedupe([unit3, unit4, hidden])
+    assert len(out) == 2
+    assert not any({unit3.url, unit4.url} <= set(x.source_urls) for x in out)
@@ -0,0 +1,148 @@
+import random
+import pytest
+from bench.fake_upstream import listing_html, listing_url
+from app.scrapers import common, domain_au, realestate_au
+from app.scrapers.common import _parse_jsonld_blocks_bs4
+from app.scrapers.jsonld import parse_jsonld_blocks
+
+# corpus đối chiếu với bs4: các chỗ tokenizer HTML5 dễ lệch (raw text, comment, attr, script escape)
+
+S = '<script type="application/ld+json">{"a":1}</script>'
+T = '<script type="application/ld+json">{"a":2}</script>'
+L = '<script type="application/ld+json">'
+_WRAPPERS = ["title", "textarea", "xmp", "iframe", "noscript", "noembed", "noframes", "style", "div", "template",
+             "svg", "math", "select", "option", "textArea", "TITLE"]
+CASES = {f"in_{t}": f"<html><head><{t}>{S}</{t}></head><body>{T}</body></html>" for t in _WRAPPERS}
+CASES.update({
+    "plaintext": f"<body><plaintext>{S}</body>",
+    "attr": f"""<body><div data-x="<script type='application/ld+json'>{{}}</script>">{T}</div></body>""",
+    "attr_single": f"""<body><div data-x='{S}'>x</div></body>""",
+    "attr_unquoted_lt": """<body><div data-x=<script type=application/ld+json>{"a":3}</script></body>""",
+    "comment_in_script": '<script type="application/ld+json"><!-- {"a":1} --></script>',
+    "cdata": f'<body><![CDATA[{S}]]></body>',
+    "bogus_comment": f'<body><!x {S} ></body>',
+    "pi": f'<body><? {S} ?></body>',
+    "title_unclosed": f'<title>hello {S}',
+    "end_tag_attr": f'<body></div x="{S}"></body>',
+    "end_tag_quoted_gt": f'<body></div x="a>b">{S}</body>',
+    "end_tag_quoted_gt2": f'<body></div x="a>{S}">{T}</body>',
+    "unclosed_comment": f'<body><!-- {S}',
+    "unclosed_comment2": f'<body><!-- x {S} -- > {T}',
+    "comment_bang": f'<body><!-- x --!> {S} --> {T}',
+    "lt_space": f'<body>< div {S}</body>',
+    "lt_slash_space": f'<body></ div>{S}</body>',
+    "lt_slash_digit": f'<body></3 {S} > {T}</body>',
+    "start_quote_gt": f"<body><div a='x>' {S}>{T}</body>",
+    "start_unclosed_quote": f'<body><div a="x>{S}{T}</body>',
+    "doctype": f'<!DOCTYPE html>{S}',
+    "bang_quote": f'<body><!x a=">" {S}>{T}</body>',
+    "pi_quote": f'<body><?x a=">" {S}?>{T}</body>',
+    "title_in_body": f'<body><div><title>{S}</title>{T}</div></body>',
+    "textarea_end_space": f'<body><textarea>{S}</textarea >{T}</body>',
+    "textarea_end_attr": f'<body><textarea>x</textarea foo>{S}</body>',
+    "textarea_nodelim": f'<body><textarea>x</textareax {S} </textarea>{T}</body>',
+    "script_in_script": f'<script>var x="{S}";</script>{T}',
+    "style_end": f'<style>a</stylex {S} </style>{T}',
+    "title_self": f'<body><title/>{S}</body>',
+    "noscript_head": f'<head><noscript>{S}</noscript></head>',
+    "svg_title": f'<body><svg><title>{S}</title></svg>{T}</body>',
+    "xmp_upper": f'<XMP>{S}</Xmp>{T}',
+    "plaintext_upper": f'<PLAINTEXT>{S}',
+    "iframe_unclosed": f'<iframe>{S}',
+    "tag_nul": f'<body><div\x00 a="{S}">{T}</body>',
+    "attr_eq_space": f'<body><div a = "{S}">{T}</body>',
+    "attr_noeq_quote": f'<body><div a "{S}">{T}</body>',
+    "script_type_dup": '<script type="text/javascript" type="application/ld+json">{"a":1}</script>',
+    "tag_slash_attr": f'<body><div/a="{S}">{T}</body>',
+    "tag_colon": f'<body><a:b c="{S}">{T}</body>',
+    "lt_bang_dash": f'<body><!-x {S} >{T}</body>',
+    "empty_comment": f'<body><!-->{S}',
+    "empty_comment2": f'<body><!--->{S}',
+    "comment_dashes": f'<body><!-- a --->{S}',
+    "script_dbl_escape": f'{L}<!--<script></script>{{"a":1}}--></script>' + T,
+    "script_escape": f'{L}<!-- </script> -->' + T,
+    "script_eof": f'{L}{{"a":1}}',
+    "script_self": f'<body><script type="application/ld+json"/>{{"a":1}}</script>{T}',
+    "style_self": f'<body><style/>{S}</body>',
+    "textarea_self": f'<body><textarea/>{S}</body>',
+    "plaintext_self": f'<body><plaintext/>{S}</body>',
+    "script_end_slash": f'{L}{{"a":1}}</script/>' + T,
+    "script_end_x": f'{L}{{"a":1}}</scriptx></script>' + T,
+    "type_entity": '<script type="application/ld&#43;json">{"a":1}</script>',
+    "type_entity2": '<script type="application/ld&plus;json">{"a":1}</script>',
+    "type_unquoted": '<script type=application/ld+json>{"a":1}</script>',
+    "type_upper_attr": '<script TYPE="APPLICATION/LD+JSON">{"a":1}</script>',
+    "template_title": f'<template><title>{S}</title></template>',
+    "nonascii_tag": f'<body><ädiv a="{S}">{T}</body>',
+    "vt_in_tag": f'<body><div\x0ba="{S}">{T}</body>',
+    "cr_in_tag": f'<body><div\ra="{S}">{T}</body>',
+    "eq_attrname": f'<body><div =a"{S}>{T}</body>',
+    "dbl": f'{L}<!--<script></script>{L}{{"a":1}}</script>-->',
+    "dbl_noesc": f'{L}<script></script>{L}{{"a":1}}</script>',
+    "esc_only": f'{L}<!--</script>{L}{{"a":1}}</script>',
+    "dbl_other_tag": f'<style><!--<style></style>{L}{{"a":1}}</script>-->',
+    "dbl_close": f'{L}<!--<script></script>--></script>{L}{{"a":1}}</script>',
+    "dbl_noend": f'{L}<!--<script>--></script>{L}{{"a":1}}</script>',
+    "dbl_nodash": f'{L}<!-<script></script>{L}{{"a":1}}</script>',
+    "dbl_later": f'{L}x<!-- y <script z></script>{L}{{"a":1}}</script>',
+    "dbl_scriptx": f'{L}<!--<scriptx></script>{L}{{"a":1}}</script>',
+    "esc_dash_end": f'{L}<!-- a --><script></script>{L}{{"a":1}}</script>',
+    "esc_dash_end2": f'{L}<!--><script></script>{L}{{"a":1}}</script>',
+    "esc_dash_end3": f'{L}<!---><script></script>{L}{{"a":1}}</script>',
+    "dbl_double_end": f'{L}<!--<script></script/>{L}{{"a":1}}</script>',
+    "dbl_end_in_comment": f'{L}<!--<script>--><script></script>{L}{{"a":1}}</script>',
+    "unq_slash": f'<body><div a=b/>{S}</body>',
+    "quoted_self": f'<body><title a="b"/>{S}</body>',
+    "lt_slash_gt": f'<body></>{S}</body>',
+    "lt_slash_eof": f'{S}</',
+    "lt_eof": f'{S}<',
+})
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_parity_with_bs4(name):
+    html = CASES[name]
+    assert parse_jsonld_blocks(html) == _parse_jsonld_blocks_bs4(html)
+    assert parse_jsonld_blocks(html.encode()) == _parse_jsonld_blocks_bs4(html)
+
+
+_NAMES = ["script", "SCRIPT", "style", "title", "textarea", "xmp", "iframe", "noembed", "noframes", "plaintext",
+          "div", "a", "svg", "template", "noscript", "scriptx", "p", "html", "body", "head"]
+_FRAGS = ["<", "</", "<!--", "-->", "--!>", "<!", "<?", ">", '"', "'", "=", " ", "/", "-", "x", "\n", "\t", "&#43;",
+          ' type="application/ld+json"', " type=application/ld+json", " type='application/ld+json'",
+          ' type="text/javascript"', " data-x=", "<!DOCTYPE html>", "<![CDATA[", "]]>", "\x0b", "\r"]
+
+
+def _random_doc(rng: random.Random) -> str:
+    out = []
+    for _ in range(rng.randint(1, 40)):
+        r = rng.random()
+        if r < 0.25:
+            out.append(rng.choice(["<", "</"]) + rng.choice(_NAMES))
+        elif r < 0.35:
+            out.append('{"a":%d}' % rng.randint(0, 99))
+        elif r < 0.45:
+            out.append('<script type="application/ld+json">{"b":%d}</script>' % rng.randint(0, 99))
+        else:
+            out.append(rng.choice(_FRAGS))
+    return "".join(out)
+
+
+def test_parity_random_docs():
+    rng = random.Random(0)
+    for _ in range(2000):
+        html = _random_doc(rng)
+        assert parse_jsonld_blocks(html) == _parse_jsonld_blocks_bs4(html), html
+
+
+@pytest.mark.parametrize("site, transform", [("realestate", realestate_au.transform), ("domain", domain_au.transform)])
+def test_transform_parity_on_listing_pages(monkeypatch, site, transform):
+    for n in range(3):
+        url = listing_url(site, f"{n + 1} Bench St Sydney NSW 2000", n)
+        html = listing_html(url, page_kb=64, images=n + 2).decode()
+        got = {}
+        for parser in ("bs4", "fast"):
+            monkeypatch.setattr(common, "JSONLD_PARSER", parser)
+            got[parser] = transform(url, html).model_dump()
+        assert got["fast"] == got["bs4"]
+        assert parse_jsonld_blocks(html) == _parse_jsonld_blocks_bs4(html)
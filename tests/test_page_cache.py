@@ -0,0 +1,51 @@
+import asyncio
+import os
+import httpx
+from app.utils import http, page_cache
+from app.utils.page_cache import PageCache
+
+
+def test_opens_disk_lazily(tmp_path):
+    root = str(tmp_path / "pages")
+    cache = PageCache(root)
+    assert not os.path.exists(root)  # tạo object (import module) không đụng đĩa
+    cache.store("https://x.test/a", b"<html>a</html>", encoding="utf-8", etag='"v1"', last_modified=None)
+    entry, body, fresh = PageCache(root).lookup("https://x.test/a")
+    assert (entry.etag, body, fresh) == ('"v1"', b"<html>a</html>", True)
+
+
+def test_get_page_revalidates_with_etag(tmp_path, monkeypatch):
+    seen = []
+
+    def _handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, content=b"<html>v1</html>", headers={"ETag": '"v1"'})
+
+    async def _no_wait(host):
+        return 0.0
+
+    cache = PageCache(str(tmp_path / "pages"))
+    monkeypatch.setattr(http, "page_cache", cache)
+    monkeypatch.setattr(http.limiter, "acquire", _no_wait)
+    monkeypatch.setattr(http, "_build_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(_handler)))
+
+    async def main():
+        client = http.Http()
+        try:
+            return [await client.get_page("https://x.test/listing") for _ in range(3)]
+        finally:
+            await client.close()
+
+    monkeypatch.setattr(page_cache, "PAGE_CACHE_FRESH_S", 3600)
+    miss, hit, _ = asyncio.run(main())
+    assert (miss.cache, hit.cache, hit.content) == ("miss", "hit", b"<html>v1</html>")
+    assert seen == [None]  # còn tươi: không gọi upstream
+
+    monkeypatch.setattr(page_cache, "PAGE_CACHE_FRESH_S", 0)
+    pages = asyncio.run(main())
+    assert [p.cache for p in pages] == ["revalidated"] * 3
+    assert all(p.content == b"<html>v1</html>" for p in pages)
+    assert seen[1:] == ['"v1"'] * 3
+    assert (cache.hits, cache.revalidated, cache.misses) == (2, 3, 1)
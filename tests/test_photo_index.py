@@ -0,0 +1,41 @@
+import numpy as np
+from app.photo_index import PhotoIndex
+
+
+def _index(n_listings: int = 40, photos: int = 5, dim: int = 64) -> tuple[PhotoIndex, dict]:
+    rng = np.random.default_rng(0)
+    idx = PhotoIndex("test-model")
+    vecs = {}
+    for i in range(n_listings):
+        listing = {"source": "domain", "listing_id": str(i), "url": f"https://domain.test/{i}", "bedrooms": 2}
+        images = [f"https://img.test/{i}/{k}.jpg" for k in range(photos)]
+        v = rng.standard_normal((photos, dim)).astype(np.float32)
+        idx.add(listing, images, v)
+        vecs[i] = (listing, images, v)
+    return idx, vecs
+
+
+def test_ann_filters_use_live_metadata():
+    idx, vecs = _index()
+    idx.build_ann(nlist=4, m=8)
+    listing, images, v = vecs[7]
+    # listing cập nhật sau khi build ANN: bedrooms 2 -> 4, ảnh giữ nguyên
+    idx.add({**listing, "bedrooms": 4}, [], np.zeros((0, v.shape[1])), keep=images)
+    for exact in (True, False):
+        hits = idx.search(v[0], 5, min_bedrooms=4, exact=exact, nprobe=4)
+        assert [h["listing_id"] for h in hits] == ["7"]
+        hits = idx.search(v[0], 5, max_bedrooms=2, exact=exact, nprobe=4)
+        assert "7" not in [h["listing_id"] for h in hits]
+
+
+def test_ann_reembedded_image_not_scored_with_stale_codes():
+    idx, vecs = _index()
+    idx.build_ann(nlist=4, m=8)
+    listing, images, v = vecs[3]
+    new = -v[0]  # vector mới của cùng ảnh, ngược hẳn vector cũ
+    idx.add(listing, images[:1], new[None], keep=images[1:])
+    assert idx.indexed_images(listing) == set(images)
+    hits = idx.search(new, 1, by_listing=False, nprobe=4)
+    assert hits[0]["image"] == images[0] and hits[0]["score"] > 0.99
+    hits = idx.search(v[0], 3, by_listing=False, nprobe=4)
+    assert images[0] not in [h["image"] for h in hits]
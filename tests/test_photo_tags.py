@@ -0,0 +1,22 @@
+import numpy as np
+from app.listing_store import ListingStore
+from app.photo_tags import listing_tags
+from app.schemas import PropertyItem
+
+
+def test_listing_tags_are_numeric_best_first():
+    probs = np.array([[0.1, 0.7, 0.2], [0.5, 0.3, 0.2]], dtype=np.float32)
+    tags = listing_tags(probs, ["kitchen", "pool", "garden"], min_score=0.3)
+    assert tags == {"pool": 0.7, "kitchen": 0.5}
+    assert list(tags) == ["pool", "kitchen"]
+    item = PropertyItem(source="domain", url="https://domain.test/1", features=tags)
+    assert item.model_dump()["features"] == {"pool": 0.7, "kitchen": 0.5}
+
+
+def test_tagged_listing_upsert_keeps_page_hash(tmp_path):
+    store = ListingStore(str(tmp_path / "listings.sqlite3"))
+    item = {"source": "domain", "listing_id": "1", "url": "https://domain.test/1", "features": {}}
+    assert store.upsert(item, "page-1")["status"] == "new"
+    tagged = {**item, "features": {"pool": 0.7}}
+    assert store.upsert(tagged)["status"] == "changed"
+    assert store.known_page("domain", "1", "page-1")["features"] == {"pool": 0.7}
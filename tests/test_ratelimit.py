@@ -0,0 +1,62 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from app.utils import ratelimit
+from app.utils.ratelimit import HostBucket, SharedState
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = _Clock()
+    # chỉ thay đồng hồ của ratelimit, không đụng time.monotonic của event loop
+    monkeypatch.setattr(ratelimit, "time", SimpleNamespace(monotonic=c, time=c))
+    return c
+
+
+def _take(b: HostBucket) -> float:
+    return asyncio.run(b._take())
+
+
+def test_bucket_burst_then_rate(clock):
+    b = HostBucket("x.test", rate=2.0, burst=2)
+    assert [_take(b), _take(b)] == [0.0, 0.0]
+    assert _take(b) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert _take(b) == 0.0
+    clock.now += 60  # nghỉ lâu cũng chỉ nạp tới burst
+    assert [_take(b), _take(b), _take(b) > 0] == [0.0, 0.0, True]
+
+
+def test_penalize_blocks_without_refill(clock):
+    b = HostBucket("x.test", rate=1.0, burst=5)
+    asyncio.run(b.penalize(10))
+    assert b.rate == 0.5
+    clock.now += 4
+    assert _take(b) == pytest.approx(6)
+    clock.now += 6
+    assert _take(b) == 0.0  # hết chặn: đúng 1 token thăm dò, không dồn burst trong 10s bị chặn
+    assert _take(b) == pytest.approx(2)  # sau đó theo rate đã giảm
+    asyncio.run(b.reward())
+    assert b.rate == pytest.approx(0.55)
+
+
+def test_sqlite_state_shared_between_workers(clock, tmp_path):
+    path = str(tmp_path / "shared" / "ratelimit.sqlite3")
+    a, b = SharedState(path), SharedState(path)  # 2 worker, 2 connection
+    assert a.take("x.test", 1.0, 2)[0] == 0.0
+    assert b.take("x.test", 1.0, 2)[0] == 0.0
+    assert a.take("x.test", 1.0, 2)[0] == pytest.approx(1.0)
+    assert b.penalize("x.test", 1.0, 2, 10) == 0.5
+    clock.now += 5
+    delay, rate = a.take("x.test", 1.0, 2)
+    assert (delay, rate) == (pytest.approx(5), 0.5)
+    clock.now += 5
+    assert [a.take("x.test", 1.0, 2)[0], b.take("x.test", 1.0, 2)[0]] == [0.0, pytest.approx(2)]
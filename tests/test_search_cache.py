@@ -0,0 +1,94 @@
+import asyncio
+import httpx
+from app import search
+from app.utils import http
+from app.search_cache import SearchCache, upstream_answered
+
+
+def _run_twice(cache: SearchCache, fn) -> int:
+    calls = []
+
+    async def _search():
+        calls.append(1)
+        return await fn()
+
+    async def main():
+        for _ in range(2):
+            await cache.get_or_search("5 Acland St St Kilda VIC 3182", 5, _search)
+    asyncio.run(main())
+    return len(calls)
+
+
+def test_empty_result_negative_cached_when_upstream_answered():
+    async def _empty():
+        return {"realestate": [], "domain": []}
+    assert _run_twice(SearchCache(path=""), _empty) == 1
+
+
+def test_empty_result_not_cached_when_upstream_unreachable():
+    async def _failed():
+        upstream_answered.set(False)
+        return {"realestate": [], "domain": []}
+    cache = SearchCache(path="")
+    assert _run_twice(cache, _failed) == 2
+    assert cache.stats()["entries"] == 0
+
+
+def test_all_html_endpoints_failing_is_not_negative_cached(monkeypatch):
+    class _DeadHttp:
+        async def _fetch(self, url, **kw):
+            raise OSError("connection refused")
+
+        async def close(self):
+            pass
+
+    monkeypatch.setattr(search, "SEARCH_BACKEND", "html")
+    monkeypatch.setattr(search, "Http", _DeadHttp)
+    monkeypatch.setattr(search, "search_cache", SearchCache(path=""))
+    report = {}
+    assert asyncio.run(search.search_address("5 Acland St St Kilda VIC 3182", 2, report=report)) == \
+        {"realestate": [], "domain": []}
+    assert report["upstream_calls"] > 0
+    assert search.search_cache.stats()["entries"] == 0
+
+
+def test_single_flight_survives_first_caller_cancel():
+    cache = SearchCache(path="")
+    calls = []
+
+    async def _slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"realestate": ["https://www.realestate.com.au/property-1"], "domain": []}
+
+    async def main():
+        first = asyncio.create_task(cache.get_or_search("1 Foo Street Bar NSW 2000", 5, _slow))
+        await asyncio.sleep(0)
+        rest = [asyncio.create_task(cache.get_or_search("1 Foo St, Bar NSW 2000", 5, _slow)) for _ in range(3)]
+        await asyncio.sleep(0)
+        first.cancel()  # client đầu bỏ đi: search upstream vẫn chạy cho các request còn lại
+        return await asyncio.gather(*rest)
+    out = asyncio.run(main())
+    assert calls == [1]
+    assert all(r["realestate"] == ["https://www.realestate.com.au/property-1"] for r in out)
+    assert cache.stats()["coalesced"] == 3
+
+
+def test_html_fallback_goes_through_http_fetch(monkeypatch):
+    seen = []
+
+    def _handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.url)
+        href = "https://www.domain.com.au/1-foo-st-bar-nsw-2000-123"
+        return httpx.Response(200, text=f'<a class="result__a" href="{href}">x</a>')
+
+    async def _no_wait(host):
+        return 0.0
+
+    # chưa mở client chung -> Http tự tạo client riêng qua _build_client
+    monkeypatch.setattr(http, "_build_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(_handler)))
+    monkeypatch.setattr(search.limiter, "acquire", _no_wait)
+    urls = asyncio.run(search._ddg_html_fallback("1 Foo St site:domain.com.au", 5))
+    assert urls == ["https://www.domain.com.au/1-foo-st-bar-nsw-2000-123"]
+    assert seen[0].host == "html.duckduckgo.com"
+    assert seen[0].params["q"] == "1 Foo St site:domain.com.au"